@@ -0,0 +1,7 @@
+"""
+Benchmarks for the recommendation pipeline.
+
+Run one with: python -m benchmarks <name> [args]
+Shared synthetic inputs live in benchmarks.synthetic, the cases in one module per
+pipeline stage.
+"""
@@ -0,0 +1,38 @@
+import sys
+from benchmarks.indexing import (bench_scoring, bench_top_k, bench_batch_scan, bench_article_dedup,
+                                 bench_article_compression)
+from benchmarks.preprocess import (bench_token_cache, bench_boilerplate, bench_tokenizer_parity, bench_two_phase,
+                                   bench_parallel_preprocess)
+from benchmarks.articles import (bench_wiki_fetch, bench_batch_fetch, bench_album_fetches, bench_response_cache,
+                                 bench_wiki_dump, bench_ingest)
+from benchmarks.harvest import bench_spotify_search, bench_novelty, bench_query_planner, bench_dedup, bench_track_storage
+
+BENCHMARKS = {
+    "scoring": bench_scoring,
+    "top_k": bench_top_k,
+    "batch_scan": bench_batch_scan,
+    "token_cache": bench_token_cache,
+    "boilerplate": bench_boilerplate,
+    "tokenizer_parity": bench_tokenizer_parity,
+    "two_phase": bench_two_phase,
+    "parallel_preprocess": bench_parallel_preprocess,
+    "wiki_fetch": bench_wiki_fetch,
+    "batch_fetch": bench_batch_fetch,
+    "album_fetches": bench_album_fetches,
+    "response_cache": bench_response_cache,
+    "wiki_dump": bench_wiki_dump,
+    "ingest": bench_ingest,
+    "spotify_search": bench_spotify_search,
+    "novelty": bench_novelty,
+    "query_planner": bench_query_planner,
+    "dedup": bench_dedup,
+    "track_storage": bench_track_storage,
+    "article_dedup": bench_article_dedup,
+    "article_compression": bench_article_compression,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python -m benchmarks <{'|'.join(BENCHMARKS)}> [args]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,199 @@
+"""Benchmarks for article ingestion: Wikipedia fetching, dumps, the response cache and songs.db writes."""
+import os
+import json
+import time
+import sqlite3
+import tempfile
+from benchmarks.synthetic import LEGACY_SONGS_SCHEMA, synthetic_rows, synthetic_tracks, synthetic_dump
+
+
+def bench_wiki_fetch(n_tracks=300, latency=0.05):
+    """Article fetch throughput against a local mock Wikipedia with injected latency."""
+    import wikipedia
+    from mock_servers import start_mock_wikipedia
+    from wiki_fetch import fetch_song_articles
+
+    tracks, pages = synthetic_tracks(int(n_tracks))
+    server, api_url = start_mock_wikipedia(pages, latency=float(latency))
+    wikipedia.wikipedia.API_URL = api_url
+    print(f"{len(tracks)} tracks, {float(latency) * 1000:.0f} ms per request")
+    print(f"{'workers':>8} {'time (s)':>10} {'tracks/sec':>11} {'stored':>7}")
+    try:
+        for workers in (1, 4, 16, 32):
+            wikipedia.search.clear_cache()
+            start = time.perf_counter()
+            stored = sum(1 for index, row in fetch_song_articles(tracks, workers=workers) if row)
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>8} {elapsed:>10.2f} {len(tracks) / elapsed:>11.1f} {stored:>7}")
+    finally:
+        server.shutdown()
+
+
+def bench_batch_fetch(n_tracks=1000, latency=0.05):
+    """Per-title vs batched (50 titles per request) article fetching against the mock Wikipedia."""
+    import wikipedia
+    from mock_servers import start_mock_wikipedia
+    from wiki_fetch import fetch_song_articles, fetch_song_articles_batched, BatchArticleFetcher
+
+    tracks, pages = synthetic_tracks(int(n_tracks))
+    # Move some song pages to "(song)" titles behind redirects, like on the real site
+    redirects = {}
+    for title in [title for title in pages if title.startswith("Track")][::4]:
+        pages[f"{title} (song)"] = pages.pop(title)
+        redirects[title] = f"{title} (song)"
+    server, api_url = start_mock_wikipedia(pages, redirects=redirects, latency=float(latency))
+    wikipedia.wikipedia.API_URL = api_url
+    print(f"{len(tracks)} tracks, {float(latency) * 1000:.0f} ms per request")
+    print(f"{'path':>22} {'time (s)':>9} {'requests':>9} {'tracks/sec':>11} {'stored':>7}")
+    try:
+        runs = [
+            ("per title, 8 threads", lambda: fetch_song_articles(tracks, workers=8)),
+            ("batched, 4 threads", lambda: fetch_song_articles_batched(tracks, fetcher=BatchArticleFetcher(workers=4, api_url=api_url))),
+        ]
+        stored_ids = []
+        for name, fetch in runs:
+            wikipedia.search.clear_cache()
+            server.request_count = 0
+            start = time.perf_counter()
+            stored = [row[0] for index, row in fetch() if row]
+            elapsed = time.perf_counter() - start
+            stored_ids.append(stored)
+            print(f"{name:>22} {elapsed:>9.2f} {server.request_count:>9} {len(tracks) / elapsed:>11.1f} {len(stored):>7}")
+        assert stored_ids[0] == stored_ids[1]
+    finally:
+        server.shutdown()
+
+
+def bench_album_fetches(n_tracks=5000, tracks_per_album=10, chunk_size=500):
+    """Title fetches per 1000 tracks: per-track album fallback vs album lookups shared across the corpus."""
+    import random
+    from mock_servers import start_mock_wikipedia
+    from songs_db import connect_songs_db
+    from wiki_fetch import fetch_song_article, fetch_song_articles_batched, BatchArticleFetcher
+
+    tracks, pages = synthetic_tracks(int(n_tracks), int(tracks_per_album))
+    # Harvest order mixes albums together, so an album's tracks land in different chunks
+    random.Random(0).shuffle(tracks)
+    server, api_url = start_mock_wikipedia(pages)
+    n_chunk = int(chunk_size)
+    print(f"{len(tracks)} tracks, {tracks_per_album} per album, chunks of {n_chunk}")
+    print(f"{'path':>28} {'fetches':>8} {'per 1000 tracks':>16} {'stored':>7}")
+    try:
+        lookups = []
+
+        def per_track(title):
+            # The per-title path's lookups, counted without the network
+            lookups.append(title)
+            return pages.get(title)
+        stored = sum(1 for track in tracks if fetch_song_article(track, per_track))
+        results = [("per track", len(lookups), stored)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, conn in (("batched, per chunk", None), ("batched, albums in songs.db", connect_songs_db(os.path.join(tmp, "songs.db")))):
+                fetcher = BatchArticleFetcher(api_url=api_url)
+                if conn is None:
+                    # Only the albums within one chunk are shared
+                    stored = sum(1 for start in range(0, len(tracks), n_chunk)
+                                 for index, row in fetch_song_articles_batched(tracks[start:start + n_chunk], fetcher=fetcher, chunk_size=n_chunk) if row)
+                else:
+                    stored = sum(1 for index, row in fetch_song_articles_batched(tracks, fetcher=fetcher, chunk_size=n_chunk, conn=conn) if row)
+                    conn.close()
+                results.append((name, fetcher.titles_fetched, stored))
+
+        for name, fetches, stored in results:
+            print(f"{name:>28} {fetches:>8} {fetches / len(tracks) * 1000:>16.0f} {stored:>7}")
+    finally:
+        server.shutdown()
+
+
+def bench_wiki_dump(n_tracks=3000, filler_pages=200_000):
+    """Pages/sec streaming a synthetic dump (plain and bz2) and the articles it finds for the catalog."""
+    from songs_db import connect_songs_db, SongWriter
+    from track_store import TrackCatalog, CATALOG_COLUMNS
+    from wiki_dump import ingest_dump
+
+    tracks, pages = synthetic_tracks(int(n_tracks))
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = TrackCatalog(os.path.join(tmp, "tracks.db"))
+        catalog.add_records(tuple(json.dumps([]) if column in ("artist_ids", "artist_names") else track.get(column)
+                                  for column in CATALOG_COLUMNS) for track in tracks)
+        results = []
+        for name in ("dump.xml", "dump.xml.bz2"):
+            path = os.path.join(tmp, name)
+            synthetic_dump(path, pages, int(filler_pages))
+            conn = connect_songs_db(os.path.join(tmp, f"songs_{name}.db"))
+            writer = SongWriter(conn, "ingest_wiki_dump")
+            n_pages, elapsed, stored = ingest_dump(path, catalog, writer)
+            conn.close()
+            results.append((name, os.path.getsize(path), n_pages, elapsed, stored))
+        catalog.close()
+
+    print()
+    print(f"{'dump':>13} {'MB':>7} {'pages':>8} {'pages/sec':>10} {'stored':>7}")
+    for name, size, n_pages, elapsed, stored in results:
+        print(f"{name:>13} {size / 1e6:>7.1f} {n_pages:>8} {n_pages / elapsed:>10.0f} {stored:>7}")
+    # fetch_song_article stores the same songs through the API: those with their own or an album page
+    print(f"expected {sum(1 for i in range(len(tracks)) if i % 3 != 2)} stored")
+
+
+def bench_response_cache(n_tracks=300, latency=0.05, workers=8):
+    """Hit rate and wall-clock time of a cold and a warm article fetch through ResponseCache."""
+    import wikipedia
+    from functools import partial
+    from mock_servers import start_mock_wikipedia
+    from response_cache import ResponseCache
+    from wiki_fetch import fetch_song_articles, get_wikipedia_article
+
+    tracks, pages = synthetic_tracks(int(n_tracks))
+    server, api_url = start_mock_wikipedia(pages, latency=float(latency))
+    wikipedia.wikipedia.API_URL = api_url
+    print(f"{len(tracks)} tracks, {float(latency) * 1000:.0f} ms per request, {workers} workers")
+    print(f"{'run':>6} {'time (s)':>9} {'requests':>9} {'hit rate':>9} {'stored':>7}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for run in ("cold", "warm"):
+                # A new cache object each time, like a new run of the script
+                cache = ResponseCache(os.path.join(tmp, "response_cache.db"))
+                fetch = partial(get_wikipedia_article, cache=cache)
+                wikipedia.search.clear_cache()
+                server.request_count = 0
+                start = time.perf_counter()
+                stored = sum(1 for index, row in fetch_song_articles(tracks, workers=int(workers), fetch=fetch) if row)
+                elapsed = time.perf_counter() - start
+                print(f"{run:>6} {elapsed:>9.2f} {server.request_count:>9} {cache.hit_rate():>9.0%} {stored:>7}")
+                cache.close()
+    finally:
+        server.shutdown()
+
+
+def bench_ingest(n_articles=10_000, batch_size=500):
+    """Rows/sec of the old commit-per-song ingest path against SongWriter."""
+    from songs_db import connect_songs_db, SongWriter
+
+    rows = list(synthetic_rows(int(n_articles)))
+    print(f"{len(rows)} synthetic articles")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # What get_wiki_articles_sql.py used to do: commit and rewrite progress.json per song
+        conn = sqlite3.connect(os.path.join(tmp, "old.db"))
+        conn.execute(LEGACY_SONGS_SCHEMA)
+        start = time.perf_counter()
+        for i, row in enumerate(rows):
+            conn.execute("INSERT OR IGNORE INTO songs (id, name, album, article) VALUES (?, ?, ?, ?)", row)
+            conn.commit()
+            with open(os.path.join(tmp, "progress.json"), 'w') as f:
+                json.dump({"current_index": i + 1, "file_num": 1}, f)
+        old_time = time.perf_counter() - start
+        conn.close()
+
+        conn = connect_songs_db(os.path.join(tmp, "new.db"))
+        writer = SongWriter(conn, "bench", int(batch_size))
+        start = time.perf_counter()
+        for i, row in enumerate(rows):
+            writer.add(row, i + 1, 1)
+        writer.flush()
+        new_time = time.perf_counter() - start
+        conn.close()
+
+    print(f"{'per-song commits':>24} {len(rows) / old_time:>10.0f} rows/sec")
+    print(f"{f'WAL, batches of {batch_size}':>24} {len(rows) / new_time:>10.0f} rows/sec")
@@ -0,0 +1,225 @@
+"""Benchmarks for harvesting tracks from Spotify search and storing them in the catalog."""
+import os
+import json
+import time
+import tempfile
+import numpy as np
+from benchmarks.synthetic import synthetic_catalog, replay_catalog, full_payload
+
+
+def _mock_spotify_client(api_prefix):
+    import spotipy
+    # Only retry 5xx inside spotipy, so 429s and their Retry-After header reach our rate limiter
+    sp_client = spotipy.Spotify(auth="mock-token", retries=0, status_retries=0, status_forcelist=(500, 502, 503, 504))
+    sp_client.prefix = api_prefix
+    return sp_client
+
+
+def bench_spotify_search(n_queries=20, latency=0.05, rate_limit=40):
+    """Page fetch throughput and 429 handling of the sequential and concurrent search paths."""
+    from mock_servers import start_mock_spotify
+    from spotify_search import TokenBucket, search_all_pages
+
+    catalog = synthetic_catalog(20_000)
+    queries = sorted({track["name"].split()[0] for track in catalog})[:int(n_queries)]
+    server, api_prefix = start_mock_spotify(catalog, latency=float(latency), rate_limit=int(rate_limit))
+    sp_client = _mock_spotify_client(api_prefix)
+
+    def search(query, limit, offset):
+        return sp_client.search(q=query, type="track", limit=limit, offset=offset)
+
+    def sequential(query):
+        # The page-by-page loop get_all_songs used to run
+        all_songs, offset = [], 0
+        while offset < 1000:
+            tracks = search(query, 50, offset)['tracks']['items']
+            all_songs.extend(tracks)
+            if len(tracks) < 50:
+                break
+            offset += 50
+        return all_songs
+
+    print(f"{len(queries)} queries, {float(latency) * 1000:.0f} ms latency, server allows {rate_limit} requests/sec")
+    print(f"{'path':>16} {'time (s)':>9} {'pages/sec':>10} {'tracks':>7} {'429s':>5}")
+    try:
+        runs = [("sequential", None, sequential)]
+        for workers in (4, 8):
+            # Budget just under the server's limit so 429s stay rare
+            bucket = TokenBucket(rate=int(rate_limit) * 0.9, capacity=workers)
+            runs.append((f"{workers} workers", bucket, lambda query, bucket=bucket, workers=workers: search_all_pages(search, query, bucket, workers=workers)[0]))
+        expected = None
+        for name, bucket, fetch in runs:
+            time.sleep(1.1)  # let the server's rate window drain between runs
+            server.page_count = server.throttled_count = 0
+            start = time.perf_counter()
+            results = [fetch(query) for query in queries]
+            elapsed = time.perf_counter() - start
+            expected = expected or results
+            assert results == expected
+            print(f"{name:>16} {elapsed:>9.2f} {server.page_count / elapsed:>10.1f} {sum(map(len, results)):>7} {server.throttled_count:>5}")
+    finally:
+        server.shutdown()
+
+
+def bench_novelty(n_tracks=30_000, min_novelty=0.1, catalog_path=None):
+    """
+    Unique tracks per API call with and without novelty-based early stopping.
+
+    Replays the tracks in catalog_path (a tracks.db) when given, otherwise a
+    synthetic catalog. The queries are the most common name words, then single
+    letters and two-word queries that mostly return tracks the word queries already
+    found, like the overlapping entries in search_queries_list.
+    """
+    from collections import Counter
+    from mock_servers import start_mock_spotify
+    from spotify_search import TokenBucket, search_all_pages, order_queries
+    from track_store import TrackCatalog
+
+    catalog = replay_catalog(catalog_path) if catalog_path else synthetic_catalog(int(n_tracks))
+    words = Counter(word for track in catalog for word in set(track["name"].lower().split()))
+    rng = np.random.default_rng(0)
+    queries = [word for word, count in words.most_common(60)]
+    queries += list("abcdefghijklmnopqrstuvwxyz")
+    queries += [" ".join(catalog[int(i)]["name"].split()[:2]) for i in rng.integers(0, len(catalog), 60)]
+
+    server, api_prefix = start_mock_spotify(catalog)
+    sp_client = _mock_spotify_client(api_prefix)
+    bucket = TokenBucket(rate=1e6, capacity=1000)
+
+    def search(query, limit, offset):
+        return sp_client.search(q=query, type="track", limit=limit, offset=offset)
+
+    def harvest(queries, min_novelty, db_path):
+        harvested = TrackCatalog(db_path)
+        server.request_count = 0
+        for query in queries:
+            tracks, stats = search_all_pages(search, query, bucket, workers=1, unseen=harvested.unseen, min_novelty=min_novelty)
+            harvested.add(harvested.unseen(tracks))
+            harvested.record_query(query, stats)
+        result = (len(harvested), server.request_count, harvested.query_stats())
+        harvested.close()
+        return result
+
+    print(f"{len(catalog)} tracks, {len(queries)} queries")
+    print(f"{'policy':>22} {'API calls':>10} {'unique':>8} {'unique/call':>12}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, threshold in (("page to the end", 0.0), (f"stop below {float(min_novelty):.0%} new", float(min_novelty))):
+                unique, calls, query_stats = harvest(queries, threshold, os.path.join(tmp, f"{threshold}.db"))
+                print(f"{name:>22} {calls:>10} {unique:>8} {unique / max(calls, 1):>12.1f}")
+
+            # A later run puts the productive queries first and skips the ones that found nothing
+            kept = order_queries(queries, query_stats, min_yield=1)
+            unique, calls, query_stats = harvest(kept, float(min_novelty), os.path.join(tmp, "reordered.db"))
+            print(f"{'reordered, pruned':>22} {calls:>10} {unique:>8} {unique / max(calls, 1):>12.1f}")
+    finally:
+        server.shutdown()
+
+
+def bench_query_planner(n_tracks=20_000, workers=4):
+    """
+    Tracks reached by broad queries with and without splitting at the offset cap.
+
+    Runs offline against the mock search server, and checks that every planned
+    query returned all its results up to the cap (only the probe page for a query
+    that was split), and only tracks matching its parent query.
+    """
+    from mock_servers import start_mock_spotify, track_matches
+    from spotify_search import TokenBucket, search_all_pages, planned_search, refine_query
+
+    catalog = synthetic_catalog(int(n_tracks))
+    queries = ["artist", "album", "bee", "artist 1"]
+    server, api_prefix = start_mock_spotify(catalog)
+    sp_client = _mock_spotify_client(api_prefix)
+    bucket = TokenBucket(rate=1e6, capacity=1000)
+
+    def search(query, limit, offset):
+        return sp_client.search(q=query, type="track", limit=limit, offset=offset)
+
+    print(f"{len(catalog)} tracks, queries: {', '.join(queries)}")
+    print(f"{'':>10} {'reachable':>10} {'found':>8} {'API calls':>10} {'sub-queries':>12}")
+    try:
+        reachable = {track["id"] for track in catalog if any(track_matches(track, query) for query in queries)}
+
+        server.request_count = 0
+        found = {track["id"] for query in queries for track in search_all_pages(search, query, bucket, workers=int(workers))[0]}
+        print(f"{'capped':>10} {len(reachable):>10} {len(found):>8} {server.request_count:>10} {len(queries):>12}")
+
+        server.request_count = 0
+        found, subqueries = set(), 0
+        for subquery, total, tracks in planned_search(search, queries, bucket, workers=int(workers)):
+            split = total > 1000 and refine_query(subquery)
+            assert len(tracks) == (min(total, 50) if split else min(total, 1000)), subquery
+            parent = next(query for query in queries if subquery == query or subquery.startswith(query + " "))
+            assert all(track_matches(track, parent) for track in tracks)
+            found.update(track["id"] for track in tracks)
+            subqueries += 1
+        print(f"{'planned':>10} {len(reachable):>10} {len(found):>8} {server.request_count:>10} {subqueries:>12}")
+    finally:
+        server.shutdown()
+
+
+def bench_dedup(total_ids=2_000_000, batch_size=1000):
+    """TrackCatalog lookup and insert rate as the catalog grows toward total_ids."""
+    from track_store import TrackCatalog
+
+    total_ids, batch_size = int(total_ids), int(batch_size)
+    rng = np.random.default_rng(0)
+    print(f"{'ids stored':>11} {'tracks/sec':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        seen = TrackCatalog(os.path.join(tmp, "tracks.db"))
+        stored = 0
+        report_every = total_ids // 5
+        start, checked = time.perf_counter(), 0
+        while stored < total_ids:
+            # Half of each batch repeats ids already stored, like overlapping search queries
+            fresh = [{"id": f"{stored + i:022d}", "name": "Track"} for i in range(batch_size // 2)]
+            repeats = [{"id": f"{int(i):022d}", "name": "Track"} for i in rng.integers(0, max(stored, 1), batch_size - len(fresh))]
+            new = seen.unseen(fresh + repeats)
+            seen.add(new)
+            stored += len(new)
+            checked += batch_size
+            if stored // report_every != (stored - len(new)) // report_every:
+                print(f"{stored:>11} {checked / (time.perf_counter() - start):>11.0f}")
+                start, checked = time.perf_counter(), 0
+        seen.close()
+
+
+def bench_track_storage(n_tracks=50_000, workers=4):
+    """Size and load time of full-payload song_titles JSON files vs the projected tracks.db catalog."""
+    from migrate_tracks import migrate
+
+    n_tracks, workers = int(n_tracks), int(workers)
+    tracks = [full_payload(track) for track in synthetic_catalog(n_tracks)]
+    with tempfile.TemporaryDirectory() as tmp:
+        per_file = -(-n_tracks // 4)
+        for file_num in range(4):
+            with open(os.path.join(tmp, f"song_titles{file_num + 1}.json"), "w") as f:
+                json.dump(tracks[file_num * per_file:(file_num + 1) * per_file], f)
+        json_bytes = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+
+        start = time.perf_counter()
+        loaded = 0
+        for file_num in range(4):
+            with open(os.path.join(tmp, f"song_titles{file_num + 1}.json")) as f:
+                loaded += len(json.load(f))
+        json_time = time.perf_counter() - start
+
+        catalog_path = os.path.join(tmp, "tracks.db")
+        start = time.perf_counter()
+        migrate(tmp, catalog_path, os.path.join(tmp, "songs.db"), workers=workers)
+        migrate_time = time.perf_counter() - start
+
+        from track_store import TrackCatalog
+        catalog = TrackCatalog(catalog_path)
+        start = time.perf_counter()
+        read = sum(1 for row in catalog.iter_tracks())
+        catalog_time = time.perf_counter() - start
+        catalog.close()
+        assert read == loaded == n_tracks
+
+        print()
+        print(f"{'':>10} {'MB':>8} {'load (s)':>9}")
+        print(f"{'JSON':>10} {json_bytes / 1e6:>8.1f} {json_time:>9.2f}")
+        print(f"{'catalog':>10} {os.path.getsize(catalog_path) / 1e6:>8.1f} {catalog_time:>9.2f}")
+        print(f"migration with {workers} workers: {migrate_time:.2f} s")
@@ -0,0 +1,252 @@
+"""
+Benchmarks for scoring and the index: query latency and memory, top-k selection,
+songs.db scans, article dedup and compression.
+
+Scoring cases run in a fresh process so peak RSS numbers don't leak between cases.
+"""
+import os
+import time
+import sqlite3
+import tempfile
+import resource
+import multiprocessing as mp
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+from scoring import build_song_index, score_query, top_k
+from songs_db import connect_songs_db, migrate_articles, load_data_in_batches
+from benchmarks.synthetic import synthetic_corpus, synthetic_songs_db
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_isolated(target, *args):
+    """Run target(*args) in a fresh process and return whatever it returns."""
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_and_report, args=(queue, target, args))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        # Most likely killed by the OOM killer, which is itself a result worth reporting
+        return None
+    return queue.get()
+
+
+def _run_and_report(queue, target, args):
+    queue.put(target(*args))
+
+
+def _scoring_case(mode, n_articles, vocab_size, repeats):
+    corpus = synthetic_corpus(n_articles, vocab_size)
+    query = synthetic_corpus(1, vocab_size, seed=1)
+    titles = [f"song {i}" for i in range(n_articles)]
+
+    if mode == "dense":
+        # What recommend_songs used to do: densify every row on every query
+        article_title_mapping = {titles[i]: corpus[i] for i in range(n_articles)}
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            similarities = cosine_similarity(query, np.vstack([vec.toarray() for vec in article_title_mapping.values()]))
+            similarities = similarities.flatten()
+    else:
+        song_index = build_song_index(titles, corpus)
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            similarities = score_query(song_index, query)
+    elapsed = (time.perf_counter() - start) / repeats
+
+    return {"latency": elapsed, "rss_before": rss_before, "rss_peak": peak_rss_mb(), "top": int(similarities.argmax())}
+
+
+def _int_list(values):
+    # Sizes come from the command line as "1000,10000"
+    return tuple(int(value) for value in values.split(",")) if isinstance(values, str) else values
+
+
+def bench_scoring(sizes=(10_000, 100_000, 1_000_000), vocab_size=20_000, dense_limit_gb=2.0, repeats=3):
+    """Query latency and peak RSS of the dense and sparse scoring paths. sizes is comma-separated on the command line."""
+    sizes, vocab_size, dense_limit_gb, repeats = _int_list(sizes), int(vocab_size), float(dense_limit_gb), int(repeats)
+    print(f"vocabulary: {vocab_size} terms, 50 terms per article")
+    print(f"{'articles':>10} {'path':>7} {'latency (s)':>12} {'rss before (MB)':>16} {'peak rss (MB)':>14}")
+    for n_articles in sizes:
+        for mode in ("dense", "sparse"):
+            dense_gb = n_articles * vocab_size * 8 / 1024**3
+            if mode == "dense" and dense_gb > dense_limit_gb:
+                print(f"{n_articles:>10} {mode:>7} {'skipped':>12}   needs a {dense_gb:.1f} GB dense matrix per query")
+                continue
+            result = run_isolated(_scoring_case, mode, n_articles, vocab_size, repeats)
+            if result is None:
+                print(f"{n_articles:>10} {mode:>7} {'killed':>12}   ran out of memory")
+                continue
+            print(f"{n_articles:>10} {mode:>7} {result['latency']:>12.4f} {result['rss_before']:>16.1f} {result['rss_peak']:>14.1f}")
+
+
+def bench_top_k(n_articles=1_000_000, ks=(10, 100, 10_000), sampled_lookups=20):
+    """Top-k selection and title lookup, old argsort + list(keys()) path against top_k. ks is comma-separated on the command line."""
+    n_articles, ks, sampled_lookups = int(n_articles), _int_list(ks), int(sampled_lookups)
+    rng = np.random.default_rng(0)
+    similarities = rng.random(n_articles)
+    titles = [f"song {i}" for i in range(n_articles)]
+    article_title_mapping = dict.fromkeys(titles)
+    song_titles = np.array(titles, dtype=object)
+
+    print(f"{n_articles} articles")
+    print(f"{'k':>7} {'old (s)':>12} {'top_k (s)':>12} {'speedup':>10}")
+    for k in ks:
+        # The old path rebuilds the key list for every result. At large k that takes
+        # hours, so time a sample of lookups and scale it up to k.
+        start = time.perf_counter()
+        top_n_indices = similarities.argsort()[-k:][::-1]
+        sort_time = time.perf_counter() - start
+        sampled = top_n_indices[:sampled_lookups]
+        start = time.perf_counter()
+        old_results = [(list(article_title_mapping.keys())[index], similarities[index]) for index in sampled]
+        lookup_time = (time.perf_counter() - start) * len(top_n_indices) / len(sampled)
+        old_time = sort_time + lookup_time
+        note = " (lookups extrapolated)" if k > sampled_lookups else ""
+
+        start = time.perf_counter()
+        indices = top_k(similarities, k)
+        new_results = list(zip(song_titles[indices], similarities[indices]))
+        new_time = time.perf_counter() - start
+
+        assert [title for title, _ in new_results[:len(old_results)]] == [title for title, _ in old_results]
+        print(f"{k:>7} {old_time:>12.4f} {new_time:>12.4f} {old_time / new_time:>9.0f}x{note}")
+
+
+def _offset_batches(db_path, batch_size=1000):
+    # The LIMIT/OFFSET reader load_data_in_batches used to be
+    conn = sqlite3.connect(db_path)
+    offset = 0
+    while True:
+        rows = conn.execute(
+            "SELECT songs.id, songs.name, articles.article FROM songs JOIN articles ON articles.id = songs.article_id "
+            f"LIMIT {batch_size} OFFSET {offset}"
+        ).fetchall()
+        if not rows:
+            break
+        yield rows
+        offset += batch_size
+    conn.close()
+
+
+def bench_batch_scan(sizes=(10_000, 20_000, 40_000, 80_000), batch_size=1000):
+    """Full-scan time of the OFFSET and keyset batch readers as the corpus grows. sizes is comma-separated on the command line."""
+    sizes, batch_size = _int_list(sizes), int(batch_size)
+    readers = {
+        "offset": lambda path: _offset_batches(path, batch_size),
+        "keyset": lambda path: load_data_in_batches(path, batch_size, as_tuples=True),
+        "keyset (pandas)": lambda path: load_data_in_batches(path, batch_size),
+    }
+    print(f"{'songs':>8} {'reader':>16} {'scan (s)':>10} {'us per song':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_songs in sizes:
+            db_path = os.path.join(tmp, f"songs{n_songs}.db")
+            synthetic_songs_db(db_path, n_songs)
+            for name, reader in readers.items():
+                start = time.perf_counter()
+                scanned = sum(len(batch) for batch in reader(db_path))
+                elapsed = time.perf_counter() - start
+                assert scanned == n_songs
+                print(f"{n_songs:>8} {name:>16} {elapsed:>10.3f} {elapsed / n_songs * 1e6:>12.2f}")
+
+
+def _song_by_song_index(db_path, batch_size=1000):
+    # How build_index used to work: every song's article preprocessed, fitted and vectorized on its own
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from tfidf_index import preprocess_batches, fit_vectorizer_streaming
+
+    batches = list(preprocess_batches(db_path, batch_size))
+    vectorizer = TfidfVectorizer(stop_words=None)
+    fit_vectorizer_streaming(vectorizer, (" ".join(tokens) for song_ids, processed_batch in batches for title, tokens in processed_batch))
+    titles, song_ids, article_vectors = [], [], []
+    for batch_ids, processed_batch in batches:
+        song_ids.extend(batch_ids)
+        titles.extend(title for title, tokens in processed_batch)
+        article_vectors.append(vectorizer.transform([" ".join(tokens) for title, tokens in processed_batch]).astype(np.float32))
+    return build_song_index(titles, sp.vstack(article_vectors, format='csr'), song_ids), vectorizer
+
+
+def bench_article_dedup(n_songs=5000, album_share=0.6, article_length=2000):
+    """songs.db size and index build time before and after articles are stored once per distinct text."""
+    import shutil
+    from tfidf_index import build_index, load_index
+
+    n_songs, album_share = int(n_songs), float(album_share)
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        synthetic_songs_db(legacy_path, n_songs, int(article_length), album_share, migrate=False)
+        legacy_bytes = os.path.getsize(legacy_path)
+
+        db_path = os.path.join(tmp, "songs.db")
+        shutil.copy(legacy_path, db_path)
+        start = time.perf_counter()
+        conn = connect_songs_db(db_path)
+        migrate_articles(conn)
+        migrate_time = time.perf_counter() - start
+        conn.execute("VACUUM")
+        (n_articles,) = conn.execute("SELECT COUNT(*) FROM articles").fetchone()
+        conn.close()
+        migrated_bytes = os.path.getsize(db_path)
+        print(f"{n_songs} songs, {n_articles} distinct articles, migrated in {migrate_time:.2f} s")
+
+        # Each build gets its own copy, so neither reuses the other's preprocessed terms
+        old_path = os.path.join(tmp, "old.db")
+        shutil.copy(db_path, old_path)
+        start = time.perf_counter()
+        old_index, old_vectorizer = _song_by_song_index(old_path)
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_index(db_path, os.path.join(tmp, "index"))
+        new_time = time.perf_counter() - start
+        new_index, new_vectorizer = load_index(os.path.join(tmp, "index"), db_path)
+
+        assert list(old_index["song_ids"]) == list(new_index["song_ids"])
+        for first in range(0, 5000, 250):
+            query = " ".join(f"word{i}" for i in range(first, first + 20))
+            old_scores = score_query(old_index, old_vectorizer.transform([query]))
+            assert np.allclose(old_scores, score_query(new_index, new_vectorizer.transform([query])), atol=1e-5)
+
+    print()
+    print(f"{'':>14} {'songs.db MB':>12} {'matrix rows':>12} {'build (s)':>10}")
+    print(f"{'per song':>14} {legacy_bytes / 1e6:>12.1f} {old_index['matrix'].shape[0]:>12} {old_time:>10.2f}")
+    print(f"{'per article':>14} {migrated_bytes / 1e6:>12.1f} {new_index['matrix'].shape[0]:>12} {new_time:>10.2f}")
+
+
+def bench_article_compression(n_songs=20_000, article_length=4000, batch_size=1000):
+    """songs.db size and scan throughput with plain, zlib and dictionary-primed zlib articles."""
+    import shutil
+    from songs_db import compress_articles, load_song_article_ids
+
+    n_songs = int(n_songs)
+    with tempfile.TemporaryDirectory() as tmp:
+        base_path = os.path.join(tmp, "base.db")
+        synthetic_songs_db(base_path, n_songs, int(article_length), chrome=True)
+        print(f"{n_songs} synthetic articles with Wikipedia page chrome")
+        print(f"{'':>12} {'MB':>8} {'full scan rows/s':>17} {'id scan rows/s':>15}")
+        for name, method, dictionary in (("plain", None, False), ("zlib", 'zlib', False), ("zlib + dict", 'zlib', True)):
+            db_path = os.path.join(tmp, f"{name}.db")
+            shutil.copy(base_path, db_path)
+            conn = connect_songs_db(db_path)
+            compress_articles(conn, method, dictionary=dictionary)
+            conn.execute("VACUUM")
+            conn.close()
+
+            # Stages like build_index's song list only need ids and titles, never article bodies
+            id_time = float('inf')
+            for repeat in range(3):
+                start = time.perf_counter()
+                song_ids, names, article_ids = load_song_article_ids(db_path)
+                id_time = min(id_time, time.perf_counter() - start)
+            start = time.perf_counter()
+            scanned = sum(len(batch) for batch in load_data_in_batches(db_path, int(batch_size), as_tuples=True))
+            full_time = time.perf_counter() - start
+            assert scanned == len(song_ids) == n_songs
+            print(f"{name:>12} {os.path.getsize(db_path) / 1e6:>8.1f} {scanned / full_time:>17.0f} {n_songs / id_time:>15.0f}")
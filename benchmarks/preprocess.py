@@ -0,0 +1,188 @@
+"""Benchmarks for article preprocessing: tokenizers, the normalization table, two-phase and parallel runs."""
+import os
+import time
+import tempfile
+import numpy as np
+from scoring import build_song_index, score_query, top_k
+from benchmarks.synthetic import sample_articles, model2_words, write_songs_db
+
+
+def bench_token_cache(db_path="songs.db", n_songs=2000):
+    """Stem+lemmatize throughput with and without the TokenNormalizer table."""
+    import nltk
+    from nltk.stem import PorterStemmer, WordNetLemmatizer
+    from nltk.corpus import wordnet
+    from preprocessing import TokenNormalizer, get_stop_words
+
+    stop_words = get_stop_words()
+    tokens = []
+    for article in sample_articles(db_path, int(n_songs)):
+        tokens.extend(word.lower() for word in nltk.word_tokenize(article) if word.lower() not in stop_words)
+    print(f"{len(tokens)} tokens, {len(set(tokens))} distinct, from {db_path}")
+
+    stemmer = PorterStemmer()
+    lemmatizer = WordNetLemmatizer()
+    start = time.perf_counter()
+    uncached = [lemmatizer.lemmatize(stemmer.stem(word), wordnet.VERB) for word in tokens]
+    uncached_time = time.perf_counter() - start
+
+    normalizer = TokenNormalizer()
+    start = time.perf_counter()
+    cached = [normalizer.normalize(word) for word in tokens]
+    cached_time = time.perf_counter() - start
+
+    assert cached == uncached
+    print(f"{'uncached':>10} {len(tokens) / uncached_time:>12.0f} tokens/sec")
+    print(f"{'cached':>10} {len(tokens) / cached_time:>12.0f} tokens/sec  (hit rate {normalizer.hits / len(tokens):.1%})")
+
+
+def bench_boilerplate(db_path="songs.db", n_songs=2000):
+    """Tokens removed by strip_boilerplate and preprocessing time with and without it."""
+    import nltk
+    from preprocessing import TokenNormalizer, process_tokens, strip_boilerplate
+
+    articles = sample_articles(db_path, int(n_songs))
+    print(f"{len(articles)} articles from {db_path}")
+
+    start = time.perf_counter()
+    stripped = [strip_boilerplate(article) for article in articles]
+    strip_time = time.perf_counter() - start
+
+    results = {}
+    for name, texts in (("raw", articles), ("stripped", stripped)):
+        # A fresh normalizer each time, so neither run starts with the other's warm table
+        normalizer = TokenNormalizer()
+        start = time.perf_counter()
+        tokens = terms = 0
+        for text in texts:
+            tokenized = nltk.word_tokenize(text)
+            tokens += len(tokenized)
+            terms += len(process_tokens(tokenized, normalizer))
+        results[name] = (tokens, terms, time.perf_counter() - start)
+
+    print(f"{'':>10} {'tokens':>10} {'terms':>10} {'time (s)':>9}")
+    for name, (tokens, terms, elapsed) in results.items():
+        print(f"{name:>10} {tokens:>10} {terms:>10} {elapsed:>9.2f}")
+    raw, clean = results["raw"], results["stripped"]
+    print(f"stripping removed {1 - clean[0] / raw[0]:.1%} of tokens and {1 - clean[1] / raw[1]:.1%} of terms,"
+          f" took {strip_time:.2f} s, pipeline {raw[2] / (clean[2] + strip_time):.2f}x faster")
+
+
+def bench_tokenizer_parity(db_path="songs.db", n_songs=2000, n_queries=50, k=10):
+    """
+    Tokens/sec of each tokenizer backend and how far the regex backend's output
+    drifts from the NLTK path, term by term and in query rankings.
+
+    The last n_queries sampled articles are held out and used as queries against an
+    index of the rest, built once per backend.
+    """
+    from collections import Counter
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from preprocessing import TOKENIZERS, TokenNormalizer, process_tokens, strip_boilerplate, tokenize
+
+    n_queries, k = int(n_queries), int(k)
+    articles = [strip_boilerplate(article) for article in sample_articles(db_path, int(n_songs))]
+    corpus, queries = articles[:-n_queries], articles[-n_queries:]
+    print(f"{len(corpus)} articles and {len(queries)} held-out queries from {db_path}")
+
+    terms = {}
+    print(f"{'tokenizer':>10} {'tokens':>10} {'tokens/sec':>12} {'pipeline (s)':>13}")
+    for tokenizer in TOKENIZERS:
+        start = time.perf_counter()
+        tokenized = [tokenize(article, tokenizer) for article in articles]
+        tokenize_time = time.perf_counter() - start
+        normalizer = TokenNormalizer()
+        terms[tokenizer] = [process_tokens(tokens, normalizer) for tokens in tokenized]
+        pipeline_time = time.perf_counter() - start
+        n_tokens = sum(len(tokens) for tokens in tokenized)
+        print(f"{tokenizer:>10} {n_tokens:>10} {n_tokens / tokenize_time:>12.0f} {pipeline_time:>13.2f}")
+
+    # Compare what actually reaches the index: the vectorizer's own analysis of the terms
+    analyze = TfidfVectorizer().build_analyzer()
+    only_nltk, only_regex = Counter(), Counter()
+    shared = identical = 0
+    for nltk_terms, regex_terms in zip(terms["nltk"], terms["regex"]):
+        nltk_features, regex_features = Counter(analyze(" ".join(nltk_terms))), Counter(analyze(" ".join(regex_terms)))
+        only_nltk.update(nltk_features - regex_features)
+        only_regex.update(regex_features - nltk_features)
+        shared += sum((nltk_features & regex_features).values())
+        identical += nltk_features == regex_features
+    print()
+    print(f"term occurrences in both: {shared / (shared + sum(only_nltk.values()) + sum(only_regex.values())):.2%},"
+          f" identical articles: {identical}/{len(articles)}")
+    print(f"most common NLTK-only terms:  {only_nltk.most_common(10)}")
+    print(f"most common regex-only terms: {only_regex.most_common(10)}")
+
+    rankings = {}
+    for tokenizer in TOKENIZERS:
+        vectorizer = TfidfVectorizer(stop_words=None)
+        vectors = vectorizer.fit_transform(" ".join(tokens) for tokens in terms[tokenizer][:len(corpus)])
+        song_index = build_song_index([f"song {i}" for i in range(len(corpus))], vectors)
+        query_vectors = vectorizer.transform(" ".join(tokens) for tokens in terms[tokenizer][len(corpus):])
+        rankings[tokenizer] = [top_k(score_query(song_index, query_vectors[i]), k) for i in range(len(queries))]
+    overlap = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(rankings["nltk"], rankings["regex"])])
+    same_top = np.mean([a[0] == b[0] for a, b in zip(rankings["nltk"], rankings["regex"])])
+    print(f"top-{k} overlap with NLTK rankings: {overlap:.1%}, same top result: {same_top:.0%}")
+
+
+def bench_two_phase(n_articles=100_000, article_length=2000, tokenizer="regex", workers=1, db_path=None, batch_size=1000):
+    """
+    build_index token by token against two-phase preprocessing, on the same songs.db.
+
+    Articles are drawn from the word stream of the scraped articles in model2.py, so
+    surface forms follow a natural frequency distribution, or sampled from db_path.
+    Both builds run the real path (one ArticlePreprocessor per build, batch_size
+    articles per batch) and must produce the same matrix.
+    """
+    import shutil
+    from preprocessing import get_normalizer
+    from tfidf_index import build_index, load_index
+
+    n_articles, workers = int(n_articles), int(workers)
+    if db_path:
+        articles = sample_articles(db_path, n_articles)
+    else:
+        words = model2_words()
+        rng = np.random.default_rng(0)
+        n_words = int(article_length) // 6
+        articles = [" ".join(rng.choice(words, n_words)) for i in range(n_articles)]
+    print(f"{len(articles)} articles, {tokenizer} tokenizer, {workers} workers, batches of {batch_size}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_path = os.path.join(tmp, "base.db")
+        write_songs_db(base_path, ((f"id{i:09d}", f"song {i}", None, article) for i, article in enumerate(articles)))
+
+        timings, matrices = {}, {}
+        for two_phase in (False, True):
+            # Each build gets its own copy and normalization table, so neither warms the other
+            db = os.path.join(tmp, f"songs_{two_phase}.db")
+            shutil.copy(base_path, db)
+            get_normalizer.cache_clear()
+            start = time.perf_counter()
+            build_index(db, os.path.join(tmp, f"index_{two_phase}"), int(batch_size), workers, tokenizer, two_phase)
+            timings[two_phase] = time.perf_counter() - start
+            matrices[two_phase] = load_index(os.path.join(tmp, f"index_{two_phase}"), db)[0]["matrix"]
+        assert matrices[True].shape == matrices[False].shape and (matrices[True] != matrices[False]).nnz == 0
+
+    print()
+    print(f"{'token by token':>16} {timings[False]:>8.2f} s")
+    print(f"{'two-phase':>16} {timings[True]:>8.2f} s  ({timings[False] / timings[True]:.2f}x, identical index)")
+
+
+def bench_parallel_preprocess(db_path="songs.db", n_songs=2000):
+    """Preprocessing throughput of preprocess_stream with 1, 2, 4 and 8 workers."""
+    from preprocessing import preprocess_stream
+
+    rows = [(f"song {i}", article) for i, article in enumerate(sample_articles(db_path, int(n_songs)))]
+    print(f"{len(rows)} articles from {db_path}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'time (s)':>10} {'articles/sec':>14} {'speedup':>9}")
+    baseline = None
+    expected = None
+    for workers in (1, 2, 4, 8):
+        start = time.perf_counter()
+        processed = list(preprocess_stream(rows, workers))
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        expected = expected or processed
+        assert processed == expected
+        print(f"{workers:>8} {elapsed:>10.2f} {len(rows) / elapsed:>14.1f} {baseline / elapsed:>8.2f}x")
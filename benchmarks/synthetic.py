@@ -0,0 +1,285 @@
+"""
+Synthetic inputs shared by the benchmarks: TF-IDF matrices, songs.db files, Wikipedia
+pages and dumps, and Spotify-shaped catalogs.
+"""
+import os
+import ast
+import bz2
+import sqlite3
+import numpy as np
+import scipy.sparse as sp
+from songs_db import connect_songs_db, migrate_articles, load_data_in_batches
+
+
+def synthetic_corpus(n_articles, vocab_size, terms_per_article=50, seed=0):
+    """Random TF-IDF-like CSR matrix with roughly terms_per_article nonzeros per row."""
+    rng = np.random.default_rng(seed)
+    nnz = n_articles * terms_per_article
+    indices = rng.integers(0, vocab_size, size=nnz, dtype=np.int32)
+    data = rng.random(nnz, dtype=np.float64)
+    indptr = np.arange(0, nnz + 1, terms_per_article, dtype=np.int64)
+    matrix = sp.csr_matrix((data, indices, indptr), shape=(n_articles, vocab_size))
+    matrix.sum_duplicates()
+    return matrix
+
+
+# Navigation and footer text the way it appears around every scraped article (see model2.py)
+WIKI_HEADER = """
+Wikipedia The Free Encyclopedia
+
+    Donate
+    Create account
+    Log in
+
+Contents
+(Top)
+Background and composition
+Release and commercial performance
+Critical reception
+Personnel
+Charts
+    See also
+    References
+
+{title}
+
+    Article
+    Talk
+
+    Read
+    Edit
+    View history
+
+Tools
+
+Appearance
+Text
+
+    Small
+    Standard
+    Large
+
+Width
+
+    Standard
+    Wide
+
+Color (beta)
+
+    Automatic
+    Light
+    Dark
+
+From Wikipedia, the free encyclopedia
+"""
+
+WIKI_FOOTER = """
+Authority control databases Edit this at Wikidata
+
+    MusicBrainz workMusicBrainz release group
+
+Categories:
+
+    {year} songs
+
+    This page was last edited on {day} January 2025, at 10:01 (UTC).
+    Text is available under the Creative Commons Attribution-ShareAlike 4.0 License; additional terms may apply. By using this site, you agree to the Terms of Use and Privacy Policy. Wikipedia® is a registered trademark of the Wikimedia Foundation, Inc., a non-profit organization.
+
+    Privacy policy
+    About Wikipedia
+    Disclaimers
+    Contact Wikipedia
+    Code of Conduct
+    Developers
+    Statistics
+    Cookie statement
+    Mobile view
+
+    Wikimedia Foundation
+    Powered by MediaWiki
+"""
+
+
+def with_chrome(title, body):
+    """Wrap a synthetic article body in Wikipedia's page chrome."""
+    return WIKI_HEADER.format(title=title) + body + WIKI_FOOTER.format(year=1960 + len(body) % 60, day=1 + len(body) % 28)
+
+
+# The original one-table schema, with each song's article text stored on its row
+LEGACY_SONGS_SCHEMA = "CREATE TABLE IF NOT EXISTS songs (id TEXT PRIMARY KEY, name TEXT, album TEXT, article TEXT)"
+
+
+def synthetic_rows(n_songs, article_length=2000, album_share=0.0, seed=0, chrome=False):
+    """
+    Yield n_songs (id, name, album, article) rows of random article text.
+
+    album_share of the songs carry their album's article (10 songs per album). With
+    chrome, articles carry Wikipedia's navigation and footer text.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f"word{i}" for i in range(5000)])
+    n_words = article_length // 8
+    album_articles = {}
+
+    def text(title, body):
+        return with_chrome(title, body) if chrome else body
+
+    for i in range(n_songs):
+        if rng.random() < album_share:
+            if i // 10 not in album_articles:
+                album_articles[i // 10] = text(f"album {i // 10}", f"album {i // 10} " + " ".join(rng.choice(words, n_words)))
+            article = album_articles[i // 10]
+        else:
+            article = text(f"song {i}", " ".join(rng.choice(words, n_words)))
+        yield f"id{i:09d}", f"song {i}", f"album {i // 10}", article
+
+
+def write_songs_db(db_path, rows, migrate=True):
+    """
+    Write (id, name, album, article) rows to a songs.db with the legacy schema.
+
+    With migrate, the database is then converted to the articles table the way the
+    ingest scripts do it.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute(LEGACY_SONGS_SCHEMA)
+    conn.executemany("INSERT INTO songs (id, name, album, article) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    if migrate:
+        conn = connect_songs_db(db_path)
+        migrate_articles(conn)
+        conn.close()
+
+
+def synthetic_songs_db(db_path, n_songs, article_length=2000, album_share=0.0, seed=0, migrate=True, chrome=False):
+    """Create a songs.db with n_songs rows from synthetic_rows."""
+    write_songs_db(db_path, synthetic_rows(n_songs, article_length, album_share, seed, chrome), migrate)
+
+
+def sample_articles(db_path, n_songs):
+    """The first n_songs articles in songs.db at db_path."""
+    articles = []
+    for batch in load_data_in_batches(db_path, as_tuples=True):
+        articles.extend(article for song_id, name, article in batch)
+        if len(articles) >= n_songs:
+            break
+    return articles[:n_songs]
+
+
+def model2_words():
+    """
+    The word stream of the scraped article in model2.py, boilerplate stripped, so
+    articles drawn from it follow a natural frequency distribution of surface forms.
+    """
+    from preprocessing import strip_boilerplate
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model2.py")) as f:
+        source = ast.parse(f.read())
+    sample = next(node.value.value for node in ast.walk(source)
+                  if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "my_article")
+    return np.array(strip_boilerplate(sample).split())
+
+
+def synthetic_tracks(n_tracks, tracks_per_album=5):
+    """
+    Catalog tracks (as TrackCatalog returns them) plus Wikipedia pages for them: a third of the songs have
+    their own page, a third only have an album page and the rest are singles with neither.
+    """
+    tracks, pages = [], {}
+    for i in range(n_tracks):
+        name, album_id = f"Track {i}", f"album{i // tracks_per_album:06d}"
+        album = f"Album {i // tracks_per_album}"
+        if i % 3 == 0:
+            pages[name] = f"{name} is a song from {album}. " * 20
+        elif i % 3 == 1:
+            pages[album] = f"{album} is an album. Its lead song is {name}. " * 20
+        else:
+            album_id, album = f"single{i:06d}", f"Single {i}"
+        tracks.append({"id": f"track{i:06d}", "name": name, "album_id": album_id, "album_name": album})
+    return tracks, pages
+
+
+def synthetic_dump(path, pages, filler_pages=100_000):
+    """
+    Write a pages-articles style XML dump holding pages (title to plain text) as wikitext,
+    among filler_pages unrelated articles, redirects and talk pages.
+    """
+    from xml.sax.saxutils import escape
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        f.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10">\n')
+
+        def page(title, text, ns=0, redirect=None):
+            redirect_tag = f'<redirect title="{escape(redirect)}" />' if redirect else ""
+            f.write(f"<page><title>{escape(title)}</title><ns>{ns}</ns><id>0</id>{redirect_tag}"
+                    f"<revision><id>0</id><text>{escape(text)}</text></revision></page>\n")
+
+        # Song pages are spread through the filler, marked up like real articles
+        titles = iter(pages.items())
+        spacing = max(filler_pages // max(len(pages), 1), 1)
+        for i in range(filler_pages):
+            if i % spacing == 0:
+                title, text = next(titles, (None, None))
+                if title is not None:
+                    page(title, "{{Infobox song|name=" + title + "}}\n" + text.replace(". ", ".<ref>cite</ref> [[Music|music]] ", 1))
+            if i % 50 == 0:
+                page(f"Talk:Topic {i}", "Discussion", ns=1)
+            elif i % 50 == 1:
+                page(f"Redirect {i}", "#REDIRECT [[Topic]]", redirect="Topic")
+            else:
+                page(f"Topic {i}", f"'''Topic {i}''' is a [[subject]] of general interest. " * 20)
+        for title, text in titles:
+            page(title, text)
+        f.write("</mediawiki>\n")
+
+
+def synthetic_catalog(n_tracks, seed=0):
+    """Spotify-shaped tracks with random two-word names, for the mock search server."""
+    rng = np.random.default_rng(seed)
+    words = [f"{a}{b}" for a in "bcdfghjklmnprstvwz" for b in ("ay", "ee", "oo", "ia", "um")]
+    genres = ["pop", "rock", "hip-hop", "rap", "country", "jazz", "electronic", "indie"]
+    catalog = []
+    for i in range(n_tracks):
+        name = " ".join(rng.choice(words, 2))
+        album_num = i // 10
+        catalog.append({
+            "id": f"track{i:08d}",
+            "name": name,
+            "album": {"id": f"album{album_num:07d}", "name": f"Album {album_num}", "release_date": f"{1960 + int(rng.integers(0, 65))}-01-01"},
+            "artists": [{"id": f"artist{i % 997:04d}", "name": f"Artist {i % 997}", "genres": [genres[i % 997 % len(genres)]]}],
+            "popularity": int(rng.integers(0, 100)),
+            "duration_ms": int(rng.integers(90_000, 400_000)),
+        })
+    return catalog
+
+
+def replay_catalog(catalog_path):
+    """Turn the tracks in a tracks.db catalog back into Spotify-shaped tracks for the mock search server."""
+    from track_store import TrackCatalog
+    catalog = TrackCatalog(catalog_path)
+    tracks = [{
+        "id": track["id"],
+        "name": track["name"],
+        "album": {"id": track["album_id"], "name": track["album_name"] or "", "release_date": track["release_date"]},
+        "artists": [{"id": artist_id, "name": name} for artist_id, name in zip(track["artist_ids"], track["artist_names"])],
+        "popularity": track["popularity"],
+        "duration_ms": track["duration_ms"],
+    } for rowid, track in catalog.iter_tracks()]
+    catalog.close()
+    return tracks
+
+
+def full_payload(track):
+    """Pad a synthetic_catalog track out to the size of a real Spotify search result."""
+    markets = [f"{a}{b}" for a in "ABCDEFGHIJKLMNOP" for b in "ABCDEFGHIJKL"][:185]
+    album = dict(track["album"], album_type="album", total_tracks=12, available_markets=markets,
+                 release_date_precision="day", type="album", uri=f"spotify:album:{track['album']['id']}",
+                 href=f"https://api.spotify.com/v1/albums/{track['album']['id']}",
+                 external_urls={"spotify": f"https://open.spotify.com/album/{track['album']['id']}"},
+                 images=[{"height": size, "width": size, "url": f"https://i.scdn.co/image/{track['album']['id']}{size}"} for size in (640, 300, 64)],
+                 artists=track["artists"])
+    return dict(track, album=album, available_markets=markets, disc_number=1, track_number=1, explicit=False,
+                is_local=False, preview_url=None, type="track", uri=f"spotify:track:{track['id']}",
+                href=f"https://api.spotify.com/v1/tracks/{track['id']}",
+                external_ids={"isrc": f"US{track['id'][-10:]}"},
+                external_urls={"spotify": f"https://open.spotify.com/track/{track['id']}"})
@@ -0,0 +1,32 @@
+import os
+import argparse
+from preprocessing import TOKENIZERS, download_nltk_data, get_normalizer
+from tfidf_index import build_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the TF-IDF song index from songs.db.")
+    parser.add_argument("tokenizer", nargs="?", default="nltk", choices=TOKENIZERS, help="tokenizer to preprocess articles with")
+    args = parser.parse_args()
+
+    # Only fetches resources that aren't installed yet, so a warm rebuild stays offline
+    download_nltk_data()
+
+    # Start from the token normalization table saved by the last build, if there is one
+    token_cache_path = "token_cache.json"
+    normalizer = get_normalizer()
+    if os.path.exists(token_cache_path):
+        normalizer.load(token_cache_path)
+
+    build_index("songs.db", "songs_index", workers=os.cpu_count(), tokenizer=args.tokenizer)
+
+    # Words normalized by worker processes are merged into this table as the build goes
+    lookups = normalizer.hits + normalizer.misses
+    print(f"Token cache: {len(normalizer.table)} words, {normalizer.hits / max(lookups, 1):.0%} of lookups hit")
+    normalizer.save(token_cache_path)
+
+
+# Worker processes import this module too (under the spawn and forkserver start
+# methods), and must not start builds of their own
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import sys
+from songs_db import connect_songs_db, migrate_articles, compress_articles
+
+# Usage: python compress_articles.py [zlib|zlib-nodict|plain]
+# Articles written afterwards (by any ingestion script) use the same setting.
+mode = sys.argv[1] if len(sys.argv) > 1 else 'zlib'
+
+db_path = 'songs.db'
+before = os.path.getsize(db_path)
+conn = connect_songs_db(db_path)
+migrate_articles(conn)
+compress_articles(conn, method=None if mode == 'plain' else 'zlib', dictionary=mode == 'zlib')
+# Rewritten rows leave free pages behind; VACUUM hands them back to the file system
+conn.execute("VACUUM")
+conn.close()
+print(f"songs.db: {before / 1e6:.1f} MB -> {os.path.getsize(db_path) / 1e6:.1f} MB")
@@ -1,43 +1,44 @@
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+import sys
 import json
-import time
 import spotify_authentication
 import search_queries_list
+from track_store import TrackCatalog
+from response_cache import ResponseCache, DAY
+from spotify_search import TokenBucket, search_all_pages, planned_search, order_queries
 
 # Initialize Spotify client with authentication
 sp = spotify_authentication.get_spotify_client()
 songs = []
 search_queries = search_queries_list.search_queries
-file_num = 0
 
-def get_all_songs(search):
-    # Initialize a list to store all songs
-    all_songs = []
-    
-    # Set the search query to find tracks
-    limit = 50  # Number of tracks per request
-    offset = 0  # Start with the first page
-    max_offset = 1000  # Maximum allowed offset in one request
-    
-    while offset < max_offset:
-        # Fetch search results
-        results = sp.search(q=search, type="track", limit=limit, offset=offset)
-        
-        # Get the tracks from the results
-        tracks = results['tracks']['items']
-        
-        # Add the tracks to the all_songs list
-        all_songs.extend(tracks)
-        
-        # If there are no more results, break the loop
-        if len(tracks) < limit:
-            break
-        
-        # Otherwise, increase the offset to get the next page
-        offset += limit
-    
-    return all_songs
+# Every search request goes through one shared rate limiter
+rate_limiter = TokenBucket(rate=10, capacity=10)
+
+# Search pages are cached for a day, so a rerun after a crash doesn't pay for them again
+cache = ResponseCache('response_cache.db')
+SEARCH_TTL = DAY
+
+def search_tracks(query, limit, offset):
+    key = f"{query}\0{limit}\0{offset}"
+    cached = cache.get('spotify.search', key)
+    if cached is not None:
+        return cached[1]
+    results = sp.search(q=query, type="track", limit=limit, offset=offset)
+    cache.put('spotify.search', key, results, SEARCH_TTL)
+    return results
+
+# Stop a query once two pages in a row are less than 10% new tracks
+min_novelty = 0.1
+# Skip queries that returned less than one new track per page last time
+min_query_yield = 1
+
+def get_all_songs(search, unseen=None):
+    # Fetch the pages of results concurrently, stopping at the first short page (or the
+    # first run of pages that are mostly tracks we already have). Returns (tracks, stats)
+    return search_all_pages(search_tracks, search, rate_limiter, limit=50, max_offset=1000, workers=4,
+                            unseen=unseen, min_novelty=min_novelty)
 
 def increment_char(char):
     ascii_value = ord(char)
@@ -48,37 +49,60 @@ def alphabet_search():
     # Fetching all songs
     query = "A"
     print("Query: "+query)
-    songs = get_all_songs(query)
+    songs, stats = get_all_songs(query)
     for i in range(25):
         query = increment_char(query)
         print("Query: "+query)
-        songs.extend(get_all_songs(query))
+        songs.extend(get_all_songs(query)[0])
         
-    song_titles = set([track['name'] for track in songs])  # Get unique titles
-    unique_songs = [track for track in songs if track['name'] in song_titles]
+    # Queries overlap, so keep each track once
+    unique_songs = list({track['id']: track for track in songs}.values())
 
     with open('song_titles.json', 'w') as f:
-        json.dump(songs, f)
+        json.dump(unique_songs, f)
 
 def search_query_search():
-    global file_num
-    for i in range(start, len(search_queries)):
-        query = search_queries[i]
-        print("Query: " + query)
-        songs = get_all_songs(query)
-        with open('song_titles'+str(file_num)+'.json', 'r') as f:
-            try:
-                existing_songs = json.load(f)
-            except json.JSONDecodeError:
-                existing_songs = []
-        existing_songs.extend(songs)
-        with open('song_titles'+str(file_num)+'.json', 'w') as f:
-            json.dump(existing_songs, f)
-        with open('song_titles_progress.json', 'w') as f:
-            json.dump("i: "+ str(i) + " File: " + str(file_num), f)
-        if i%100 == 0:
-            file_num += 1
+    # Tracks are projected down to the fields we use and stored in the tracks.db catalog.
+    # Queries overlap heavily, so only tracks no earlier query returned are added
+    catalog = TrackCatalog('tracks.db')
+    try:
+        # Queries never run come first, then the rest by how many new tracks they found
+        # per page last time; ones that found almost nothing new are skipped
+        queries = order_queries(search_queries[start:], catalog.query_stats(), min_yield=min_query_yield)
+        print(f"{len(queries)} of {len(search_queries) - start} queries worth running")
+        for i, query in enumerate(queries):
+            print("Query: " + query)
+            songs, stats = get_all_songs(query, unseen=catalog.unseen)
+            new_songs = catalog.unseen(songs)
+            if songs:
+                print(f"{len(new_songs)} new of {len(songs)} tracks ({1 - len(new_songs) / len(songs):.0%} duplicates)"
+                      f" from {stats['pages']} pages{', stopped early' if stats['stopped_early'] else ''}")
+            # Committed before this query is recorded as done, so the stats the next run
+            # orders by always describe what is in the catalog
+            catalog.add(new_songs)
+            catalog.record_query(query, stats)
+            with open('song_titles_progress.json', 'w') as f:
+                json.dump(f"{i + 1} of {len(queries)} done, last: {query}", f)
+    finally:
+        catalog.close()
+
+def planned_query_search(queries):
+    # Broad queries are split by year (then genre) until each fits under Spotify's
+    # offset cap, instead of hand-writing narrower entries in search_queries_list
+    catalog = TrackCatalog('tracks.db')
+    try:
+        for query, total, songs in planned_search(search_tracks, queries, rate_limiter, workers=4):
+            new_songs = catalog.unseen(songs)
+            print(f"Query: {query} ({total} results, {len(new_songs)} new)")
+            catalog.add(new_songs)
+    finally:
+        catalog.close()
 
+# Usage: python get_song_titles.py [planned]
+# "planned" splits each query at Spotify's offset cap (planned_query_search) instead of
+# walking search_queries_list one hand-written query at a time
 start = 1112
-file_num = 11
-search_query_search()
\ No newline at end of file
+if len(sys.argv) > 1 and sys.argv[1] == 'planned':
+    planned_query_search(search_queries[start:])
+else:
+    search_query_search()
@@ -1,21 +1,12 @@
 import json
-import sqlite3
-import time
-import wikipedia
+from response_cache import ResponseCache
+from songs_db import connect_songs_db
+import wiki_fetch
 
 songs = []
 file_num = 1
-conn = sqlite3.connect('songs.db')
-cursor = conn.cursor()
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS songs (
-    id TEXT PRIMARY KEY,
-    name TEXT,
-    album TEXT,
-    article TEXT
-)
-''')
-conn.commit()
+conn = connect_songs_db('songs.db')
+cache = ResponseCache('response_cache.db')
 
 
 
@@ -41,12 +32,10 @@ def save_progress(current_index):
         json.dump({"current_index": current_index}, f)
 
 def get_wikipedia_article(song_title):
-    try:
-        page = wikipedia.page(song_title)
-        return page.content
-    except Exception as e:
+    article = wiki_fetch.get_wikipedia_article(song_title, cache)
+    if article is None:
         print("No article :(")
-        return None
+    return article
 
 def get_articles(start_index=0):
     song_info = {}
@@ -1,83 +1,67 @@
-import json
 import sqlite3
-import time
-import wikipedia
+from itertools import islice
+from songs_db import connect_songs_db, migrate_articles, load_ingest_progress, SongWriter
+from track_store import TrackCatalog
+from response_cache import ResponseCache
+from wiki_fetch import fetch_song_articles_batched, BatchArticleFetcher, ArticleLookupError
 
-conn = sqlite3.connect('songs.db')
-cursor = conn.cursor()
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS songs (
-    id TEXT PRIMARY KEY,
-    name TEXT,
-    album TEXT,
-    article TEXT
-)
-''')
-conn.commit()
+conn = connect_songs_db('songs.db')
+# A songs.db from before the articles table is converted before anything is written
+migrate_articles(conn)
+writer = SongWriter(conn, 'get_wiki_articles_sql', batch_size=500)
+# Lookups (including misses) are remembered across runs
+cache = ResponseCache('response_cache.db')
+# Titles are looked up 50 per request, a few requests at a time
+fetcher = BatchArticleFetcher(workers=4, cache=cache)
 
 
-def load_songs(file_num):
-    print(f"Loading file: {file_num}")
-    try:
-        with open('song_titles'+str(file_num)+'.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("song_titles"+str(file_num)+".json not found.")
-        return []
-
 def load_progress():
-    try:
-        with open('progress.json', 'r') as f:
-            progress = json.load(f)
-        return (progress.get("current_index", 0), progress.get("file_num", 1))
-    except FileNotFoundError:
-        return (0, 1)  # If no progress file exists, start from the beginning
-
-def save_progress(current_index, current_file):
-    with open('progress.json', 'w') as f:
-        json.dump({"current_index": current_index, "file_num": current_file}, f)
+    # Progress is the rowid of the last catalog track handled, saved in songs.db next
+    # to the rows it covers. file_num 0 marks a catalog cursor; anything else is
+    # progress through the old song_titles files that migrate_tracks.py hasn't converted
+    progress = load_ingest_progress(conn, 'get_wiki_articles_sql')
+    if progress is None:
+        return 0
+    current_index, file_num = progress
+    if file_num != 0:
+        raise SystemExit("Progress still points into the song_titles files; run migrate_tracks.py first.")
+    return current_index
 
-def get_wikipedia_article(song_title):
+def get_articles(after_rowid=0, batch_size=1000):
+    catalog = TrackCatalog('tracks.db')
+    tracks = catalog.iter_tracks(after_rowid, batch_size)
     try:
-        page = wikipedia.page(song_title)
-        return page.content
-    except Exception as e:
-        return None
-
-def get_articles(start_index=0, start_file=1):   
-    for j in range(start_file, 12):
-        file_num = j
-        songs = load_songs(file_num)
-        for i in range(start_index, len(songs)):
-            song = songs[i]
-            name = song['name']
-            album = song['album']['name']
-            identification = song['id']
-
-            article = get_wikipedia_article(name)
-            if not article:
-                article = get_wikipedia_article(album)
-                if not article:
-                    save_progress(i+1, file_num)
-                    continue
-            
-            if (name not in article and album not in article) or ("song" not in article):
-                save_progress(i+1, file_num)
-                continue
-
-            try:
-                cursor.execute('''
-                INSERT OR IGNORE INTO songs (id, name, album, article) VALUES (?, ?, ?, ?)
-                ''', (identification, name, album, article))
-                conn.commit()
-            except sqlite3.Error as e:
-                print(f"Database error: {e}")
-            save_progress(i+1, file_num)
-        start_index = 0
-
-# Load songs and progress
-(start_index, start_file) = load_progress()  # Get the index to start from
+        while True:
+            batch = list(islice(tracks, batch_size))
+            if not batch:
+                break
+            rowids = [rowid for rowid, track in batch]
+            songs = [track for rowid, track in batch]
+            # Lookups run concurrently but come back in order, so the writer is the only
+            # thing touching songs.db and progress always points just past the last stored song.
+            # Album lookups are kept in songs.db, so each album is fetched once per corpus
+            for i, row in fetch_song_articles_batched(songs, 0, fetcher, chunk_size=batch_size, conn=conn):
+                writer.add(row, rowids[i], 0)
+            writer.flush()
+    finally:
+        catalog.close()
 
-get_articles(start_index=start_index, start_file = start_file)
+# Load progress
+after_rowid = load_progress()  # Get the catalog position to start from
 
-conn.close()
\ No newline at end of file
+try:
+    get_articles(after_rowid=after_rowid)
+except KeyboardInterrupt:
+    # Whatever was fetched before an interrupt is still worth keeping
+    writer.flush()
+except ArticleLookupError as e:
+    # Wikipedia kept failing: keep the songs before the failed one, and start from it next run
+    writer.flush()
+    print(f"Stopping: {e}")
+except sqlite3.Error as e:
+    # Rows still queued are left unwritten; progress points at the last batch that was
+    print(f"Database error: {e}")
+finally:
+    conn.close()
+    print(f"Response cache hit rate: {cache.hit_rate():.0%}")
+    cache.close()
@@ -0,0 +1,23 @@
+import sys
+import sqlite3
+from songs_db import connect_songs_db, migrate_articles, SongWriter
+from track_store import TrackCatalog
+from wiki_dump import ingest_dump
+
+# Usage: python ingest_wiki_dump.py enwiki-latest-pages-articles.xml.bz2
+dump_path = sys.argv[1]
+
+conn = connect_songs_db('songs.db')
+migrate_articles(conn)
+writer = SongWriter(conn, 'ingest_wiki_dump', batch_size=500)
+catalog = TrackCatalog('tracks.db')
+
+try:
+    ingest_dump(dump_path, catalog, writer)
+except KeyboardInterrupt:
+    writer.flush()
+except sqlite3.Error as e:
+    print(f"Database error: {e}")
+finally:
+    conn.close()
+    catalog.close()
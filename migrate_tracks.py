@@ -0,0 +1,108 @@
+"""
+One-time conversion of the harvested song_titles*.json and .jsonl files into the
+tracks.db catalog.
+
+Files are parsed and projected in parallel and inserted in harvest order, so catalog
+rowids follow the order get_wiki_articles_sql.py used to walk the files in. Its saved
+progress through the files is converted to the matching catalog position.
+"""
+import os
+import re
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from songs_db import connect_songs_db, migrate_articles, load_ingest_progress
+from track_store import TrackCatalog, project_track
+
+
+def list_track_files(directory='.'):
+    """Return [(file_num, path)] for every song_titles file, numbered files in order and song_titles.json last."""
+    pattern = re.compile(r"^song_titles(\d*)\.jsonl?$")
+    files = []
+    for filename in os.listdir(directory):
+        match = pattern.match(filename)
+        if match:
+            # song_titles.json (the alphabet search) was never ingested, so it goes after everything else
+            file_num = int(match.group(1)) if match.group(1) else float('inf')
+            files.append((file_num, os.path.join(directory, filename)))
+    return sorted(files)
+
+
+def iter_jsonl(path):
+    """Lazily yield the tracks in a song_titles*.jsonl file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave the last line half-written; everything before it is intact
+                continue
+
+
+def project_file(path):
+    """Project every track in a song_titles*.json or .jsonl file."""
+    if path.endswith('.jsonl'):
+        return [project_track(track) for track in iter_jsonl(path)]
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            tracks = json.load(f)
+        except json.JSONDecodeError:
+            tracks = []
+    return [project_track(track) for track in tracks]
+
+
+def load_file_progress(conn):
+    """Return get_wiki_articles_sql's (current_index, file_num) through the song_titles files, or None."""
+    progress = load_ingest_progress(conn, 'get_wiki_articles_sql')
+    if progress:
+        return None if progress[1] == 0 else progress
+    try:
+        with open('progress.json', 'r') as f:
+            progress = json.load(f)
+        return (progress.get("current_index", 0), progress.get("file_num", 1))
+    except FileNotFoundError:
+        return None
+
+
+def migrate(directory='.', catalog_path='tracks.db', songs_db_path='songs.db', workers=None):
+    files = list_track_files(directory)
+    catalog = TrackCatalog(catalog_path)
+    conn = connect_songs_db(songs_db_path)
+    migrate_articles(conn)
+    progress = load_file_progress(conn)
+    cursor = None
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        # map yields results in file order while later files are still being parsed
+        for (file_num, path), records in zip(files, pool.map(project_file, [path for file_num, path in files])):
+            print(f"{path}: {len(records)} tracks")
+            if progress and file_num == progress[1]:
+                # Split the file where ingestion stopped and remember the catalog position there
+                catalog.add_records(records[:progress[0]])
+                cursor = catalog.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM tracks").fetchone()[0]
+                records = records[progress[0]:]
+            catalog.add_records(records)
+            if progress and file_num < progress[1]:
+                cursor = catalog.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM tracks").fetchone()[0]
+    elapsed = time.time() - start
+
+    if cursor is not None:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_progress (name, current_index, file_num) VALUES (?, ?, ?)",
+                ('get_wiki_articles_sql', cursor, 0),
+            )
+        print(f"get_wiki_articles_sql will resume after catalog row {cursor}")
+
+    n_tracks = len(catalog)
+    # Closing the last connection checkpoints the WAL, so the file size below is the whole catalog
+    catalog.close()
+    conn.close()
+    input_bytes = sum(os.path.getsize(path) for file_num, path in files)
+    print(f"{n_tracks} tracks from {len(files)} files in {elapsed:.1f} seconds")
+    print(f"{input_bytes / 1e6:.1f} MB of JSON -> {os.path.getsize(catalog_path) / 1e6:.1f} MB catalog")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,259 @@
+"""
+Local stand-ins for the web APIs the ingestion scripts talk to, for offline testing
+and benchmarks. Each server runs in a background thread; call server.shutdown() when done.
+"""
+import json
+import time
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def _split_values(value):
+    # MediaWiki's multi-value parameters: "|"-separated, or "\x1f"-separated when they start with it
+    if value.startswith('\x1f'):
+        return value[1:].split('\x1f')
+    return value.split('|')
+
+
+def _normalize_title(title):
+    # MediaWiki titles use spaces and always start with a capital letter
+    title = title.replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+
+class MockWikipediaHandler(BaseHTTPRequestHandler):
+    """Answers the subset of the MediaWiki query API used by the wikipedia package and wiki_fetch."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            lagged = server.maxlag_every and server.request_count % server.maxlag_every == 0
+        time.sleep(server.latency)
+
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query, keep_blank_values=True).items()}
+        headers = {}
+        if lagged and 'maxlag' in params:
+            # What MediaWiki sends while its replicas are lagging
+            response = {"error": {"code": "maxlag", "info": "Waiting for a database server: 6 seconds lagged."}}
+            headers["Retry-After"] = "0"
+        elif params.get('list') == 'search':
+            response = self.search(params['srsearch'])
+        elif 'titles' in params and len(_split_values(params['titles'])) > 50:
+            response = {"error": {"code": "toomanyvalues", "info": "Too many values supplied for parameter \"titles\". The limit is 50."}}
+        elif 'titles' in params:
+            response = self.query_titles(_split_values(params['titles']), _split_values(params.get('prop', '')), params)
+        else:
+            response = {"error": {"code": "badparams", "info": "Unsupported request"}}
+
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def search(self, query):
+        title = _normalize_title(query)
+        title = self.server.redirects.get(title, title)
+        results = [{"title": title}] if title in self.server.pages else []
+        return {"query": {"search": results}}
+
+    def query_titles(self, titles, props, params):
+        server = self.server
+        query = {"pages": {}}
+        normalized, redirects = [], []
+        # Whole-page extracts come one per response; intros up to 20
+        extract_limit = 20 if 'exintro' in params else 1
+        extract_offset = int(params.get('excontinue', 0))
+        extracts = 0
+        for title in titles:
+            if any(char in title for char in '|[]{}<>#'):
+                # Characters MediaWiki doesn't allow in titles
+                query["pages"][str(-1 - len(query["pages"]))] = {"title": title, "invalidreason": "illegal characters", "invalid": ""}
+                continue
+            normalized_title = _normalize_title(title)
+            if normalized_title != title:
+                normalized.append({"from": title, "to": normalized_title})
+            target = normalized_title
+            if normalized_title in server.redirects:
+                target = server.redirects[normalized_title]
+                redirects.append({"from": normalized_title, "to": target})
+
+            if target not in server.pages:
+                query["pages"][str(-1 - len(query["pages"]))] = {"ns": 0, "title": target, "missing": ""}
+                continue
+
+            pageid = server.page_ids[target]
+            page = {"pageid": pageid, "ns": 0, "title": target}
+            if 'info' in props:
+                page["fullurl"] = f"https://en.wikipedia.org/wiki/{target.replace(' ', '_')}"
+            if 'pageprops' in props and target in server.disambiguations:
+                page["pageprops"] = {"disambiguation": ""}
+            if 'extracts' in props:
+                if extract_offset <= extracts < extract_offset + extract_limit:
+                    page["extract"] = server.pages[target]
+                extracts += 1
+            if 'revisions' in props:
+                if 'content' in params.get('rvprop', '').split('|'):
+                    page["revisions"] = [{"slots": {"main": {"contentmodel": "wikitext", "*": server.pages[target]}}}]
+                elif 'rvparse' in params:
+                    links = "".join(f"<li><a>{option}</a></li>" for option in server.disambiguations.get(target, []))
+                    page["revisions"] = [{"*": f"<ul>{links}</ul>"}]
+                else:
+                    page["revisions"] = [{"revid": pageid, "parentid": 0}]
+            query["pages"][str(pageid)] = page
+
+        if normalized:
+            query["normalized"] = normalized
+        if redirects:
+            query["redirects"] = redirects
+        if 'extracts' in props and extracts > extract_offset + extract_limit:
+            return {"continue": {"excontinue": extract_offset + extract_limit, "continue": "||"}, "query": query}
+        return {"batchcomplete": "", "query": query}
+
+
+def start_mock_wikipedia(pages, redirects=None, disambiguations=None, latency=0.0, maxlag_every=0):
+    """
+    Serve a fake Wikipedia on localhost.
+
+    Args:
+        pages (dict): Page title to plain-text content.
+        redirects (dict, optional): Redirect title to target title.
+        disambiguations (dict, optional): Disambiguation page title to the titles it lists.
+            These titles must also be in pages.
+        latency (float): Seconds to wait before answering each request.
+        maxlag_every (int): Answer every nth request that sends maxlag with a maxlag
+            error, as Wikipedia does under replication lag. 0 never does.
+
+    Returns:
+        (server, api_url): Call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockWikipediaHandler)
+    server.daemon_threads = True
+    server.pages = pages
+    server.page_ids = {title: index + 1 for index, title in enumerate(pages)}
+    server.redirects = redirects or {}
+    server.disambiguations = disambiguations or {}
+    server.latency = latency
+    server.maxlag_every = maxlag_every
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/w/api.php"
+
+
+def track_matches(track, query):
+    """
+    Loose stand-in for Spotify's matching: every query word appears in the track, album
+    or artist name. year:YYYY and year:YYYY-YYYY filter on the album's release year,
+    and genre:name on the genres listed on the track's artists.
+    """
+    text = " ".join([track['name'], track['album']['name'], *(artist['name'] for artist in track.get('artists', []))]).lower()
+    for word in query.lower().split():
+        field, _, value = word.partition(':')
+        if field == 'year' and value:
+            first, _, last = value.partition('-')
+            year = (track['album'].get('release_date') or '')[:4]
+            if not year.isdigit() or not int(first) <= int(year) <= int(last or first):
+                return False
+        elif field == 'genre' and value:
+            if not any(value.strip('"') in artist.get('genres', []) for artist in track.get('artists', [])):
+                return False
+        elif word not in text:
+            return False
+    return True
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    """Answers GET /v1/search?type=track like the Spotify Web API, including 429s when rate limited."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        with server.lock:
+            server.request_count += 1
+            now = time.monotonic()
+            while server.recent and server.recent[0] <= now - 1:
+                server.recent.popleft()
+            throttled = server.rate_limit is not None and len(server.recent) >= server.rate_limit
+            if throttled:
+                server.throttled_count += 1
+            else:
+                server.recent.append(now)
+
+        if throttled:
+            self.send_json(429, {"error": {"status": 429, "message": "API rate limit exceeded"}}, {"Retry-After": str(server.retry_after)})
+            return
+
+        time.sleep(server.latency)
+        if url.path != '/v1/search':
+            self.send_json(404, {"error": {"status": 404, "message": "Not found"}})
+            return
+
+        limit, offset = int(params.get('limit', 10)), int(params.get('offset', 0))
+        if offset > server.max_offset or limit > 50:
+            self.send_json(400, {"error": {"status": 400, "message": "Invalid limit or offset"}})
+            return
+
+        query = params.get('q', '')
+        with server.lock:
+            if query not in server.matches:
+                server.matches[query] = [track for track in server.catalog if track_matches(track, query)]
+            matches = server.matches[query]
+            server.page_count += 1
+        items = matches[offset:offset + limit]
+        self.send_json(200, {"tracks": {"href": self.path, "items": items, "limit": limit, "offset": offset, "total": len(matches)}})
+
+    def send_json(self, status, response, headers=None):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_mock_spotify(catalog, latency=0.0, rate_limit=None, retry_after=1, max_offset=1000):
+    """
+    Serve a fake Spotify search API on localhost.
+
+    Args:
+        catalog (list): Spotify-shaped track dicts to search over.
+        latency (float): Seconds to wait before answering each request.
+        rate_limit (int, optional): Requests allowed per second before answering 429.
+        retry_after (int): Retry-After value sent with each 429.
+        max_offset (int): Largest offset the API will page to.
+
+    Returns:
+        (server, api_prefix): api_prefix can be used as a spotipy client's prefix.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockSpotifyHandler)
+    server.daemon_threads = True
+    server.catalog = catalog
+    server.matches = {}
+    server.latency = latency
+    server.rate_limit = rate_limit
+    server.retry_after = retry_after
+    server.max_offset = max_offset
+    server.recent = deque()
+    server.request_count = 0
+    server.page_count = 0
+    server.throttled_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/"
@@ -1,122 +1,35 @@
-import sqlite3
-import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
-import nltk
-import string
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
-from nltk.corpus import wordnet
-from nltk.stem import WordNetLemmatizer
 import time
-from sklearn.metrics.pairwise import cosine_similarity
-
-nltk.download('stopwords')
-nltk.download('punkt')
-
-stop_words = set(stopwords.words('english'))
-
-# Step 1: Load Data from SQL Database in Chunks
-def load_data_in_batches(db_path, batch_size=1000):
-    """Load data from the SQL database in batches."""
-    conn = sqlite3.connect(db_path)
-    query = "SELECT name, article FROM songs"
-    offset = 0
-    while True:
-        batch_query = f"{query} LIMIT {batch_size} OFFSET {offset}"
-        batch_data = pd.read_sql_query(batch_query, conn)
-        if batch_data.empty:
-            break
-        yield batch_data  # This will yield a batch of songs as a DataFrame
-        offset += batch_size
-    conn.close()
-
-def preprocess_data(data):
-    """
-    Tokenize the data, remove stop words, punctuation, apply stemming and lemmatization.
-    """
-    tokenized_data = []
-    
-    print("Tokenizing data...")
-    start = time.time()
-    for index, row in data.iterrows():
-        title, article = row['name'], row['article']
-        tokenized_article = nltk.word_tokenize(article)
-        tokenized_data.append([title, tokenized_article])
-        
-        if index % 100 == 0:
-            print(f"Tokenization has been running for: {time.time() - start} seconds")
-            print(f"{index / len(data) * 100}% complete")
-            print()
-            
-    # Process each song's title and article
-    processed_data = []
-    stemmer = PorterStemmer()
-    lemmatizer = WordNetLemmatizer()
-    
-    print("Filtering, stemming, and lemmatizing data")
-    start = time.time()
-    for index, (title, article_tokens) in enumerate(tokenized_data):
-        # Filter out stop words and punctuation
-        filtered_article = [word.lower() for word in article_tokens if word.lower() not in stop_words and word not in string.punctuation]
-        
-        # Apply stemming and lemmatization
-        stemmed_article = [stemmer.stem(word) for word in filtered_article]
-        lemmatized_article = [lemmatizer.lemmatize(word, wordnet.VERB) for word in stemmed_article]
-        
-        processed_data.append([title, lemmatized_article])
-        
-        if index % 100 == 0:
-            print(f"Processing for {time.time() - start} seconds")
-            print(f"{index / len(tokenized_data) * 100}% complete")
-            print()
-
-    print("Data preprocessed!")
-    return processed_data
-
-def preprocess_article(article):
-    """
-    Tokenize, remove stop words, punctuation, apply stemming and lemmatization to a single article.
-    """
-    # Tokenize the article
-    tokenized_article = nltk.word_tokenize(article)
+import tempfile
+from preprocessing import download_nltk_data, preprocess_article
+from scoring import build_song_index, score_query, top_k
+from songs_db import count_batches
+from tfidf_index import fit_vectorizer_streaming, spill_batches, read_spilled_batches, preprocess_batches
 
-    # Filter out stop words and punctuation
-    filtered_article = [word.lower() for word in tokenized_article if word.lower() not in stop_words and word not in string.punctuation]
+download_nltk_data()
 
-    # Apply stemming and lemmatization
-    stemmer = PorterStemmer()
-    stemmed_article = [stemmer.stem(word) for word in filtered_article]
-    lemmatizer = WordNetLemmatizer()
-    lemmatized_article = [lemmatizer.lemmatize(word, wordnet.VERB) for word in stemmed_article]
-
-    return lemmatized_article
-
-def vectorize_data(data, vectorizer):    
+def vectorize_data(data, vectorizer, song_ids=None):
+    """Vectorize a batch with the vectorizer fitted over the whole database."""
     titles = [item[0] for item in data]
     article_texts = [" ".join(item[1]) for item in data]
     
-    article_vectors = vectorizer.fit_transform(article_texts)
+    article_vectors = vectorizer.transform(article_texts)
     
-    article_title_mapping = {titles[i]: article_vectors[i] for i in range(len(titles))}
-    return article_title_mapping
+    return build_song_index(titles, article_vectors, song_ids)
 
-def recommend_songs(user_article, article_title_mapping, vectorizer, top_n=10000):
+def recommend_songs(user_article, song_index, vectorizer, top_n=10000):
     # Convert the user's article into a vector
     user_article = " ".join(user_article)
     user_vector = vectorizer.transform([user_article])
     
     # Compute cosine similarities between the user's vector and all article vectors
-    similarities = cosine_similarity(user_vector, np.vstack([vec.toarray() for vec in article_title_mapping.values()]))
-    
-    # Flatten the similarity matrix to make it easier to work with
-    similarities = similarities.flatten()
+    similarities = score_query(song_index, user_vector)
     
     # Get the indices of the top N most similar songs
-    top_n_indices = similarities.argsort()[-top_n:][::-1]
+    top_n_indices = top_k(similarities, top_n)
     
     # Get the song titles and their similarity scores
-    recommended_songs_with_scores = [(list(article_title_mapping.keys())[index], similarities[index]) for index in top_n_indices]
+    recommended_songs_with_scores = zip(song_index["titles"][top_n_indices], similarities[top_n_indices])
     
     # Create a dictionary to hold the songs grouped by similarity score
     grouped_by_similarity = {}
@@ -7020,21 +6933,29 @@ Categories:
 top_n = 5000  # Number of top recommendations to keep
 final_top_songs = []
 
-# Process the data in batches and update recommendations incrementally
-print("Recommending songs incrementally...")
-start = time.time()
-for index, batch_data in enumerate(load_data_in_batches(db_path)):
-    processed_batch = preprocess_data(batch_data)
-    vectorized_batch = vectorize_data(processed_batch, vectorizer)
-    
-    recommended_songs = recommend_songs(preprocess_article(my_article), vectorized_batch, vectorizer, top_n=top_n)
-    
-    # Maintain the top_n songs by combining and sorting
-    final_top_songs.extend(recommended_songs)
-    final_top_songs = sorted(final_top_songs, key=lambda x: x[1], reverse=True)[:top_n]
+with tempfile.TemporaryFile() as spill_file:
+    # Pass 1: preprocess every batch once, collect document frequencies over the whole
+    # database and spill the processed batches to disk so memory stays bounded by the batch size
+    print("Building the TF-IDF vocabulary...")
+    batches = spill_batches(preprocess_batches(db_path, progress_every=100), spill_file)
+    fit_vectorizer_streaming(vectorizer, (" ".join(tokens) for song_ids, processed_batch in batches for title, tokens in processed_batch))
     
-    print(f"{time.time() - start} seconds. Batch #{index} out of {sum(1 for _ in load_data_in_batches(db_path))}")
-    print()
+    # Pass 2: every batch goes through the same fixed transform, so scores are comparable across batches
+    print("Recommending songs incrementally...")
+    user_article = preprocess_article(my_article)
+    n_batches = count_batches(db_path)
+    start = time.time()
+    for index, (song_ids, processed_batch) in enumerate(read_spilled_batches(spill_file)):
+        vectorized_batch = vectorize_data(processed_batch, vectorizer, song_ids)
+        
+        recommended_songs = recommend_songs(user_article, vectorized_batch, vectorizer, top_n=top_n)
+        
+        # Maintain the top_n songs by combining and sorting
+        final_top_songs.extend(recommended_songs)
+        final_top_songs = sorted(final_top_songs, key=lambda x: x[1], reverse=True)[:top_n]
+        
+        print(f"{time.time() - start} seconds. Batch #{index} out of {n_batches}")
+        print()
 
 print("Final recommended songs:")
 for index, (song, score) in enumerate(final_top_songs):
@@ -0,0 +1,532 @@
+import os
+import re
+import json
+import hashlib
+import nltk
+import string
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import chain, islice, repeat
+import numpy as np
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+from nltk.corpus import wordnet
+from nltk.stem import WordNetLemmatizer
+
+
+# Bump whenever a change to this module changes the terms it produces, so stored
+# results from the old pipeline aren't reused
+PREPROCESSING_VERSION = 3
+
+# Page chrome of scraped Wikipedia articles. Everything up to the tagline is the
+# header (navigation, table of contents, appearance controls), and everything from
+# the first footer line on is categories, authority control and legal text
+TAGLINE = "From Wikipedia, the free encyclopedia"
+HEADER_SEARCH_LINES = 200
+FOOTER_START = re.compile(r"^(?:This page was last edited on|Authority control databases|Categories:$|Retrieved from \"https?://)")
+# Navboxes start with a "vte" line and come after the reference sections
+NAVBOX_START = re.compile(r"^(?:vte|v\s*·?\s*t\s*·?\s*e)$")
+REFERENCE_HEADINGS = frozenset(("References", "Notes", "Sources", "Bibliography", "Further reading", "External links"))
+CHROME_LINE = re.compile(
+    r"^(?:Jump to content|Main menu|Featured article|Good article|This is a good article\..*|Listen to this article.*"
+    r"|This audio file was created from a revision of this article.*|\(Audio help · More spoken articles\)"
+    r"|This article is about .*For other uses, see .*|\[edit\]|Edit this at Wikidata)$"
+)
+# Citation boilerplate repeated in every reference
+DATE = r"(?:[A-Z][a-z]+ \d{1,2}, \d{4}|\d{1,2} [A-Z][a-z]+ \d{4}|\d{4}-\d{2}-\d{2})"
+CITATION = re.compile(rf"\b(?:Archived from the original on|Retrieved) {DATE}\.?")
+
+TOKENIZERS = ("nltk", "regex")
+# TfidfVectorizer's default token_pattern: anything else the NLTK tokenizer emits
+# (punctuation, "'s", "n't", single letters) never reaches the index anyway
+TOKEN_PATTERN = re.compile(r"\b\w\w+\b")
+
+
+# NLTK resources the pipeline needs, and where nltk.data finds them once installed
+NLTK_RESOURCES = {"stopwords": "corpora/stopwords", "punkt": "tokenizers/punkt", "wordnet": "corpora/wordnet"}
+
+
+def download_nltk_data():
+    """Download the NLTK resources the preprocessing pipeline needs, skipping any already installed."""
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(name)
+
+
+def strip_boilerplate(article):
+    """
+    Remove Wikipedia page chrome from a scraped article before it is tokenized.
+
+    Drops the header up to "From Wikipedia, the free encyclopedia", everything from
+    the categories and "This page was last edited" footer on, navboxes after the
+    references, hatnotes and article badges, and the archive/retrieval dates of
+    citations. Several scraped pages joined together (like the query in model2.py)
+    each keep their text: a footer only runs until the next page's tagline. Articles
+    without chrome (from the API or a dump) pass through unchanged.
+    """
+    lines = article.splitlines()
+    # Everything before the first tagline is header, if it's near the top
+    skipping = any(line.strip() == TAGLINE for line in lines[:HEADER_SEARCH_LINES])
+
+    kept = []
+    in_references = in_navbox = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped == TAGLINE:
+            # The text of a page starts here
+            skipping = in_references = in_navbox = False
+            continue
+        if skipping:
+            continue
+        if FOOTER_START.match(stripped):
+            skipping = True
+            continue
+        if stripped in REFERENCE_HEADINGS:
+            in_references = True
+        if in_references and NAVBOX_START.match(stripped):
+            in_navbox = True
+        if in_navbox or CHROME_LINE.match(stripped):
+            continue
+        kept.append(CITATION.sub("", line))
+    return "\n".join(kept)
+
+
+@lru_cache(maxsize=None)
+def get_stop_words():
+    return frozenset(stopwords.words('english'))
+
+
+def preprocessing_fingerprint(tokenizer="nltk"):
+    """
+    Short hash of everything that determines preprocessing output.
+
+    Reads NLTK's stop word list, so it needs download_nltk_data to have run, but
+    doesn't load the tokenizer, stemmer or lemmatizer.
+    """
+    config = {
+        "version": PREPROCESSING_VERSION,
+        "nltk_version": nltk.__version__,
+        "stop_words": sorted(get_stop_words()),
+        "tokenizer": tokenizer,
+    }
+    return hashlib.sha256(json.dumps(config).encode('utf-8')).hexdigest()[:16]
+
+
+class TokenNormalizer:
+    """
+    Table mapping a raw lowercased token to its stemmed and lemmatized term.
+
+    Word frequencies follow Zipf's law, so nearly every token has been seen before
+    and stemming/lemmatizing it again is wasted work. The table is bounded to
+    max_size entries with least-recently-used eviction and can be saved to disk
+    so later runs start warm.
+    """
+
+    def __init__(self, max_size=500_000, path=None):
+        self.stemmer = PorterStemmer()
+        self.lemmatizer = WordNetLemmatizer()
+        self.max_size = max_size
+        self.path = path
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def normalize(self, word):
+        """Return the final term for a lowercased token."""
+        term = self.lookup(word)
+        if term is None:
+            term = self.lemmatizer.lemmatize(self.stemmer.stem(word), wordnet.VERB)
+            self.add(word, term)
+        return term
+
+    def lookup(self, word):
+        """Return the term in the table for word, or None if it hasn't been normalized yet."""
+        term = self.table.get(word)
+        if term is None:
+            self.misses += 1
+            return None
+        self.table.move_to_end(word)
+        self.hits += 1
+        return term
+
+    def add(self, word, term):
+        """Record a term normalized elsewhere, e.g. by a worker process."""
+        self.table[word] = term
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+
+    def load(self, path):
+        """Fill the table from a file written by save. Tables from another NLTK version are ignored."""
+        with open(path, 'r') as f:
+            saved = json.load(f)
+        if saved.get("nltk_version") != nltk.__version__:
+            return
+        # Entries are saved least recently used first, so keep the tail if the table shrank
+        terms = list(saved["terms"].items())[-self.max_size:]
+        self.table.update(terms)
+
+    def save(self, path=None):
+        path = path or self.path
+        with open(path, 'w') as f:
+            json.dump({"nltk_version": nltk.__version__, "terms": self.table}, f)
+
+
+@lru_cache(maxsize=None)
+def get_normalizer():
+    """Normalizer shared by everything in this process."""
+    return TokenNormalizer()
+
+
+def filter_tokens(tokens):
+    """Lowercase tokens and drop stop words and punctuation, leaving the surface forms to normalize."""
+    stop_words = get_stop_words()
+    return [word.lower() for word in tokens if word.lower() not in stop_words and word not in string.punctuation]
+
+
+def process_tokens(tokens, normalizer=None):
+    """Filter out stop words and punctuation, then stem and lemmatize what's left."""
+    normalize = (normalizer or get_normalizer()).normalize
+
+    # Filter out stop words and punctuation, then map each word to its stemmed and lemmatized term
+    return [normalize(word) for word in filter_tokens(tokens)]
+
+
+def regex_tokenize(article):
+    """
+    Tokenize with one compiled regex, keeping only what process_tokens and the
+    vectorizer would keep: lowercased words of two or more characters that aren't
+    stop words.
+
+    Several times faster than nltk.word_tokenize, at the cost of small differences:
+    hyphenated words are split before stemming instead of after, and contractions
+    lose their clitic instead of keeping it as a separate token.
+    """
+    stop_words = get_stop_words()
+    return [word for word in TOKEN_PATTERN.findall(article.lower()) if word not in stop_words]
+
+
+def tokenize(article, tokenizer="nltk"):
+    """Split an article into tokens with one of TOKENIZERS."""
+    if tokenizer == "nltk":
+        return nltk.word_tokenize(article)
+    if tokenizer == "regex":
+        return regex_tokenize(article)
+    raise ValueError(f"Unknown tokenizer {tokenizer!r}, expected one of {TOKENIZERS}")
+
+
+def _preprocess_chunk(chunk, tokenizer="nltk"):
+    # Runs in a worker process: tokenize and normalize one article at a time, so the
+    # chunk is never held both as raw tokens and as processed terms
+    return [[title, process_tokens(tokenize(strip_boilerplate(article), tokenizer))] for title, article in chunk]
+
+
+def preprocess_stream(rows, workers=None, chunk_size=50, tokenizer="nltk", pool=None):
+    """
+    Preprocess (title, article) pairs across a pool of worker processes.
+
+    Rows are sent to the workers in chunks of chunk_size, and at most two chunks per
+    worker are in flight, so memory stays bounded however long rows is. Results are
+    yielded as [title, terms] in the same order as rows.
+
+    Args:
+        rows (iterable): (title, article) pairs.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        chunk_size (int): Number of articles sent to a worker at a time.
+        tokenizer (str): One of TOKENIZERS.
+        pool (ProcessPoolExecutor, optional): Pool of workers processes to use instead
+            of starting one for this call.
+    """
+    workers = workers or os.cpu_count()
+    rows = iter(rows)
+    with nullcontext(pool) if pool is not None else ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_preprocess_chunk, chunk, tokenizer))
+            if not pending:
+                break
+            yield from pending.popleft().result()
+
+
+def _tokenize_chunk(articles, tokenizer="nltk"):
+    # Runs in a worker process: phase one of preprocess_two_phase for a chunk of articles
+    return [tokenize(strip_boilerplate(article), tokenizer) for article in articles]
+
+
+def _normalize_words(words):
+    # Runs in a worker process: stem and lemmatize words the parent's table doesn't have
+    normalize = get_normalizer().normalize
+    return [normalize(word) for word in words]
+
+
+def normalize_forms(forms, normalizer=None, pool=None, workers=1):
+    """
+    Return the term for each surface form, or None for stop words and punctuation.
+
+    normalizer (get_normalizer() by default) is always the table consulted. With a pool,
+    the words missing from it are stemmed and lemmatized by the workers and their
+    terms are added to it, so the parent's table, and a token cache saved from it,
+    warms up even though the work happens in other processes.
+    """
+    normalizer = normalizer or get_normalizer()
+    words = [next(iter(filter_tokens([form])), None) for form in forms]
+    if not pool:
+        return [None if word is None else normalizer.normalize(word) for word in words]
+
+    terms, unknown = {}, []
+    for word in words:
+        if word is not None and word not in terms:
+            term = normalizer.lookup(word)
+            terms[word] = term
+            if term is None:
+                unknown.append(word)
+    if unknown:
+        # Bigger chunks than for articles: each word is far cheaper than an article
+        chunk_size = max(1000, -(-len(unknown) // (4 * workers)))
+        chunks = [unknown[i:i + chunk_size] for i in range(0, len(unknown), chunk_size)]
+        for word, term in zip(unknown, chain.from_iterable(pool.map(_normalize_words, chunks))):
+            normalizer.add(word, term)
+            terms[word] = term
+    return [None if word is None else terms[word] for word in words]
+
+
+def preprocess_two_phase(rows, workers=1, chunk_size=50, tokenizer="nltk", normalizer=None):
+    """
+    Preprocess (title, article) pairs a vocabulary at a time instead of a token at a time.
+
+    Phase one tokenizes every article and maps each raw token to an integer id.
+    Phase two filters, stems and lemmatizes each distinct token once, giving a lookup
+    array from token id to term id (-1 for stop words and punctuation), and every
+    document is rewritten through it with numpy indexing. With workers > 1 both
+    phases are spread over a pool of processes. This is one ArticlePreprocessor.encode
+    call; an index build keeps the preprocessor, and its tables, for every batch.
+
+    Returns:
+        (vocabulary, documents): vocabulary is an array of terms, and documents is a
+            list of (title, term_ids) in the order of rows, where term_ids is an int32
+            array of positions in vocabulary.
+    """
+    with ArticlePreprocessor(workers, tokenizer, chunk_size=chunk_size, normalizer=normalizer) as preprocessor:
+        documents = preprocessor.encode(rows)
+        return preprocessor.vocabulary(), documents
+
+
+class _SurfaceTable(dict):
+    # Surface form to id. A form seen for the first time gets the next id and is queued
+    # in new; forms already in the table are looked up without leaving C
+    def __init__(self):
+        super().__init__()
+        self.new = []
+
+    def __missing__(self, form):
+        self[form] = surface_id = len(self)
+        self.new.append(form)
+        return surface_id
+
+
+def _append(array, length, values):
+    # Write values after array[:length], doubling the array when it's full
+    needed = length + len(values)
+    if needed > len(array):
+        grown = np.empty(max(needed, 2 * len(array)), dtype=array.dtype)
+        grown[:length] = array[:length]
+        array = grown
+    array[length:needed] = np.asarray(values, dtype=array.dtype)
+    return array
+
+
+class ArticlePreprocessor:
+    """
+    Preprocesses batch after batch of articles on one pool of worker processes.
+
+    preprocess_data starts and stops a pool on every call, and an index build makes
+    one call per batch. A build holds one of these instead: with workers > 1 the
+    pool is started once and every batch reuses it. The two-phase tables (surface
+    form to id, id to term) also last for the whole build, so a word is filtered,
+    stemmed and lemmatized once per build rather than once per batch, and later
+    batches mostly consist of forms already seen. Use it as a context manager so
+    the pool is shut down.
+
+    Args:
+        workers (int): Spread the work over this many processes when greater than 1.
+        tokenizer (str): One of TOKENIZERS.
+        two_phase (bool): Normalize each distinct word once instead of token by token.
+            The output is the same.
+        chunk_size (int): Number of articles sent to a worker at a time.
+        normalizer (TokenNormalizer, optional): Table every normalized word ends up in,
+            get_normalizer() by default. Token by token with workers > 1, each worker
+            keeps its own table instead.
+    """
+
+    def __init__(self, workers=1, tokenizer="nltk", two_phase=True, chunk_size=50, normalizer=None):
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"Unknown tokenizer {tokenizer!r}, expected one of {TOKENIZERS}")
+        self.workers = workers
+        self.tokenizer = tokenizer
+        self.two_phase = two_phase
+        self.chunk_size = chunk_size
+        self.normalizer = normalizer or get_normalizer()
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.surface_ids = _SurfaceTable()
+        # Surface id to term id (-1 for stop words and punctuation), and term id to term
+        self.lookup = np.empty(1024, dtype=np.int32)
+        self.term_ids = {}
+        self.terms = np.empty(1024, dtype=object)
+
+    def vocabulary(self):
+        """Return the array of terms that encode's term ids point into."""
+        return self.terms[:len(self.term_ids)]
+
+    def encode(self, rows):
+        """
+        Return (title, term_ids) for each (title, article) in rows, where term_ids is
+        an int32 array of positions in vocabulary().
+        """
+        titles, articles = [], []
+        for title, article in rows:
+            titles.append(title)
+            articles.append(article)
+
+        if self.pool:
+            chunks = [articles[i:i + self.chunk_size] for i in range(0, len(articles), self.chunk_size)]
+            token_lists = chain.from_iterable(self.pool.map(_tokenize_chunk, chunks, repeat(self.tokenizer)))
+        else:
+            token_lists = (_tokenize_chunk([article], self.tokenizer)[0] for article in articles)
+        known_forms = len(self.surface_ids)
+        surface_documents = [np.fromiter(map(self.surface_ids.__getitem__, tokens), dtype=np.int32, count=len(tokens)) for tokens in token_lists]
+
+        # Only forms no earlier batch had are normalized
+        new_forms, self.surface_ids.new = self.surface_ids.new, []
+        if new_forms:
+            known_terms = len(self.term_ids)
+            new_ids, new_terms = [], []
+            for term in normalize_forms(new_forms, self.normalizer, self.pool, self.workers):
+                if term is None:
+                    new_ids.append(-1)
+                    continue
+                # Several surface forms usually share a term ("Sing", "sings", "singing")
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    term_id = self.term_ids[term] = len(self.term_ids)
+                    new_terms.append(term)
+                new_ids.append(term_id)
+            self.lookup = _append(self.lookup, known_forms, new_ids)
+            self.terms = _append(self.terms, known_terms, new_terms)
+
+        lookup = self.lookup[:len(self.surface_ids)]
+        documents = []
+        for title, ids in zip(titles, surface_documents):
+            ids = lookup[ids]
+            documents.append((title, ids[ids >= 0]))
+        return documents
+
+    def preprocess(self, rows):
+        """Return [title, terms] for each (title, article) in rows, like preprocess_data."""
+        if self.two_phase:
+            documents = self.encode(rows)
+            terms = self.vocabulary()
+            return [[title, terms[term_ids].tolist()] for title, term_ids in documents]
+        if self.pool:
+            return list(preprocess_stream(rows, self.workers, self.chunk_size, self.tokenizer, pool=self.pool))
+        return [[title, process_tokens(tokenize(strip_boilerplate(article), self.tokenizer), self.normalizer)] for title, article in rows]
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def preprocess_data(data, progress_every=1000, workers=1, tokenizer="nltk", two_phase=False):
+    """
+    Strip page chrome, tokenize the data, remove stop words, punctuation, apply stemming and lemmatization.
+
+    Args:
+        data (pandas.DataFrame): Songs with 'name' and 'article' columns.
+        progress_every (int): Print progress every this many songs.
+        workers (int): Spread the work over this many processes when greater than 1.
+        tokenizer (str): One of TOKENIZERS.
+        two_phase (bool): Normalize each distinct word once with preprocess_two_phase
+            instead of token by token. The output is the same.
+    """
+    if two_phase:
+        print("Preprocessing data in two phases...")
+        vocabulary, documents = preprocess_two_phase(zip(data['name'], data['article']), workers, tokenizer=tokenizer)
+        print(f"Data preprocessed! {len(vocabulary)} distinct terms")
+        return [[title, vocabulary[term_ids].tolist()] for title, term_ids in documents]
+
+    if workers > 1:
+        processed_data = []
+        print(f"Preprocessing data with {workers} workers...")
+        start = time.time()
+        for index, item in enumerate(preprocess_stream(zip(data['name'], data['article']), workers, tokenizer=tokenizer)):
+            processed_data.append(item)
+
+            if index % progress_every == 0:
+                print(f"Preprocessing has been running for: {time.time() - start} seconds")
+                print(f"{index / len(data) * 100}% complete")
+                print()
+
+        print("Data preprocessed!")
+        return processed_data
+
+    tokenized_data = []
+
+    print("Tokenizing data...")
+    # Tokenize titles and articles
+    start = time.time()
+    for index, row in data.iterrows():
+        title, article = row['name'], row['article']
+        tokenized_article = tokenize(strip_boilerplate(article), tokenizer)
+        tokenized_data.append([title, tokenized_article])
+
+        if index % progress_every == 0:
+            print(f"Tokenization has been running for: {time.time() - start} seconds")
+            print(f"{index / len(data) * 100}% complete")
+            print()
+
+    # Process each song's title and article
+    processed_data = []
+    normalizer = get_normalizer()
+
+    print("Filtering, stemming, and lemmatizing data")
+    start = time.time()
+    for index, (title, article_tokens) in enumerate(tokenized_data):
+        processed_data.append([title, process_tokens(article_tokens, normalizer)])
+
+        if index % progress_every == 0:
+            print(f"Processing for {time.time() - start} seconds")
+            print(f"{index / len(tokenized_data) * 100}% complete")
+            print()
+
+    print("Data preprocessed!")
+    return processed_data
+
+
+def preprocess_article(article, tokenizer="nltk"):
+    """
+    Tokenize, remove stop words, punctuation, apply stemming and lemmatization to a single article.
+
+    Page chrome is stripped first, the same way it is for the articles in the index.
+
+    Args:
+        article (str): The article to be preprocessed.
+        tokenizer (str): One of TOKENIZERS; use the one the index was built with.
+    """
+    tokenized_article = tokenize(strip_boilerplate(article), tokenizer)
+    return process_tokens(tokenized_article)
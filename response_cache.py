@@ -0,0 +1,117 @@
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+
+DAY = 24 * 60 * 60
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of API responses, shared by the ingestion scripts.
+
+    Entries are keyed by a hash of (namespace, key), so any request that can be
+    written as a string can be cached. Besides normal responses it remembers
+    negative results (a missing page, a disambiguation page) so known misses aren't
+    looked up again on every run. Every entry expires after its own TTL, and once
+    the cache grows past max_bytes the least recently used entries are evicted.
+
+    One instance can be shared by threads.
+    """
+
+    def __init__(self, path='response_cache.db', max_bytes=2 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            key BLOB PRIMARY KEY,
+            kind TEXT,
+            value BLOB,
+            size INTEGER,
+            expires_at REAL,
+            accessed_at REAL
+        )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def _key(namespace, key):
+        return hashlib.sha256(f"{namespace}\0{key}".encode('utf-8')).digest()
+
+    def get(self, namespace, key):
+        """
+        Look up a response.
+
+        Returns:
+            (kind, value) for a live entry, where value is None for negative entries,
+            or None if there is no entry or it has expired.
+        """
+        digest = self._key(namespace, key)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT kind, value, expires_at FROM responses WHERE key = ?", (digest,)).fetchone()
+            if row is None or row[2] < now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.conn:
+                self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, digest))
+        kind, value, expires_at = row
+        return kind, None if value is None else json.loads(zlib.decompress(value))
+
+    def put(self, namespace, key, value, ttl, kind='hit'):
+        """
+        Store a response for ttl seconds.
+
+        Args:
+            value: Anything JSON-serializable, or None for a negative entry.
+            kind (str): 'hit' for a real response, or why there is none (e.g. 'missing').
+        """
+        digest = self._key(namespace, key)
+        blob = None if value is None else zlib.compress(json.dumps(value).encode('utf-8'))
+        size = len(digest) + (len(blob) if blob else 0)
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (digest,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, kind, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, kind, blob, size, now + ttl, now),
+                )
+                self.size += size - (old[0] if old else 0)
+                if self.size > self.max_bytes:
+                    self._evict()
+
+    def _evict(self):
+        # Drop expired entries, then least recently used ones until 90% of max_bytes is left
+        self.conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = self.max_bytes * 0.9
+        while self.size > target:
+            rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1000").fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self.size -= size
+                if self.size <= target:
+                    break
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,76 @@
+import numpy as np
+from sklearn.preprocessing import normalize
+
+
+def build_song_index(titles, article_vectors, song_ids=None, article_rows=None):
+    """
+    Build the scoring index used by recommend_songs.
+
+    The corpus is kept as a single L2-normalized CSR matrix so a query can be
+    scored with one sparse matrix-vector product instead of densifying every row.
+    Songs sharing an article share a matrix row: article_rows maps each song to
+    its row, and scores are fanned out to the songs after the product.
+
+    Args:
+        titles (list): Song titles.
+        article_vectors (sparse matrix): TF-IDF vectors, one per song in the same order
+            as titles, or one per distinct article when article_rows is given.
+        song_ids (list, optional): Spotify ids in the same order as titles.
+        article_rows (list, optional): Row of article_vectors for each song.
+    """
+    # Titles used to be dictionary keys, so a repeated title keeps its first position
+    # but the vector of its last occurrence. Keep that behaviour so rankings don't change.
+    last_row = {}
+    for row, title in enumerate(titles):
+        last_row[title] = row
+    rows = np.fromiter(last_row.values(), dtype=np.int64, count=len(last_row))
+
+    if article_rows is None:
+        matrix = normalize(article_vectors.tocsr()[rows], norm='l2', copy=False)
+        article_rows = np.arange(len(rows))
+    else:
+        matrix = normalize(article_vectors.tocsr(), norm='l2', copy=False)
+        article_rows = np.asarray(article_rows, dtype=np.int64)[rows]
+
+    # Parallel arrays so a row id resolves to its song in O(1)
+    song_titles = np.array(list(last_row.keys()), dtype=object)
+    if song_ids is None:
+        song_ids = np.full(len(rows), None, dtype=object)
+    else:
+        song_ids = np.asarray(song_ids, dtype=object)[rows]
+    return {"matrix": matrix, "titles": song_titles, "song_ids": song_ids, "article_rows": article_rows}
+
+
+def score_query(song_index, user_vector):
+    """Return the cosine similarity between user_vector and every song in the index."""
+    # Match the corpus dtype so a float32 index isn't upcast (and copied) on every query
+    user_vector = normalize(user_vector, norm='l2').astype(song_index["matrix"].dtype, copy=False)
+    # (N x V) @ (V x 1) keeps everything sparse until the final dense score column
+    similarities = song_index["matrix"] @ user_vector.T
+    # Each distinct article is scored once, then its score is copied to every song using it
+    return similarities.toarray().ravel()[song_index["article_rows"]]
+
+
+def top_k(similarities, k):
+    """
+    Return the row ids of the k highest scores, best first.
+
+    Uses partition to find the k-th highest score in O(N) and only sorts the k
+    winners, instead of sorting the whole score array. Ties come out the way
+    similarities.argsort()[-k:][::-1] orders them: higher row id first, also when
+    a group of equal scores straddles the k-th place.
+    """
+    n = len(similarities)
+    if k >= n:
+        candidates = np.arange(n)
+    elif k <= 0:
+        return np.arange(0)
+    else:
+        kth = np.partition(similarities, n - k)[n - k]
+        above = np.flatnonzero(similarities > kth)
+        # Of the rows tied with the k-th score, the highest row ids make the cut
+        tied = np.flatnonzero(similarities == kth)
+        candidates = np.concatenate([above, tied[len(tied) - (k - len(above)):]])
+    # lexsort sorts by the last key first: score descending, then row id descending
+    order = np.lexsort((-candidates, -similarities[candidates]))
+    return candidates[order]
@@ -0,0 +1,555 @@
+import json
+import time
+import zlib
+import hashlib
+import pathlib
+import sqlite3
+import uuid
+from collections import Counter
+import pandas as pd
+
+
+SONGS_TABLE = '''
+CREATE TABLE IF NOT EXISTS {name} (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    album TEXT,
+    article_id INTEGER REFERENCES articles (id)
+)
+'''
+
+ALBUMS_TABLE = '''
+CREATE TABLE IF NOT EXISTS {name} (
+    album_id TEXT PRIMARY KEY,
+    name TEXT,
+    article_id INTEGER REFERENCES articles (id),
+    fetched_at REAL
+)
+'''
+
+
+def connect_songs_db(db_path):
+    """
+    Open songs.db for ingestion: WAL journaling, and the articles, songs, albums and progress tables.
+
+    WAL lets readers (index builds, model runs) keep working while ingestion writes,
+    and with synchronous=NORMAL a commit no longer waits on an fsync of the main file.
+    A database from before the articles table existed is left as it is; ingestion
+    scripts call migrate_articles before writing to it. Readers use open_songs_db.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS article_codecs (
+        id INTEGER PRIMARY KEY,
+        method TEXT,
+        level INTEGER,
+        dictionary BLOB,
+        created_at REAL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS articles (
+        id INTEGER PRIMARY KEY,
+        hash TEXT UNIQUE NOT NULL,
+        article TEXT,
+        codec_id INTEGER REFERENCES article_codecs (id)
+    )
+    ''')
+    if "codec_id" not in [row[1] for row in conn.execute("PRAGMA table_info(articles)")]:
+        conn.execute("ALTER TABLE articles ADD COLUMN codec_id INTEGER REFERENCES article_codecs (id)")
+    conn.execute(SONGS_TABLE.format(name="songs"))
+    conn.execute(ALBUMS_TABLE.format(name="albums"))
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS ingest_progress (
+        name TEXT PRIMARY KEY,
+        file_num INTEGER,
+        current_index INTEGER
+    )
+    ''')
+    conn.execute("CREATE TABLE IF NOT EXISTS songs_meta (key TEXT PRIMARY KEY, value)")
+    conn.execute("INSERT OR IGNORE INTO songs_meta (key, value) VALUES ('id', ?), ('generation', 0)", (uuid.uuid4().hex,))
+    conn.commit()
+    if "article_id" in [row[1] for row in conn.execute("PRAGMA table_info(songs)")]:
+        conn.execute("CREATE INDEX IF NOT EXISTS songs_article_id ON songs (article_id)")
+        conn.commit()
+    return conn
+
+
+def open_songs_db(db_path):
+    """
+    Open songs.db read-only, for index builds and queries.
+
+    Nothing is created or migrated, so readers work on a read-only songs.db and never
+    change its schema under a running ingestion.
+    """
+    return sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def migrate_articles(conn):
+    """
+    Move article text out of songs and albums into the articles table.
+
+    Songs that share an article byte for byte, mostly tracks that fell back to their
+    album's article, end up pointing at one articles row. Rowids are kept, so songs
+    are read back in the same order. Returns True if anything was migrated.
+
+    Expects a connection from connect_songs_db. Ingestion scripts run this explicitly
+    before writing; it does nothing on a database that is already migrated.
+    """
+    migrated = False
+    conn.create_function("article_hash", 1, lambda article: None if article is None else article_hash(article))
+    for table, schema, columns in (("songs", SONGS_TABLE, "id, name, album"), ("albums", ALBUMS_TABLE, "album_id, name, fetched_at")):
+        if "article" not in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+            continue
+        migrated = True
+        with conn:
+            conn.execute(f"INSERT OR IGNORE INTO articles (hash, article) SELECT article_hash(article), article FROM {table} WHERE article IS NOT NULL ORDER BY rowid")
+            conn.execute(schema.format(name=f"{table}_new"))
+            conn.execute(f"""
+            INSERT INTO {table}_new (rowid, {columns}, article_id)
+            SELECT old.rowid, {", ".join("old." + column for column in columns.split(", "))}, articles.id
+            FROM {table} AS old LEFT JOIN articles ON articles.hash = article_hash(old.article)
+            """)
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+            bump_generation(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS songs_article_id ON songs (article_id)")
+    conn.commit()
+    return migrated
+
+
+def bump_generation(conn):
+    """Record that songs changed, so indexes built before now are stale. Runs in the caller's transaction."""
+    conn.execute("UPDATE songs_meta SET value = value + 1 WHERE key = 'generation'")
+
+
+def songs_generation(db_path):
+    """
+    Return a token that changes whenever songs are written: the database's random id
+    and its generation counter. It costs one small read however large songs.db is.
+    """
+    conn = open_songs_db(db_path)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM songs_meta"))
+    except sqlite3.OperationalError:
+        # Not opened for writing since songs_meta was added
+        meta = {}
+    finally:
+        conn.close()
+    return f"{meta.get('id')}:{meta.get('generation')}"
+
+
+def load_ingest_progress(conn, name):
+    """Return (current_index, file_num) saved by SongWriter under name, or None."""
+    row = conn.execute("SELECT current_index, file_num FROM ingest_progress WHERE name = ?", (name,)).fetchone()
+    return tuple(row) if row else None
+
+
+# Errors caused by the contents of a row rather than the database; UnicodeError is a ValueError
+ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.DataError, sqlite3.ProgrammingError, sqlite3.InterfaceError, ValueError)
+
+
+class SongWriter:
+    """
+    Buffers song rows and writes them in batches, one transaction per batch.
+
+    The progress cursor is written in the same transaction as the rows it covers,
+    so after a crash the saved progress matches exactly what is in songs.
+    """
+
+    def __init__(self, conn, progress_name, batch_size=500):
+        self.conn = conn
+        self.progress_name = progress_name
+        self.batch_size = batch_size
+        self.rows = []
+        self.progress = None
+        self.pending = 0
+
+    def add(self, row, current_index, file_num):
+        """Queue row (or None for a track with no article) and advance progress past it."""
+        if row:
+            self.rows.append(row)
+        self.progress = (current_index, file_num)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the queued rows and the progress cursor.
+
+        If the batch fails because of a bad row (a constraint or encoding error), it is
+        written again row by row and the rows that still fail are logged and skipped.
+        Other database errors (a locked or full database) are raised with nothing written.
+        """
+        if not self.pending:
+            return
+        try:
+            with self.conn:
+                self.write_rows(self.rows)
+                self.write_progress()
+        except ROW_ERRORS as e:
+            print(f"Batch of {len(self.rows)} songs failed ({e}); writing them one at a time")
+            for row in self.rows:
+                try:
+                    with self.conn:
+                        self.write_rows([row])
+                except ROW_ERRORS as e:
+                    print(f"Skipping song {row[0]}: {e}")
+            with self.conn:
+                self.write_progress()
+        self.rows = []
+        self.pending = 0
+
+    def write_rows(self, rows):
+        hashes = store_articles(self.conn, (article for song_id, name, album, article in rows))
+        cursor = self.conn.executemany(
+            "INSERT OR IGNORE INTO songs (id, name, album, article_id) VALUES (?, ?, ?, (SELECT id FROM articles WHERE hash = ?))",
+            ((song_id, name, album, hash_value) for (song_id, name, album, article), hash_value in zip(rows, hashes)),
+        )
+        # Indexes only go stale when songs gain rows, not when progress moves past misses
+        if cursor.rowcount > 0:
+            bump_generation(self.conn)
+
+    def write_progress(self):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO ingest_progress (name, current_index, file_num) VALUES (?, ?, ?)",
+            (self.progress_name, *self.progress),
+        )
+
+
+def store_articles(conn, articles):
+    """
+    Add article texts to the articles table, each distinct text once, and return
+    their hashes in order (None for a missing article). Runs in the caller's transaction.
+
+    New texts are stored with the database's current ArticleCodec.
+    """
+    articles = list(articles)
+    hashes = [None if article is None else article_hash(article) for article in articles]
+    new = [(hash_value, article) for hash_value, article in zip(hashes, articles) if hash_value is not None]
+    if new:
+        known = set()
+        for i in range(0, len(new), 500):
+            chunk = [hash_value for hash_value, article in new[i:i + 500]]
+            placeholders = ",".join("?" * len(chunk))
+            known.update(row[0] for row in conn.execute(f"SELECT hash FROM articles WHERE hash IN ({placeholders})", chunk))
+        # Only texts that aren't stored yet are worth compressing
+        new = [(hash_value, article) for hash_value, article in dict(new).items() if hash_value not in known]
+    if new:
+        codec = ArticleCodec(conn)
+        rows = []
+        for hash_value, article in new:
+            codec_id, value = codec.encode(article)
+            rows.append((hash_value, value, codec_id))
+        conn.executemany("INSERT OR IGNORE INTO articles (hash, article, codec_id) VALUES (?, ?, ?)", rows)
+    return hashes
+
+
+# zlib primes its window with at most the last 32 KB of a dictionary
+MAX_DICTIONARY_BYTES = 32 * 1024
+
+
+class ArticleCodec:
+    """
+    Compresses article text for the articles table and reads it back.
+
+    Each article row records the article_codecs row it was written with, or NULL
+    for plain text, so rows written under different settings can be mixed freely.
+    New articles use the newest article_codecs row; a database without one keeps
+    storing plain text. A codec with a dictionary primes zlib with lines that recur
+    across articles (Wikipedia's navigation and footer text), so even short articles
+    compress well.
+    """
+
+    def __init__(self, conn):
+        rows = conn.execute("SELECT id, method, level, dictionary FROM article_codecs ORDER BY id").fetchall()
+        self.codecs = {codec_id: (method, level, dictionary) for codec_id, method, level, dictionary in rows}
+        self.current = rows[-1][0] if rows else None
+
+    def encode(self, article):
+        """Return (codec_id, value) to store for article."""
+        if self.current is None or self.codecs[self.current][0] is None:
+            return None, article
+        method, level, dictionary = self.codecs[self.current]
+        compressor = zlib.compressobj(level, zdict=dictionary) if dictionary else zlib.compressobj(level)
+        return self.current, compressor.compress(article.encode('utf-8')) + compressor.flush()
+
+    def decode(self, codec_id, value):
+        """Return the text of an article stored as value under codec_id."""
+        if codec_id is None or value is None:
+            return value
+        method, level, dictionary = self.codecs[codec_id]
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return (decompressor.decompress(value) + decompressor.flush()).decode('utf-8')
+
+
+def train_dictionary(articles, size=MAX_DICTIONARY_BYTES, min_share=0.01):
+    """
+    Build a zlib dictionary from a sample of article texts.
+
+    Lines found in at least min_share of the articles are kept, most common last,
+    since zlib finds matches closest to the end of its window most cheaply.
+    """
+    articles = list(articles)
+    line_counts = Counter()
+    for article in articles:
+        line_counts.update(set(line.strip() for line in article.splitlines() if line.strip()))
+    common = [line for line, count in line_counts.most_common() if count >= max(2, min_share * len(articles))]
+
+    dictionary, used = [], 0
+    for line in common:
+        encoded = line.encode('utf-8') + b"\n"
+        if used + len(encoded) > size:
+            break
+        dictionary.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(dictionary))
+
+
+def compress_articles(conn, method='zlib', level=6, dictionary=True, sample_size=2000, batch_size=1000):
+    """
+    Switch songs.db to a new article codec and rewrite every stored article with it.
+
+    Args:
+        method (str): 'zlib', or None to go back to plain text.
+        level (int): zlib compression level.
+        dictionary (bool): Train a dictionary on a sample of the stored articles.
+        sample_size (int): Number of articles to train the dictionary on.
+
+    Returns:
+        int: The id of the new article_codecs row.
+    """
+    old_codec = ArticleCodec(conn)
+    trained = None
+    if method and dictionary:
+        rows = conn.execute("SELECT codec_id, article FROM articles ORDER BY random() LIMIT ?", (sample_size,)).fetchall()
+        trained = train_dictionary(old_codec.decode(codec_id, value) for codec_id, value in rows) or None
+    with conn:
+        codec_id = conn.execute(
+            "INSERT INTO article_codecs (method, level, dictionary, created_at) VALUES (?, ?, ?, ?)",
+            (method, level, trained, time.time()),
+        ).lastrowid
+    new_codec = ArticleCodec(conn)
+
+    last_id = 0
+    while True:
+        rows = conn.execute("SELECT id, codec_id, article FROM articles WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        with conn:
+            for article_id, old_id, value in rows:
+                new_id, new_value = new_codec.encode(old_codec.decode(old_id, value))
+                conn.execute("UPDATE articles SET article = ?, codec_id = ? WHERE id = ?", (new_value, new_id, article_id))
+    return codec_id
+
+
+def load_album_articles(conn, album_ids, missing_ttl=None):
+    """
+    Return {album_id: article} for the albums already looked up, where article is
+    None if the album had no article.
+
+    With missing_ttl (seconds), an album found to have no article longer ago than
+    that is left out, so the caller looks it up again.
+    """
+    found = {}
+    codec = ArticleCodec(conn)
+    recheck_before = time.time() - missing_ttl if missing_ttl is not None else None
+    album_ids = list(album_ids)
+    # Stay well under SQLite's limit on bound parameters
+    for i in range(0, len(album_ids), 500):
+        chunk = album_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            "SELECT albums.album_id, albums.fetched_at, articles.codec_id, articles.article FROM albums "
+            f"LEFT JOIN articles ON articles.id = albums.article_id WHERE albums.album_id IN ({placeholders})",
+            chunk,
+        )
+        for album_id, fetched_at, codec_id, article in rows:
+            if article is None and recheck_before is not None and (fetched_at or 0) < recheck_before:
+                continue
+            found[album_id] = codec.decode(codec_id, article)
+    return found
+
+
+def save_album_articles(conn, albums):
+    """Store (album_id, name, article) lookups so no album is fetched twice."""
+    albums = list(albums)
+    with conn:
+        hashes = store_articles(conn, [article for album_id, name, article in albums])
+        conn.executemany(
+            "INSERT OR REPLACE INTO albums (album_id, name, article_id, fetched_at) VALUES (?, ?, (SELECT id FROM articles WHERE hash = ?), ?)",
+            ((album_id, name, hash_value, time.time()) for (album_id, name, article), hash_value in zip(albums, hashes)),
+        )
+
+
+def count_songs(db_path):
+    """Return the number of songs with an article, the ones load_data_in_batches yields, with a single COUNT(*)."""
+    conn = open_songs_db(db_path)
+    (count,) = conn.execute("SELECT COUNT(*) FROM songs JOIN articles ON articles.id = songs.article_id").fetchone()
+    conn.close()
+    return count
+
+
+def count_batches(db_path, batch_size=1000):
+    """Return how many batches load_data_in_batches will yield."""
+    return -(-count_songs(db_path) // batch_size)
+
+
+def load_data_in_batches(db_path, batch_size=1000, as_tuples=False):
+    """
+    Load data from the SQL database in batches.
+
+    Pages by rowid instead of LIMIT/OFFSET, so each batch is an index seek and a
+    full pass is linear in the number of songs.
+
+    Args:
+        db_path (str): Path to songs.db.
+        batch_size (int): Number of songs per batch.
+        as_tuples (bool): Yield lists of (id, name, article) tuples instead of DataFrames.
+    """
+    conn = open_songs_db(db_path)
+    codec = ArticleCodec(conn)
+    query = '''
+    SELECT songs.rowid, songs.id, songs.name, articles.codec_id, articles.article
+    FROM songs JOIN articles ON articles.id = songs.article_id
+    WHERE songs.rowid > ? ORDER BY songs.rowid LIMIT ?
+    '''
+    last_rowid = 0
+    while True:
+        rows = conn.execute(query, (last_rowid, batch_size)).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        batch = [(song_id, name, codec.decode(codec_id, article)) for rowid, song_id, name, codec_id, article in rows]
+        if as_tuples:
+            yield batch
+        else:
+            yield pd.DataFrame(batch, columns=['id', 'name', 'article'])  # This will yield a batch of songs as a DataFrame
+    conn.close()
+
+
+def load_song_article_ids(db_path):
+    """Return (song_ids, names, article_ids) for every song with an article, in rowid order."""
+    conn = open_songs_db(db_path)
+    rows = conn.execute("SELECT id, name, article_id FROM songs WHERE article_id IS NOT NULL ORDER BY rowid").fetchall()
+    conn.close()
+    song_ids, names, article_ids = (list(column) for column in zip(*rows)) if rows else ([], [], [])
+    return song_ids, names, article_ids
+
+
+def load_articles_in_batches(db_path, batch_size=1000, with_text=True):
+    """
+    Yield lists of (article_id, hash, article) for every distinct article, by id.
+
+    With with_text=False the lists hold (article_id, hash) only, and article bodies
+    are neither read nor decompressed; load_article_texts fetches the ones needed.
+    """
+    conn = open_songs_db(db_path)
+    codec = ArticleCodec(conn)
+    columns = "id, hash, codec_id, article" if with_text else "id, hash"
+    query = f"SELECT {columns} FROM articles WHERE id > ? ORDER BY id LIMIT ?"
+    last_id = 0
+    while True:
+        rows = conn.execute(query, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        if with_text:
+            rows = [(article_id, hash_value, codec.decode(codec_id, article)) for article_id, hash_value, codec_id, article in rows]
+        yield rows
+    conn.close()
+
+
+def load_article_texts(conn, article_ids):
+    """Return {article_id: text} for the given articles."""
+    found = {}
+    codec = ArticleCodec(conn)
+    article_ids = list(article_ids)
+    # Stay well under SQLite's limit on bound parameters
+    for i in range(0, len(article_ids), 500):
+        chunk = article_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"SELECT id, codec_id, article FROM articles WHERE id IN ({placeholders})", chunk)
+        for article_id, codec_id, article in rows:
+            found[article_id] = codec.decode(codec_id, article)
+    return found
+
+
+def article_hash(article):
+    """Content hash used to key anything derived from an article's text."""
+    return hashlib.sha256(article.encode('utf-8')).hexdigest()
+
+
+def terms_db_path(db_path):
+    """Path of the preprocessed terms store kept next to the songs.db at db_path (songs.db -> songs.terms.db)."""
+    path = pathlib.Path(db_path)
+    return str(path.with_name(f"{path.stem}.terms{path.suffix or '.db'}"))
+
+
+def connect_terms_db(db_path):
+    """
+    Open the preprocessed terms store for the songs.db at db_path.
+
+    Terms are keyed by article hash and preprocessing config, and live in their own
+    file (terms_db_path) so index builds can write them while only ever reading
+    songs.db. songs.db is attached read-only as "songs", for pruning terms of
+    articles that are gone.
+    """
+    conn = sqlite3.connect(pathlib.Path(terms_db_path(db_path)).resolve().as_uri(), uri=True)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS processed_articles (
+        article_hash TEXT,
+        config TEXT,
+        tokenizer TEXT,
+        terms TEXT,
+        PRIMARY KEY (article_hash, config)
+    )
+    ''')
+    conn.commit()
+    conn.execute("ATTACH DATABASE ? AS songs", (pathlib.Path(db_path).resolve().as_uri() + "?mode=ro",))
+    return conn
+
+
+def load_processed_terms(conn, hashes, config):
+    """Return {article_hash: terms} for the hashes already preprocessed under config."""
+    found = {}
+    hashes = list(hashes)
+    # Stay well under SQLite's limit on bound parameters
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT article_hash, terms FROM processed_articles WHERE config = ? AND article_hash IN ({placeholders})",
+            [config, *chunk],
+        )
+        for hash_value, terms in rows:
+            found[hash_value] = json.loads(terms)
+    return found
+
+
+def save_processed_terms(conn, processed, config, tokenizer):
+    """Store {article_hash: terms} preprocessed under config with tokenizer."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO processed_articles (article_hash, config, tokenizer, terms) VALUES (?, ?, ?, ?)",
+        ((hash_value, config, tokenizer, json.dumps(terms)) for hash_value, terms in processed.items()),
+    )
+    conn.commit()
+
+
+def prune_processed_articles(conn, config, tokenizer):
+    """
+    Delete stored terms that tokenizer produced under an older config than config, or
+    whose article is no longer in songs.db. Terms from other tokenizers are kept, so
+    builds with different tokenizers don't undo each other's work. Returns the number
+    of rows deleted.
+    """
+    with conn:
+        deleted = conn.execute("DELETE FROM processed_articles WHERE tokenizer = ? AND config != ?", (tokenizer, config)).rowcount
+        deleted += conn.execute("DELETE FROM processed_articles WHERE article_hash NOT IN (SELECT hash FROM songs.articles)").rowcount
+    return deleted
@@ -0,0 +1,253 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class TokenBucket:
+    """
+    Thread-safe rate limiter shared by every request to one API.
+
+    Allows bursts of up to capacity requests and rate requests per second on
+    average. pause() stops everyone until a server-imposed Retry-After has passed.
+    """
+
+    def __init__(self, rate=10.0, capacity=10):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # Don't let a burst of saved-up tokens go out the moment the pause ends
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+def retry_after(error):
+    """Seconds to wait if error is an HTTP 429, otherwise None."""
+    if getattr(error, 'http_status', None) != 429:
+        return None
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 1))
+    except ValueError:
+        return 1.0
+
+
+def fetch_results(search, query, offset, limit, bucket, max_retries=5):
+    """Fetch one page of search results, waiting out 429 responses. Returns the 'tracks' paging object."""
+    for attempt in range(max_retries + 1):
+        bucket.acquire()
+        try:
+            return search(query, limit, offset)['tracks']
+        except Exception as e:
+            wait = retry_after(e)
+            if wait is None or attempt == max_retries:
+                raise
+            bucket.pause(wait)
+
+
+def fetch_page(search, query, offset, limit, bucket, max_retries=5):
+    """Fetch one page of search results, waiting out 429 responses."""
+    return fetch_results(search, query, offset, limit, bucket, max_retries)['items']
+
+
+def search_all_pages(search, query, bucket, limit=50, max_offset=1000, workers=4, unseen=None, min_novelty=0.0, patience=2,
+                     first_page=None):
+    """
+    Fetch every page of results for query, several pages at a time.
+
+    All page offsets are known up front, so up to workers pages are requested
+    concurrently through the shared rate limiter. As soon as a page comes back
+    short, the result set has ended and pages past it are cancelled.
+
+    With unseen given, each page's novelty is the fraction of its tracks that are
+    neither already harvested nor on an earlier page of this query. Once patience
+    pages in a row fall below min_novelty the query is stopped, since deep pages
+    of a saturated query cost a request each and add almost nothing.
+
+    Args:
+        search (callable): search(query, limit, offset) returning a Spotify search response.
+        query (str): Search query.
+        bucket (TokenBucket): Rate limiter shared by every caller of this API.
+        limit (int): Tracks per page.
+        max_offset (int): Spotify won't page past this offset.
+        workers (int): Maximum number of pages in flight.
+        unseen (callable, optional): unseen(tracks) returning the tracks not harvested yet,
+            like TrackCatalog.unseen.
+        min_novelty (float): Stop below this fraction of new tracks per page.
+        patience (int): Number of consecutive low-novelty pages before stopping.
+        first_page (list, optional): Tracks at offset 0 if the caller already has
+            them, e.g. from probing the query's total; they aren't requested again.
+
+    Returns:
+        (tracks, stats): Tracks in the same order a page-by-page walk would return
+            them, and a dict of pages, tracks, new_tracks (only counted with unseen)
+            and stopped_early for the query.
+    """
+    offsets = iter(range(0 if first_page is None else limit, max_offset, limit))
+    all_songs = []
+    query_ids = set()
+    stats = {"pages": 0, "tracks": 0, "new_tracks": 0, "stopped_early": False}
+    low_pages = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        if first_page is not None:
+            probed = Future()
+            probed.set_result(first_page)
+            pending.append(probed)
+        while True:
+            while len(pending) < workers:
+                offset = next(offsets, None)
+                if offset is None:
+                    break
+                pending.append(pool.submit(fetch_page, search, query, offset, limit, bucket))
+            if not pending:
+                break
+
+            tracks = pending.popleft().result()
+            all_songs.extend(tracks)
+            stats["pages"] += 1
+            stats["tracks"] += len(tracks)
+
+            stop = len(tracks) < limit
+            if unseen is not None and tracks:
+                new = [track for track in unseen(tracks) if track['id'] not in query_ids]
+                query_ids.update(track['id'] for track in tracks)
+                stats["new_tracks"] += len(new)
+                low_pages = low_pages + 1 if len(new) / len(tracks) < min_novelty else 0
+                if low_pages >= patience and not stop:
+                    stats["stopped_early"] = stop = True
+
+            # If there are no more results (or none worth fetching), stop everything still queued
+            if stop:
+                for future in pending:
+                    future.cancel()
+                break
+    return all_songs, stats
+
+
+def order_queries(queries, query_stats, min_yield=0.0):
+    """
+    Order queries by how many new tracks per request they returned last time.
+
+    Queries without recorded stats come first, since their yield is unknown. Queries
+    whose recorded yield is below min_yield new tracks per page are left out.
+
+    Args:
+        queries (list): Search queries, e.g. search_queries_list.search_queries.
+        query_stats (dict): Query to the stats dict search_all_pages returned for it,
+            as saved by TrackCatalog.record_query.
+        min_yield (float): Skip queries with fewer new tracks per page than this.
+    """
+    def query_yield(query):
+        stats = query_stats[query]
+        return stats["new_tracks"] / max(stats["pages"], 1)
+
+    unknown = [query for query in queries if query not in query_stats]
+    known = [query for query in queries if query in query_stats and query_yield(query) >= min_yield]
+    return unknown + sorted(known, key=query_yield, reverse=True)
+
+
+# Genres tried, one at a time, on a query that's still over the offset cap within a single year
+REFINE_GENRES = ("pop", "rock", "hip-hop", "rap", "country", "r-n-b", "jazz", "classical", "electronic", "dance",
+                 "indie", "metal", "folk", "soul", "blues", "reggae", "latin", "punk", "k-pop", "soundtrack")
+
+
+def _year_range(query):
+    # Return (lo, hi) from a year:YYYY or year:YYYY-YYYY qualifier, or None
+    for word in query.split():
+        if word.startswith('year:'):
+            first, _, last = word[5:].partition('-')
+            return int(first), int(last or first)
+    return None
+
+
+def refine_query(query, years=(1900, time.localtime().tm_year), genres=REFINE_GENRES):
+    """
+    Split a query that has more results than Spotify will page through.
+
+    The years range (or the query's own year qualifier) is halved until each part
+    is a single year. After that, one genre qualifier is added at a time. Returns []
+    once there is nothing left to split on, and planned_search then keeps the query's
+    results up to the cap.
+    """
+    lo, hi = _year_range(query) or years
+    base = " ".join(word for word in query.split() if not word.startswith('year:'))
+    if lo < hi:
+        mid = (lo + hi) // 2
+        return [f"{base} year:{lo}-{mid}" if lo < mid else f"{base} year:{lo}",
+                f"{base} year:{mid + 1}-{hi}" if mid + 1 < hi else f"{base} year:{hi}"]
+    if 'genre:' not in query:
+        return [f"{query} genre:{genre}" for genre in genres]
+    return []
+
+
+def _harvest(search, query, bucket, limit, max_offset, page_workers, refine):
+    # Runs on a fetcher thread: the first page says how many results there are. A query
+    # over the cap that can be split stops there, since its refinements cover the same
+    # tracks; otherwise the probe is reused as page 0, so it costs no extra request
+    results = fetch_results(search, query, 0, limit, bucket)
+    refinements = refine(query) if results['total'] > max_offset else []
+    if refinements:
+        return query, results['total'], results['items'], refinements
+    tracks, stats = search_all_pages(search, query, bucket, limit, max_offset, page_workers, first_page=results['items'])
+    return query, results['total'], tracks, refinements
+
+
+def planned_search(search, queries, bucket, workers=4, limit=50, max_offset=1000, refine=refine_query, page_workers=1):
+    """
+    Harvest queries, splitting any that Spotify's offset cap would cut short.
+
+    Queries wait in a work queue drained by a pool of workers fetcher threads. The
+    first page of each query is a probe: if the query's total is over max_offset
+    and refine(query) splits it, the sub-queries go on the queue and the query
+    itself is fetched no further, because the sub-queries page through the same
+    tracks. Any other query has its pages fetched with search_all_pages. Results
+    are yielded on the calling thread, so the caller can write them to a single
+    SQLite connection.
+
+    Args:
+        search (callable): search(query, limit, offset) returning a Spotify search response.
+        queries (iterable): Queries to start from, e.g. search_queries_list.search_queries.
+        bucket (TokenBucket): Rate limiter shared by every caller of this API.
+        workers (int): Number of queries fetched at once.
+        refine (callable): refine(query) returning narrower queries, or [] if it can't be split.
+        page_workers (int): Pages of one query fetched at once.
+
+    Yields:
+        (query, total, tracks): tracks holds every result up to max_offset, or only
+            the probe page for a query that was split into refinements.
+    """
+    work = deque(queries)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        while work or pending:
+            while work and len(pending) < workers:
+                pending.add(pool.submit(_harvest, search, work.popleft(), bucket, limit, max_offset, page_workers, refine))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                query, total, tracks, refinements = future.result()
+                work.extend(refinements)
+                yield query, total, tracks
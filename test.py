@@ -1,10 +1,5 @@
-import wikipedia
+from response_cache import ResponseCache
+from wiki_fetch import get_wikipedia_article
 
-def get_wikipedia_article(song_title):
-    try:
-        page = wikipedia.page(song_title)
-        return page.content
-    except Exception as e:
-        return None
-    
-print(get_wikipedia_article("Out of the frying pan "))
\ No newline at end of file
+cache = ResponseCache('response_cache.db')
+print(get_wikipedia_article("Out of the frying pan ", cache))
\ No newline at end of file
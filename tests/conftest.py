@@ -0,0 +1,13 @@
+import nltk
+import pytest
+from preprocessing import NLTK_RESOURCES
+
+
+@pytest.fixture
+def nltk_data():
+    """Skip the test unless the NLTK resources the preprocessing pipeline needs are installed."""
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            pytest.skip(f"NLTK {name} data not installed; run preprocessing.download_nltk_data()")
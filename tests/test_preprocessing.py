@@ -0,0 +1,142 @@
+import pytest
+from nltk.corpus import wordnet
+from nltk.stem import PorterStemmer, WordNetLemmatizer
+from sklearn.feature_extraction.text import TfidfVectorizer
+from benchmarks.synthetic import synthetic_songs_db
+from preprocessing import TOKENIZERS, ArticlePreprocessor, TokenNormalizer, process_tokens, strip_boilerplate, tokenize
+from tfidf_index import build_index, load_index
+
+WORDS = ["singing", "sings", "sang", "recorded", "records", "albums", "singing", "charted", "sings"]
+
+
+def test_normalizer_matches_stem_and_lemmatize(nltk_data):
+    stemmer, lemmatizer = PorterStemmer(), WordNetLemmatizer()
+    normalizer = TokenNormalizer()
+    assert [normalizer.normalize(word) for word in WORDS] == [lemmatizer.lemmatize(stemmer.stem(word), wordnet.VERB) for word in WORDS]
+    assert (normalizer.hits, normalizer.misses) == (2, len(set(WORDS)))
+
+
+def test_normalizer_evicts_least_recently_used():
+    normalizer = TokenNormalizer(max_size=2)
+    normalizer.add("singing", "sing")
+    normalizer.add("records", "record")
+    assert normalizer.lookup("singing") == "sing"
+    normalizer.add("albums", "album")
+    assert list(normalizer.table) == ["singing", "albums"]
+    assert normalizer.lookup("records") is None
+
+
+def test_normalizer_save_and_load(tmp_path):
+    path = str(tmp_path / "token_cache.json")
+    normalizer = TokenNormalizer(path=path)
+    for word, term in (("singing", "sing"), ("records", "record"), ("albums", "album")):
+        normalizer.add(word, term)
+    normalizer.save()
+
+    assert TokenNormalizer(path=path).table == normalizer.table
+    # A smaller table keeps the most recently used entries
+    assert list(TokenNormalizer(max_size=2, path=path).table) == ["records", "albums"]
+
+
+ARTICLES = [
+    ("Song 1", "Singing the songs she sang, the band recorded three records."),
+    ("Song 2", "The album charted; its singles were re-recorded in 1999."),
+    ("Song 3", "Records, singing and charting: the band's albums sold well."),
+    ("Song 4", "Nothing here was sung before the band's first single."),
+]
+
+
+@pytest.mark.parametrize("tokenizer", TOKENIZERS)
+@pytest.mark.parametrize("workers", [1, 2])
+def test_two_phase_matches_token_by_token(nltk_data, tokenizer, workers):
+    # Several batches through one preprocessor, so later batches reuse forms the earlier ones added
+    batches = [ARTICLES[:2], ARTICLES[2:3], ARTICLES[1:]]
+    results = {}
+    for two_phase in (False, True):
+        with ArticlePreprocessor(workers, tokenizer, two_phase, chunk_size=1, normalizer=TokenNormalizer()) as preprocessor:
+            results[two_phase] = [preprocessor.preprocess(batch) for batch in batches]
+    assert results[True] == results[False]
+
+
+def test_two_phase_builds_the_same_index(nltk_data, tmp_path):
+    db_path = str(tmp_path / "songs.db")
+    synthetic_songs_db(db_path, 300, article_length=400, album_share=0.3)
+    matrices = {}
+    for two_phase in (False, True):
+        index_dir = str(tmp_path / f"index_{two_phase}")
+        build_index(db_path, index_dir, batch_size=50, tokenizer="regex", two_phase=two_phase)
+        matrices[two_phase] = load_index(index_dir, db_path)[0]["matrix"]
+    assert matrices[True].shape == matrices[False].shape
+    assert (matrices[True] != matrices[False]).nnz == 0
+
+
+def scraped_page(title, body):
+    return "\n".join([
+        "Jump to content", "Main menu", "Donate", "Create account", "Contents", "(Top)", title,
+        "From Wikipedia, the free encyclopedia", body,
+        "References", "^ A review. Retrieved March 3, 2021.", "vte", f"{title} navbox",
+        "Categories:", "1999 songs", "This page was last edited on 1 May 2024.", "Privacy policy",
+    ])
+
+
+def test_strip_boilerplate_keeps_every_joined_page():
+    article = scraped_page("First Song", "First song body.") + "\n" + scraped_page("Second Song", "Second song body.")
+    assert strip_boilerplate(article).splitlines() == ["First song body.", "References", "^ A review. ",
+                                                      "Second song body.", "References", "^ A review. "]
+
+
+def test_strip_boilerplate_removes_page_chrome():
+    article = "\n".join([
+        "Jump to content", "Main menu", "Search", "Contents", "(Top)", "Background", "Song Title",
+        "From Wikipedia, the free encyclopedia",
+        "This article is about the song. For other uses, see Song Title (disambiguation).",
+        "Featured article",
+        "\"Song Title\" is a song by the band.",
+        "Background[edit]",
+        "[edit]",
+        "The band wrote it in 1999.",
+        "References",
+        '^ "Song Title". Billboard. Archived from the original on 4 June 2010. Retrieved March 3, 2021.',
+        "vte",
+        "The band",
+        "Studio albums",
+        "Authority control databases",
+        "MusicBrainz work",
+        "Retrieved from \"https://en.wikipedia.org/w/index.php?title=Song_Title\"",
+        "Privacy policy",
+    ])
+    assert strip_boilerplate(article).splitlines() == [
+        "\"Song Title\" is a song by the band.",
+        "Background[edit]",
+        "The band wrote it in 1999.",
+        "References",
+        '^ "Song Title". Billboard.  ',
+    ]
+
+
+def test_strip_boilerplate_leaves_api_and_dump_text_alone():
+    # Extracts from the API and text from a dump have no tagline, so nothing counts as header
+    article = "\n".join([
+        "Song Title is a song by the band, released in 1999.",
+        "",
+        "== Background ==",
+        "The band wrote it on tour. Contents of the demo were lost.",
+        "",
+        "== References ==",
+        "References",
+    ])
+    assert strip_boilerplate(article) == article
+
+
+PROSE = (
+    "The song was written by the band during their first tour of Europe. It was released "
+    "as the lead single from their second album, and it reached number four on the charts. "
+    "Critics praised the chorus and the production, though some reviewers found the lyrics weak."
+)
+
+
+def test_regex_tokenizer_matches_nltk_on_plain_prose(nltk_data):
+    # What reaches the index is the vectorizer's analysis of the processed terms
+    analyze = TfidfVectorizer(stop_words=None).build_analyzer()
+    terms = {name: analyze(" ".join(process_tokens(tokenize(PROSE, name)))) for name in TOKENIZERS}
+    assert terms["regex"] == terms["nltk"]
@@ -0,0 +1,60 @@
+import pytest
+import response_cache
+from response_cache import ResponseCache, DAY
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # A clock that moves one second per reading, so every access has its own time
+    now = [1_000_000.0]
+
+    def time():
+        now[0] += 1
+        return now[0]
+    monkeypatch.setattr(response_cache.time, "time", time)
+    return now
+
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    cache.put("wikipedia.page", "Song", {"text": "article"}, ttl=DAY)
+    assert cache.get("wikipedia.page", "Song") == ("hit", {"text": "article"})
+    assert cache.get("spotify.search", "Song") is None
+    clock[0] += DAY
+    assert cache.get("wikipedia.page", "Song") is None
+    assert cache.hit_rate() == 1 / 3
+    cache.close()
+
+
+def test_negative_entries_keep_their_own_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    cache.put("wikipedia.page", "Found", "article", ttl=30 * DAY)
+    cache.put("wikipedia.page", "Missing", None, ttl=7 * DAY, kind="missing")
+    assert cache.get("wikipedia.page", "Missing") == ("missing", None)
+    clock[0] += 7 * DAY
+    assert cache.get("wikipedia.page", "Missing") is None
+    assert cache.get("wikipedia.page", "Found") == ("hit", "article")
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path)
+    cache.put("ns", "probe", "x" * 100, ttl=DAY)
+    entry_size = cache.size
+    cache.close()
+
+    # Room for four and a half entries: the fifth pushes out the least recently used one
+    cache = ResponseCache(path, max_bytes=4 * entry_size + entry_size // 2)
+    for key in ("a", "b", "c"):
+        cache.put("ns", key, "x" * 100, ttl=DAY)
+    assert cache.get("ns", "probe") is not None
+    cache.put("ns", "d", "x" * 100, ttl=DAY)
+    assert cache.size <= cache.max_bytes * 0.9
+    assert [key for key in ("probe", "a", "b", "c", "d") if cache.get("ns", key)] == ["probe", "b", "c", "d"]
+    cache.close()
+
+    # The size is read back when the cache is reopened
+    cache = ResponseCache(path)
+    assert cache.size == 4 * entry_size
+    cache.close()
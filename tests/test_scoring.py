@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from scoring import top_k
+
+
+def argsort_top_k(similarities, k):
+    # What recommend_songs used to do, with a stable sort so ties have one right answer
+    return similarities.argsort(kind='stable')[-k:][::-1] if k else np.arange(0)
+
+
+@pytest.mark.parametrize("k", [0, 1, 3, 7, 8, 20, 50])
+def test_top_k_matches_argsort_with_ties(k):
+    rng = np.random.default_rng(0)
+    # Few distinct scores, so most k land inside a group of equal scores
+    similarities = rng.integers(0, 4, size=40) / 4
+    np.testing.assert_array_equal(top_k(similarities, k), argsort_top_k(similarities, k))
+
+
+def test_top_k_matches_argsort_without_ties():
+    similarities = np.random.default_rng(1).random(1000)
+    np.testing.assert_array_equal(top_k(similarities, 10), argsort_top_k(similarities, 10))
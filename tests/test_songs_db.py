@@ -0,0 +1,157 @@
+import sqlite3
+import pytest
+from benchmarks.synthetic import write_songs_db, synthetic_rows
+from songs_db import (
+    connect_songs_db,
+    open_songs_db,
+    migrate_articles,
+    songs_generation,
+    load_data_in_batches,
+    count_batches,
+    load_ingest_progress,
+    SongWriter,
+    article_hash,
+    connect_terms_db,
+    save_processed_terms,
+    load_processed_terms,
+    prune_processed_articles,
+    compress_articles,
+)
+
+# Legacy rows: songs 2 and 4 fell back to their album's article, song 5 has none
+ROWS = [
+    ("id1", "Song 1", "Album A", "song one article"),
+    ("id2", "Song 2", "Album A", "album a article"),
+    ("id3", "Song 3", "Album A", "album a article"),
+    ("id4", "Song 4", "Album B", "song four article"),
+    ("id5", "Song 5", "Album B", None),
+]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    db_path = str(tmp_path / "songs.db")
+    write_songs_db(db_path, ROWS, migrate=False)
+    conn = sqlite3.connect(db_path)
+    # Gaps in rowid, as left by deleted songs
+    conn.execute("DELETE FROM songs WHERE id = 'id2'")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_migration_dedups_articles_and_keeps_rowids(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    rowids = conn.execute("SELECT id, rowid FROM songs ORDER BY rowid").fetchall()
+    conn.close()
+
+    conn = connect_songs_db(legacy_db)
+    generation = songs_generation(legacy_db)
+    assert migrate_articles(conn)
+    assert conn.execute("SELECT id, rowid FROM songs ORDER BY rowid").fetchall() == rowids
+    assert conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0] == 3
+    assert songs_generation(legacy_db) != generation
+    # Already migrated: nothing to do, and indexes built since stay valid
+    generation = songs_generation(legacy_db)
+    assert not migrate_articles(conn)
+    assert songs_generation(legacy_db) == generation
+    conn.close()
+
+    songs = [song for batch in load_data_in_batches(legacy_db, batch_size=2, as_tuples=True) for song in batch]
+    assert songs == [(song_id, name, article) for song_id, name, album, article in ROWS if song_id != "id2" and article]
+    # Song 5 has no article, so the other three fit in one batch
+    assert count_batches(legacy_db, batch_size=3) == len(list(load_data_in_batches(legacy_db, batch_size=3))) == 1
+
+
+def test_readers_open_songs_db_read_only(legacy_db):
+    connect_songs_db(legacy_db).close()
+    conn = open_songs_db(legacy_db)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("CREATE TABLE scratch (id INTEGER)")
+    conn.close()
+
+
+def test_song_writer_skips_bad_rows(tmp_path, capsys):
+    conn = connect_songs_db(str(tmp_path / "songs.db"))
+    writer = SongWriter(conn, "test", batch_size=10)
+    for i in range(8):
+        writer.add((f"id{i}", f"Song {i}", "Album", f"article {i}"), i + 1, 1)
+    # Text that can't be encoded as UTF-8, and an id that isn't a string
+    writer.add(("id8", "Song 8", "Album", "article \ud800"), 9, 1)
+    writer.add((["id9"], "Song 9", "Album", "article 9"), 10, 1)
+
+    assert [row[0] for row in conn.execute("SELECT id FROM songs ORDER BY rowid")] == [f"id{i}" for i in range(8)]
+    assert load_ingest_progress(conn, "test") == (10, 1)
+    assert "Skipping song id8" in capsys.readouterr().out
+    conn.close()
+
+
+def test_song_writer_bumps_generation_only_for_new_songs(tmp_path):
+    db_path = str(tmp_path / "songs.db")
+    conn = connect_songs_db(db_path)
+    writer = SongWriter(conn, "test")
+    writer.add(("id1", "Song 1", "Album", "article 1"), 1, 0)
+    writer.flush()
+    generation = songs_generation(db_path)
+
+    # Tracks with no article, and a song already stored, only move progress
+    writer.add(None, 2, 0)
+    writer.add(("id1", "Song 1", "Album", "article 1"), 3, 0)
+    writer.flush()
+    assert load_ingest_progress(conn, "test") == (3, 0)
+    assert songs_generation(db_path) == generation
+
+    writer.add(("id2", "Song 2", "Album", "article 2"), 4, 0)
+    writer.flush()
+    assert songs_generation(db_path) != generation
+    conn.close()
+
+
+def test_pruning_keeps_terms_from_other_tokenizers(tmp_path):
+    db_path = str(tmp_path / "songs.db")
+    write_songs_db(db_path, ROWS[:2])
+    hashes = [article_hash(article) for song_id, name, album, article in ROWS[:2]]
+    conn = connect_terms_db(db_path)
+    save_processed_terms(conn, {hashes[0]: ["old"]}, "nltk-v1", "nltk")
+    save_processed_terms(conn, {hashes[0]: ["new"], hashes[1]: ["new"], "gone": ["new"]}, "nltk-v2", "nltk")
+    save_processed_terms(conn, {hashes[0]: ["regex"]}, "regex-v2", "regex")
+
+    assert prune_processed_articles(conn, "nltk-v2", "nltk") == 2
+    assert load_processed_terms(conn, hashes, "nltk-v2") == {hashes[0]: ["new"], hashes[1]: ["new"]}
+    assert load_processed_terms(conn, hashes, "regex-v2") == {hashes[0]: ["regex"]}
+    conn.close()
+
+    # The store is a file of its own; songs.db isn't written to
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'processed_articles'").fetchone() is None
+    conn.close()
+
+
+@pytest.mark.parametrize("dictionary", [False, True])
+def test_compressed_articles_read_back_unchanged(tmp_path, dictionary):
+    db_path = str(tmp_path / "songs.db")
+    rows = list(synthetic_rows(40, article_length=500, chrome=True))
+    write_songs_db(db_path, rows)
+    conn = connect_songs_db(db_path)
+    # A row written as plain text before the codec existed
+    conn.execute("INSERT INTO articles (hash, article) VALUES ('plain', 'plain article')")
+    conn.execute("INSERT INTO songs (id, name, album, article_id) VALUES ('plain', 'Plain', 'Album', last_insert_rowid())")
+    conn.commit()
+    expected = [(song_id, name, article) for song_id, name, album, article in rows if article] + [("plain", "Plain", "plain article")]
+
+    codec_id = compress_articles(conn, "zlib", dictionary=dictionary)
+    (trained,) = conn.execute("SELECT dictionary FROM article_codecs WHERE id = ?", (codec_id,)).fetchone()
+    assert (trained is not None) == dictionary
+    assert conn.execute("SELECT COUNT(*) FROM articles WHERE codec_id IS NULL").fetchone()[0] == 0
+    # Undo the rewrite for one row, as if it had been stored before compression
+    with conn:
+        conn.execute("UPDATE articles SET article = 'plain article', codec_id = NULL WHERE hash = 'plain'")
+    # Articles stored from now on use the new codec
+    writer = SongWriter(conn, "test")
+    writer.add(("new", "New", "Album", "new article"), 1, 0)
+    writer.flush()
+    assert conn.execute("SELECT codec_id FROM articles WHERE id = (SELECT article_id FROM songs WHERE id = 'new')").fetchone() == (codec_id,)
+    conn.close()
+
+    songs = [song for batch in load_data_in_batches(db_path, batch_size=16, as_tuples=True) for song in batch]
+    assert songs == expected + [("new", "New", "new article")]
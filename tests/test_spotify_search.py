@@ -0,0 +1,108 @@
+import time
+import pytest
+import spotipy
+from spotipy.exceptions import SpotifyException
+from benchmarks.synthetic import synthetic_catalog
+from mock_servers import start_mock_spotify, track_matches
+from spotify_search import TokenBucket, fetch_results, search_all_pages, refine_query, planned_search
+from track_store import TrackCatalog
+
+
+@pytest.fixture
+def spotify():
+    catalog = synthetic_catalog(2000)
+    server, api_prefix = start_mock_spotify(catalog)
+    # Only retry 5xx inside spotipy, so 429s reach the rate limiter
+    sp_client = spotipy.Spotify(auth="mock-token", retries=0, status_retries=0, status_forcelist=(500, 502, 503, 504))
+    sp_client.prefix = api_prefix
+
+    def search(query, limit, offset):
+        return sp_client.search(q=query, type="track", limit=limit, offset=offset)
+    yield catalog, server, search
+    server.shutdown()
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=50, capacity=5)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_fetch_waits_out_retry_after():
+    calls = []
+
+    def search(query, limit, offset):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise SpotifyException(429, -1, "API rate limit exceeded", headers={"Retry-After": "0.2"})
+        return {"tracks": {"items": [], "total": 0}}
+
+    assert fetch_results(search, "query", 0, 50, TokenBucket(rate=100, capacity=10)) == {"items": [], "total": 0}
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.2
+
+
+def test_fetch_raises_other_errors_straight_away():
+    def search(query, limit, offset):
+        raise SpotifyException(400, -1, "Invalid limit or offset")
+
+    with pytest.raises(SpotifyException):
+        fetch_results(search, "query", 0, 50, TokenBucket(rate=100, capacity=10))
+
+
+def test_rate_limited_server_still_returns_every_page(spotify):
+    catalog, server, search = spotify
+    # The bucket allows more than the server does, so some pages get a 429 and are retried after a second
+    server.rate_limit = 8
+    tracks, stats = search_all_pages(search, "artist 3", TokenBucket(rate=1000, capacity=10), workers=4)
+    assert server.throttled_count > 0
+    assert tracks == [track for track in catalog if track_matches(track, "artist 3")]
+
+
+def test_search_stops_at_the_first_short_page(spotify):
+    catalog, server, search = spotify
+    expected = [track for track in catalog if track_matches(track, "artist 12")]
+    assert 50 < len(expected) < 1000
+    tracks, stats = search_all_pages(search, "artist 12", TokenBucket(rate=1000, capacity=10), workers=4)
+    assert tracks == expected
+    assert stats["pages"] == len(expected) // 50 + 1 and not stats["stopped_early"]
+
+
+def test_search_stops_once_pages_are_mostly_seen(spotify):
+    catalog, server, search = spotify
+    tracks, stats = search_all_pages(search, "artist", TokenBucket(rate=1000, capacity=10), workers=1,
+                                     unseen=lambda tracks: [], min_novelty=0.1, patience=2)
+    assert stats["stopped_early"]
+    assert stats["pages"] == 2 and len(tracks) == 100 and stats["new_tracks"] == 0
+
+
+def test_refine_query_halves_years_then_adds_genres():
+    assert refine_query("rock", years=(2000, 2003)) == ["rock year:2000-2001", "rock year:2002-2003"]
+    assert refine_query("rock year:2000-2001") == ["rock year:2000", "rock year:2001"]
+    assert refine_query("rock year:2001", genres=("pop", "jazz")) == ["rock year:2001 genre:pop", "rock year:2001 genre:jazz"]
+    assert refine_query("rock year:2001 genre:pop") == []
+
+
+def test_planned_search_reaches_tracks_past_the_cap(spotify, tmp_path):
+    catalog, server, search = spotify
+    expected = {track["id"] for track in catalog if track_matches(track, "album")}
+    assert len(expected) > 1000
+
+    harvested = TrackCatalog(str(tmp_path / "tracks.db"))
+    bucket = TokenBucket(rate=1000, capacity=10)
+    queries, stored = [], 0
+    for query, total, tracks in planned_search(search, ["album"], bucket, max_offset=500):
+        assert all(track_matches(track, "album") for track in tracks)
+        new = harvested.unseen(tracks)
+        harvested.add(new)
+        queries.append(query)
+        stored += len(new)
+    assert {track["id"] for rowid, track in harvested.iter_tracks()} == expected
+    # Split queries overlap with their refinements, but each track is stored once
+    assert stored == len(harvested) == len(expected)
+    assert queries[0] == "album" and len(queries) > 1
+    harvested.close()
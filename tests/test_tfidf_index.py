@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from scoring import build_song_index
+from songs_db import connect_songs_db, songs_generation, SongWriter
+from tfidf_index import fit_vectorizer_streaming, save_index, load_index, StaleIndexError
+
+DOCUMENTS = [
+    "sing song sing album",
+    "album release chart",
+    "song chart single record",
+    "record label album album",
+    "café zebra über",
+]
+
+
+def assert_same_fit(fitted, expected):
+    assert fitted.vocabulary == expected.vocabulary_
+    np.testing.assert_allclose(fitted.idf_, expected.idf_)
+    np.testing.assert_allclose(fitted.transform(DOCUMENTS).toarray(), expected.transform(DOCUMENTS).toarray())
+
+
+def test_streaming_fit_matches_fit():
+    fitted = fit_vectorizer_streaming(TfidfVectorizer(stop_words=None), iter(DOCUMENTS))
+    assert_same_fit(fitted, TfidfVectorizer(stop_words=None).fit(DOCUMENTS))
+
+
+def test_streaming_fit_counts_repeated_documents():
+    counts = [3, 1, 0, 2]
+    fitted = fit_vectorizer_streaming(TfidfVectorizer(stop_words=None), iter(DOCUMENTS), counts)
+    repeated = [document for document, count in zip(DOCUMENTS, counts) for _ in range(count)]
+    assert_same_fit(fitted, TfidfVectorizer(stop_words=None).fit(repeated))
+
+
+@pytest.fixture
+def saved_index(tmp_path):
+    db_path = str(tmp_path / "songs.db")
+    connect_songs_db(db_path).close()
+    vectorizer = TfidfVectorizer(stop_words=None)
+    matrix = vectorizer.fit_transform(DOCUMENTS)
+    song_index = build_song_index([f"song {i}" for i in range(len(DOCUMENTS))], matrix, [f"id{i}" for i in range(len(DOCUMENTS))])
+    save_index(str(tmp_path / "index"), song_index, vectorizer, songs_generation(db_path))
+    return db_path, str(tmp_path / "index"), song_index, vectorizer
+
+
+def test_loaded_index_matches_fitted_vectorizer(saved_index):
+    db_path, index_dir, song_index, vectorizer = saved_index
+    loaded_index, loaded_vectorizer = load_index(index_dir, db_path)
+    assert list(loaded_index["titles"]) == list(song_index["titles"])
+    assert list(loaded_index["song_ids"]) == list(song_index["song_ids"])
+    np.testing.assert_allclose(loaded_index["matrix"].toarray(), song_index["matrix"].toarray(), rtol=1e-6)
+
+    queries = DOCUMENTS + ["album über unknown", "nothing known here", ""]
+    np.testing.assert_allclose(loaded_vectorizer.transform(queries).toarray(), vectorizer.transform(queries).toarray())
+
+
+def test_index_is_stale_after_songs_are_written(saved_index):
+    db_path, index_dir, song_index, vectorizer = saved_index
+    conn = connect_songs_db(db_path)
+    writer = SongWriter(conn, "test")
+    writer.add(("id9", "new song", "album", "new article"), 1, 1)
+    writer.flush()
+    conn.close()
+    with pytest.raises(StaleIndexError):
+        load_index(index_dir, db_path)
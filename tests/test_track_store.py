@@ -0,0 +1,35 @@
+import pytest
+from track_store import TrackCatalog
+
+
+def track(track_id, name="Track"):
+    return {"id": track_id, "name": name, "album": {"id": "album1", "name": "Album"}, "artists": [{"id": "artist1", "name": "Artist"}]}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = TrackCatalog(str(tmp_path / "tracks.db"))
+    yield catalog
+    catalog.close()
+
+
+def test_unseen_drops_repeats_within_a_batch(catalog):
+    tracks = [track("a"), track("b"), track("a", "Repeat"), track("c")]
+    assert catalog.unseen(tracks) == [tracks[0], tracks[1], tracks[3]]
+
+
+def test_unseen_drops_tracks_already_in_the_catalog(catalog):
+    catalog.add([track("a"), track("b")])
+    assert [t["id"] for t in catalog.unseen([track("b"), track("c"), track("a"), track("d")])] == ["c", "d"]
+
+
+def test_unseen_checks_more_ids_than_one_query_binds(catalog):
+    catalog.add([track(f"id{i}") for i in range(0, 1200, 2)])
+    assert [t["id"] for t in catalog.unseen([track(f"id{i}") for i in range(1200)])] == [f"id{i}" for i in range(1, 1200, 2)]
+
+
+def test_add_keeps_the_first_copy_of_an_id(catalog):
+    catalog.add([track("a", "First")])
+    catalog.add([track("a", "Second"), track("b")])
+    assert len(catalog) == 2
+    assert [(t["id"], t["name"]) for rowid, t in catalog.iter_tracks()] == [("a", "First"), ("b", "Track")]
@@ -0,0 +1,80 @@
+import pytest
+import xml.etree.ElementTree as ET
+import wiki_dump
+from songs_db import connect_songs_db, load_data_in_batches, SongWriter
+from track_store import TrackCatalog
+from wiki_dump import iter_dump_pages, ingest_dump
+
+DUMP = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11">
+  <siteinfo><sitename>Wikipedia</sitename></siteinfo>
+  <page><title>Talk:Yesterday (Beatles song)</title><ns>1</ns><id>1</id>
+    <revision><id>1</id><text>Yesterday is a song worth discussing.</text></revision></page>
+  <page><title>Yesterday</title><ns>0</ns><id>2</id><redirect title="Yesterday (Beatles song)" />
+    <revision><id>2</id><text>#REDIRECT [[Yesterday (Beatles song)]]</text></revision></page>
+  <page><title>Yesterday (film)</title><ns>0</ns><id>3</id>
+    <revision><id>3</id><text>Yesterday is a film with a song in it.</text></revision></page>
+  <page><title>Yesterday (Beatles song)</title><ns>0</ns><id>4</id>
+    <revision><id>4</id><text>'''Yesterday''' is a song by [[the Beatles]].&lt;ref&gt;cite&lt;/ref&gt;</text></revision></page>
+  <page><title>Help! (album)</title><ns>0</ns><id>5</id>
+    <revision><id>5</id><text>{{Infobox album}}'''Help!''' is an album. Its songs include Ticket to Ride.</text></revision></page>
+  <page><title>Run</title><ns>0</ns><id>6</id>
+    <revision><id>6</id><text>Run may be a song or a verb.
+{{disambiguation}}</text></revision></page>
+  <page><title>Category:Run</title><ns>14</ns><id>7</id>
+    <revision><id>7</id><text>Run is a song category.</text></revision></page>
+</mediawiki>
+"""
+
+
+@pytest.fixture
+def dump_path(tmp_path):
+    path = tmp_path / "dump.xml"
+    path.write_text(DUMP, encoding="utf-8")
+    return str(path)
+
+
+def test_dump_pages_skip_redirects_and_other_namespaces(dump_path):
+    titles = [title for title, text in iter_dump_pages(dump_path)]
+    assert titles == ["Yesterday (film)", "Yesterday (Beatles song)", "Help! (album)", "Run"]
+
+
+def test_dump_pages_are_cleared_as_they_stream(dump_path, monkeypatch):
+    roots = []
+    iterparse = ET.iterparse
+
+    def recording_iterparse(source, events):
+        for event, elem in iterparse(source, events):
+            if not roots:
+                roots.append(elem)
+            yield event, elem
+
+    monkeypatch.setattr(wiki_dump.ET, "iterparse", recording_iterparse)
+    read = []
+    for title, text in iter_dump_pages(dump_path):
+        # The parser may have read ahead, but no page already handed out is still attached
+        attached = [child.findtext("{http://www.mediawiki.org/xml/export-0.11/}title") for child in roots[0]]
+        assert not set(attached) & set(read)
+        read.append(title)
+    assert len(read) == 4
+
+
+def test_ingest_dump_matches_tracks_to_pages(dump_path, tmp_path):
+    catalog = TrackCatalog(str(tmp_path / "tracks.db"))
+    catalog.add([
+        {"id": "t1", "name": "Yesterday", "album": {"id": "a1", "name": "Help!"}, "artists": []},
+        {"id": "t2", "name": "Ticket to Ride", "album": {"id": "a1", "name": "Help!"}, "artists": []},
+        {"id": "t3", "name": "Run", "album": {"id": "a2", "name": "Run"}, "artists": []},
+    ])
+    conn = connect_songs_db(str(tmp_path / "songs.db"))
+    pages, elapsed, stored = ingest_dump(dump_path, catalog, SongWriter(conn, "ingest_wiki_dump"))
+    conn.close()
+    catalog.close()
+
+    assert (pages, stored) == (4, 2)
+    songs = [song for batch in load_data_in_batches(str(tmp_path / "songs.db"), as_tuples=True) for song in batch]
+    # The "(song)" page wins over "(film)", the album page stands in for a song without
+    # one, and the disambiguation page isn't used for either "Run"
+    assert songs == [
+        ("t1", "Yesterday", "Yesterday is a song by the Beatles."),
+        ("t2", "Ticket to Ride", "Help! is an album. Its songs include Ticket to Ride."),
+    ]
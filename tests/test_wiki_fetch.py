@@ -0,0 +1,79 @@
+import pytest
+from mock_servers import start_mock_wikipedia
+from songs_db import connect_songs_db
+from wiki_fetch import BatchArticleFetcher, ArticleLookupError, MISSING_TTL, fetch_song_articles_batched, fetch_titles
+
+
+def song(i, name, album=None):
+    return {"id": f"id{i}", "name": name, "album_id": album and f"album{i}", "album_name": album}
+
+
+@pytest.fixture
+def wikipedia_pages():
+    pages = {f"Track {i}": f"Track {i} is a song." for i in range(50)}
+    server, api_url = start_mock_wikipedia(pages)
+    yield server, api_url
+    server.shutdown()
+
+
+def test_title_with_a_pipe_does_not_split_the_batch(wikipedia_pages):
+    server, api_url = wikipedia_pages
+    songs = [song(i, f"Track {i}") for i in range(49)] + [song(49, "Either | Or")]
+    rows = list(fetch_song_articles_batched(songs, fetcher=BatchArticleFetcher(api_url=api_url, auto_suggest=False)))
+    assert [index for index, row in rows if row] == list(range(49))
+    assert len(rows) == 50
+
+
+def test_failed_lookups_stop_before_the_song():
+    pages = {"Track 0": "Track 0 is a song."}
+    server, api_url = start_mock_wikipedia(pages, maxlag_every=1)
+    try:
+        rows = fetch_song_articles_batched([song(0, "Track 0")], fetcher=BatchArticleFetcher(api_url=api_url))
+        with pytest.raises(ArticleLookupError):
+            next(rows)
+    finally:
+        server.shutdown()
+
+
+def test_fetch_titles_maps_results_back_to_the_titles_asked_for():
+    pages = {"Track 0": "Track 0 is a song.", "Track 1 (song)": "Track 1 is a song.", "Track": "Track may refer to:"}
+    server, api_url = start_mock_wikipedia(pages, redirects={"Track 1": "Track 1 (song)"}, disambiguations={"Track": ["Track 0"]})
+    try:
+        results = fetch_titles(["track_0", "Track 1", "Track", "Track 2"], api_url=api_url)
+    finally:
+        server.shutdown()
+    assert results == {
+        "track_0": ("hit", "Track 0 is a song."),
+        "Track 1": ("hit", "Track 1 is a song."),
+        "Track": ("disambiguation", None),
+        "Track 2": ("missing", None),
+    }
+
+
+def test_fetch_titles_merges_continued_responses(wikipedia_pages):
+    server, api_url = wikipedia_pages
+    titles = [f"Track {i}" for i in range(5)]
+    results = fetch_titles(titles, api_url=api_url)
+    # The mock, like MediaWiki, sends one whole-page extract per response
+    assert server.request_count == 5
+    assert results == {title: ("hit", f"{title} is a song.") for title in titles}
+
+
+def test_missing_albums_are_looked_up_again_after_missing_ttl(wikipedia_pages, tmp_path):
+    server, api_url = wikipedia_pages
+    conn = connect_songs_db(str(tmp_path / "songs.db"))
+    songs = [song(0, "Unknown Song", "New Album")]
+
+    fetcher = BatchArticleFetcher(api_url=api_url, auto_suggest=False)
+    assert list(fetch_song_articles_batched(songs, fetcher=fetcher, conn=conn)) == [(0, None)]
+    # The album's miss is remembered in songs.db
+    assert list(fetch_song_articles_batched(songs, fetcher=fetcher, conn=conn)) == [(0, None)]
+    assert fetcher.titles_fetched == 3
+
+    server.pages["New Album"] = "New Album is an album. Its lead song is Unknown Song."
+    server.page_ids["New Album"] = len(server.page_ids) + 1
+    with conn:
+        conn.execute("UPDATE albums SET fetched_at = fetched_at - ?", (MISSING_TTL + 1,))
+    rows = list(fetch_song_articles_batched(songs, fetcher=fetcher, conn=conn))
+    assert rows == [(0, ("id0", "Unknown Song", "New Album", server.pages["New Album"]))]
+    conn.close()
@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import pickle
+import tempfile
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from itertools import repeat, tee
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from preprocessing import ArticlePreprocessor, preprocessing_fingerprint
+from scoring import build_song_index
+from songs_db import (
+    load_data_in_batches,
+    load_articles_in_batches,
+    load_article_texts,
+    load_song_article_ids,
+    songs_generation,
+    open_songs_db,
+    article_hash,
+    connect_terms_db,
+    load_processed_terms,
+    save_processed_terms,
+    prune_processed_articles,
+)
+
+# Bump whenever the on-disk layout written by save_index changes
+INDEX_VERSION = 3
+
+
+class StaleIndexError(Exception):
+    """The index on disk was built from different songs.db contents or an older layout."""
+
+
+def fit_vectorizer_streaming(vectorizer, documents, counts=None):
+    """
+    Fit a TfidfVectorizer over a stream of documents without holding them in memory.
+
+    One pass counts document frequencies with the vectorizer's own analyzer, then the
+    vocabulary and IDF weights are fixed on the vectorizer so every later transform uses
+    the same feature space. The result matches vectorizer.fit(list(documents)) exactly
+    for the default min_df/max_df/max_features settings.
+
+    Args:
+        vectorizer (TfidfVectorizer): Unfitted vectorizer; its analyzer and IDF settings are used.
+        documents (iterable): Document strings, e.g. a generator over batches.
+        counts (iterable, optional): How many times each document occurs in the corpus,
+            so a document shared by several songs is analyzed once but counted for each.
+            Documents with a count of 0 are left out.
+    """
+    analyzer = vectorizer.build_analyzer()
+    document_frequencies = Counter()
+    n_documents = 0
+    for document, count in zip(documents, counts if counts is not None else repeat(1)):
+        if count == 0:
+            continue
+        terms = set(analyzer(document))
+        if count == 1:
+            document_frequencies.update(terms)
+        else:
+            document_frequencies.update(dict.fromkeys(terms, count))
+        n_documents += count
+
+    # TfidfVectorizer numbers its features in sorted term order
+    terms = sorted(document_frequencies)
+    vocabulary = {term: index for index, term in enumerate(terms)}
+    df = np.array([document_frequencies[term] for term in terms], dtype=np.float64)
+
+    # Same formula as sklearn's TfidfTransformer
+    if vectorizer.smooth_idf:
+        df += 1
+        n_documents += 1
+    idf = np.log(n_documents / df) + 1
+
+    vectorizer.set_params(vocabulary=vocabulary)
+    vectorizer.idf_ = idf.astype(vectorizer.dtype, copy=False)
+    return vectorizer
+
+
+def spill_batches(batches, spill_file):
+    """Yield each batch unchanged while pickling it to spill_file for a second pass."""
+    for batch in batches:
+        pickle.dump(batch, spill_file)
+        yield batch
+
+
+def read_spilled_batches(spill_file):
+    """Yield the batches written by spill_batches, in order."""
+    spill_file.seek(0)
+    while True:
+        try:
+            yield pickle.load(spill_file)
+        except EOFError:
+            return
+
+
+class _Progress:
+    # Prints how far preprocess_batches/preprocess_articles have got every `every` items
+    def __init__(self, unit, every):
+        self.unit = unit
+        self.every = every
+        self.done = 0
+        self.preprocessed = 0
+        self.start = time.time()
+
+    def update(self, done, preprocessed):
+        previous, self.done = self.done, self.done + done
+        self.preprocessed += preprocessed
+        if self.done // self.every != previous // self.every:
+            print(f"{self.done} {self.unit} in {time.time() - self.start:.1f} seconds, "
+                  f"{self.preprocessed} articles preprocessed and the rest read from the terms store")
+
+
+def preprocess_batches(db_path, batch_size=1000, progress_every=1000, workers=1, tokenizer="nltk", preprocessor=None):
+    """
+    Yield (song_ids, processed_data) for every batch in the database.
+
+    Preprocessed terms are kept in a store next to songs.db (see connect_terms_db),
+    keyed by article hash and preprocessing config, so only new or changed articles
+    are tokenized, stemmed and lemmatized; the rest are read back from the store.
+    New articles go through preprocessor, an ArticlePreprocessor (one with workers
+    and tokenizer is started for this call if none is given). After a full pass,
+    terms this tokenizer stored under an older config, or for articles that are
+    gone, are deleted. songs.db itself is only read. Progress is printed every
+    progress_every songs.
+    """
+    with nullcontext(preprocessor) if preprocessor else ArticlePreprocessor(workers, tokenizer) as preprocessor:
+        config = preprocessing_fingerprint(preprocessor.tokenizer)
+        conn = connect_terms_db(db_path)
+        progress = _Progress("songs", progress_every)
+
+        for batch_data in load_data_in_batches(db_path, batch_size, as_tuples=True):
+            hashes = [article_hash(article) for song_id, name, article in batch_data]
+            processed_terms = load_processed_terms(conn, set(hashes), config)
+
+            # Preprocess each missing article once, even if several songs share it
+            missing = {}
+            for (song_id, name, article), hash_value in zip(batch_data, hashes):
+                if hash_value not in processed_terms and hash_value not in missing:
+                    missing[hash_value] = article
+            if missing:
+                new_terms = {hash_value: terms for hash_value, terms in preprocessor.preprocess(missing.items())}
+                save_processed_terms(conn, new_terms, config, preprocessor.tokenizer)
+                processed_terms.update(new_terms)
+
+            processed_batch = [[name, processed_terms[hash_value]] for (song_id, name, article), hash_value in zip(batch_data, hashes)]
+            progress.update(len(batch_data), len(missing))
+            yield [song_id for song_id, name, article in batch_data], processed_batch
+
+        prune_processed_articles(conn, config, preprocessor.tokenizer)
+        conn.close()
+
+
+def preprocess_articles(db_path, batch_size=1000, progress_every=1000, workers=1, tokenizer="nltk", preprocessor=None):
+    """
+    Yield (article_ids, terms) for every distinct article in the database, batch by batch.
+
+    Like preprocess_batches, terms come from the terms store when the
+    article was preprocessed before, but each article is read and handled once however
+    many songs share it. Article text is only read (and decompressed) for articles
+    that aren't in the store yet. The store is pruned the same way after a full pass,
+    and progress is printed every progress_every articles.
+    """
+    with nullcontext(preprocessor) if preprocessor else ArticlePreprocessor(workers, tokenizer) as preprocessor:
+        config = preprocessing_fingerprint(preprocessor.tokenizer)
+        conn = connect_terms_db(db_path)
+        songs_conn = open_songs_db(db_path)
+        progress = _Progress("articles", progress_every)
+
+        for batch in load_articles_in_batches(db_path, batch_size, with_text=False):
+            processed_terms = load_processed_terms(conn, [hash_value for article_id, hash_value in batch], config)
+            missing = {article_id: hash_value for article_id, hash_value in batch if hash_value not in processed_terms}
+            if missing:
+                texts = load_article_texts(songs_conn, missing)
+                rows = [(hash_value, texts[article_id]) for article_id, hash_value in missing.items()]
+                new_terms = {hash_value: terms for hash_value, terms in preprocessor.preprocess(rows)}
+                save_processed_terms(conn, new_terms, config, preprocessor.tokenizer)
+                processed_terms.update(new_terms)
+            progress.update(len(batch), len(missing))
+            yield [article_id for article_id, hash_value in batch], [processed_terms[hash_value] for article_id, hash_value in batch]
+
+        songs_conn.close()
+        prune_processed_articles(conn, config, preprocessor.tokenizer)
+        conn.close()
+
+
+def build_index(db_path, index_dir, batch_size=1000, workers=1, tokenizer="nltk", two_phase=True):
+    """
+    Preprocess and vectorize all of songs.db and write the result to index_dir.
+
+    Each distinct article is preprocessed and vectorized once; songs sharing an
+    article point at the same matrix row. IDF still counts the article once per
+    song, so scores match an index built song by song. Memory during preprocessing
+    is bounded by batch_size; only the final sparse matrix is held in memory before
+    it is written out. workers > 1 preprocesses across that many processes, on one
+    pool started for the whole build. tokenizer is one of preprocessing.TOKENIZERS
+    and is recorded with the index, so queries can be tokenized the same way.
+    two_phase normalizes each distinct word once for the whole build (see
+    ArticlePreprocessor) instead of token by token; the index is the same.
+    """
+    # Read before any songs, so writes made during the build leave the index stale
+    generation = songs_generation(db_path)
+    vectorizer = TfidfVectorizer(stop_words=None)
+    song_ids, titles, song_article_ids = load_song_article_ids(db_path)
+    songs_per_article = Counter(song_article_ids)
+
+    with ArticlePreprocessor(workers, tokenizer, two_phase) as preprocessor, tempfile.TemporaryFile() as spill_file:
+        print("Building the TF-IDF vocabulary...")
+        batches = spill_batches(preprocess_articles(db_path, batch_size, preprocessor=preprocessor), spill_file)
+        # Both halves are consumed in lockstep, so tee only ever buffers one item
+        documents, counts = tee(
+            (" ".join(tokens), songs_per_article[article_id])
+            for article_ids, terms in batches for article_id, tokens in zip(article_ids, terms)
+        )
+        fit_vectorizer_streaming(vectorizer, (document for document, count in documents), (count for document, count in counts))
+
+        print("Vectorizing articles...")
+        article_rows, article_vectors = {}, []
+        for article_ids, terms in read_spilled_batches(spill_file):
+            first_row = len(article_rows)
+            article_rows.update((article_id, first_row + offset) for offset, article_id in enumerate(article_ids))
+            batch_vectors = vectorizer.transform([" ".join(tokens) for tokens in terms])
+            article_vectors.append(batch_vectors.astype(np.float32))
+
+    song_index = build_song_index(
+        titles,
+        sp.vstack(article_vectors, format='csr'),
+        song_ids,
+        article_rows=[article_rows[article_id] for article_id in song_article_ids],
+    )
+    save_index(index_dir, song_index, vectorizer, generation, tokenizer)
+    print(f"Index with {len(song_index['titles'])} songs and {song_index['matrix'].shape[0]} articles written to {index_dir}")
+
+
+class StringColumn:
+    """
+    Read-only sequence of strings stored as one UTF-8 byte array plus an offsets array.
+
+    Both arrays are memory-mapped, so opening a column reads nothing; a string is only
+    decoded when it is looked up. Indexing with an array of row ids returns an object
+    array, like the numpy arrays build_song_index returns.
+    """
+
+    def __init__(self, text, offsets):
+        self.text = text
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def encoded(self, row):
+        """Return the UTF-8 bytes of string row."""
+        return self.text[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            row = key + len(self) if key < 0 else key
+            if not 0 <= row < len(self):
+                raise IndexError(f"row {key} out of range for {len(self)} strings")
+            return self.encoded(row).decode('utf-8')
+        rows = range(*key.indices(len(self))) if isinstance(key, slice) else np.asarray(key).ravel()
+        return np.array([self[int(row)] for row in rows], dtype=object)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.encoded(row).decode('utf-8')
+
+
+def save_strings(index_dir, name, values):
+    """Write values as name_text.npy and name_offsets.npy for load_strings."""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(index_dir, f"{name}_text.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(index_dir, f"{name}_offsets.npy"), offsets)
+
+
+def _load_array(path):
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        # An empty array can't be memory-mapped
+        return np.load(path)
+
+
+def load_strings(index_dir, name):
+    """Memory-map a StringColumn written by save_strings."""
+    return StringColumn(
+        _load_array(os.path.join(index_dir, f"{name}_text.npy")),
+        _load_array(os.path.join(index_dir, f"{name}_offsets.npy")),
+    )
+
+
+class IndexVectorizer:
+    """
+    Turns query text into TF-IDF vectors in a saved index's feature space.
+
+    Gives the same vectors as the TfidfVectorizer the index was built with (default
+    analyzer, raw counts, l2 norm), but finds terms by binary search in the sorted,
+    memory-mapped vocabulary instead of building a dict of every term, so loading an
+    index doesn't read the vocabulary.
+    """
+
+    def __init__(self, vocabulary, idf):
+        self.vocabulary = vocabulary
+        self.idf_ = idf
+        self.analyzer = TfidfVectorizer(stop_words=None).build_analyzer()
+
+    def column(self, term):
+        """Return the feature index of term, or None if it isn't in the vocabulary."""
+        # UTF-8 byte order is code point order, the order the vocabulary was sorted in
+        encoded = term.encode('utf-8')
+        row = bisect_left(range(len(self.vocabulary)), encoded, key=self.vocabulary.encoded)
+        if row < len(self.vocabulary) and self.vocabulary.encoded(row) == encoded:
+            return row
+        return None
+
+    def transform(self, documents):
+        """Return the l2-normalized TF-IDF matrix of documents, one row each."""
+        indptr, indices, data = [0], [], []
+        for document in documents:
+            counts = {}
+            for term, count in Counter(self.analyzer(document)).items():
+                column = self.column(term)
+                if column is not None:
+                    counts[column] = count
+            for column in sorted(counts):
+                indices.append(column)
+                data.append(counts[column])
+            indptr.append(len(indices))
+        indices = np.asarray(indices, dtype=np.int64)
+        data = np.asarray(data, dtype=np.float64) * self.idf_[indices]
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.vocabulary)))
+        return normalize(matrix, norm='l2', copy=False)
+
+
+def save_index(index_dir, song_index, vectorizer, generation, tokenizer="nltk"):
+    """
+    Write a song index and its fitted vectorizer to index_dir.
+
+    The CSR arrays are stored as .npy files (float32 data, int32 indices/indptr), and
+    titles, song ids and the vocabulary as save_strings columns, so load_index can
+    memory-map all of it. generation is songs_generation() from when the build started.
+    meta.json is written last and acts as the commit marker: a half-written index has
+    no meta.json and won't load.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    meta_path = os.path.join(index_dir, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    matrix = song_index["matrix"]
+    if matrix.nnz > np.iinfo(np.int32).max:
+        raise ValueError(f"Index has {matrix.nnz} nonzeros, too many for int32 indptr")
+    np.save(os.path.join(index_dir, "data.npy"), matrix.data.astype(np.float32, copy=False))
+    np.save(os.path.join(index_dir, "indices.npy"), matrix.indices.astype(np.int32, copy=False))
+    np.save(os.path.join(index_dir, "indptr.npy"), matrix.indptr.astype(np.int32, copy=False))
+    np.save(os.path.join(index_dir, "idf.npy"), vectorizer.idf_)
+    np.save(os.path.join(index_dir, "article_rows.npy"), song_index["article_rows"].astype(np.int32, copy=False))
+
+    save_strings(index_dir, "vocabulary", vectorizer.get_feature_names_out())
+    save_strings(index_dir, "titles", song_index["titles"])
+    save_strings(index_dir, "song_ids", song_index["song_ids"])
+
+    meta = {"version": INDEX_VERSION, "generation": generation, "shape": list(matrix.shape), "tokenizer": tokenizer}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+
+def load_index_meta(index_dir):
+    """Return the meta.json save_index wrote to index_dir, or None if there's no complete index there."""
+    try:
+        with open(os.path.join(index_dir, "meta.json"), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_index(index_dir, db_path):
+    """
+    Memory-map an index written by save_index and return (song_index, vectorizer).
+
+    Everything is opened read-only with mmap, so loading takes the same few
+    milliseconds however big the index is, and processes serving queries share the
+    same pages. Raises StaleIndexError if the index layout is outdated or songs were
+    written since the index was built; that check is one read of songs_meta.
+    """
+    meta = load_index_meta(index_dir)
+    if meta is None:
+        raise FileNotFoundError(f"No index in {index_dir}")
+    if meta["version"] != INDEX_VERSION:
+        raise StaleIndexError(f"Index version {meta['version']} is not supported (expected {INDEX_VERSION})")
+    if meta["generation"] != songs_generation(db_path):
+        raise StaleIndexError(f"{db_path} has changed since the index in {index_dir} was built")
+
+    data = _load_array(os.path.join(index_dir, "data.npy"))
+    indices = _load_array(os.path.join(index_dir, "indices.npy"))
+    indptr = _load_array(os.path.join(index_dir, "indptr.npy"))
+    matrix = sp.csr_matrix((data, indices, indptr), shape=tuple(meta["shape"]), copy=False)
+
+    song_index = {
+        "matrix": matrix,
+        "titles": load_strings(index_dir, "titles"),
+        "song_ids": load_strings(index_dir, "song_ids"),
+        "article_rows": _load_array(os.path.join(index_dir, "article_rows.npy")),
+        # Queries have to be tokenized the way the index was
+        "tokenizer": meta.get("tokenizer", "nltk"),
+    }
+    vectorizer = IndexVectorizer(load_strings(index_dir, "vocabulary"), _load_array(os.path.join(index_dir, "idf.npy")))
+
+    return song_index, vectorizer
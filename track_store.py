@@ -0,0 +1,125 @@
+import json
+import time
+import sqlite3
+
+
+# Columns kept for each track; everything else in Spotify's payload (markets, images,
+# external URLs, ...) is dropped
+CATALOG_COLUMNS = ("id", "name", "album_id", "album_name", "artist_ids", "artist_names", "popularity", "duration_ms", "release_date")
+
+
+def project_track(track):
+    """Reduce a Spotify track payload to a catalog row, in CATALOG_COLUMNS order."""
+    album = track.get('album') or {}
+    artists = track.get('artists') or []
+    return (
+        track['id'],
+        track['name'],
+        album.get('id'),
+        album.get('name'),
+        json.dumps([artist['id'] for artist in artists]),
+        json.dumps([artist['name'] for artist in artists]),
+        track.get('popularity'),
+        track.get('duration_ms'),
+        album.get('release_date'),
+    )
+
+
+class TrackCatalog:
+    """
+    SQLite catalog of harvested tracks, one compact typed row per Spotify track id.
+
+    The id primary key doubles as the dedup set: membership checks are a B-tree
+    lookup, so they stay fast with tens of millions of tracks without holding the
+    ids in memory.
+    """
+
+    def __init__(self, db_path='tracks.db'):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS tracks (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            album_id TEXT,
+            album_name TEXT,
+            artist_ids TEXT,
+            artist_names TEXT,
+            popularity INTEGER,
+            duration_ms INTEGER,
+            release_date TEXT
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS query_stats (
+            query TEXT PRIMARY KEY,
+            pages INTEGER,
+            tracks INTEGER,
+            new_tracks INTEGER,
+            stopped_early INTEGER,
+            searched_at REAL
+        )
+        ''')
+        self.conn.commit()
+
+    def unseen(self, tracks):
+        """Return the tracks whose id isn't in the catalog yet, each id once, in their original order."""
+        by_id = {}
+        for track in tracks:
+            by_id.setdefault(track['id'], track)
+
+        ids = list(by_id)
+        seen = set()
+        # Stay well under SQLite's limit on bound parameters
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            seen.update(row[0] for row in self.conn.execute(f"SELECT id FROM tracks WHERE id IN ({placeholders})", chunk))
+        return [track for track_id, track in by_id.items() if track_id not in seen]
+
+    def add(self, tracks):
+        """Project Spotify track payloads and store them, ignoring ids already in the catalog."""
+        self.add_records(project_track(track) for track in tracks)
+
+    def add_records(self, records):
+        """Store rows already produced by project_track."""
+        placeholders = ",".join("?" * len(CATALOG_COLUMNS))
+        with self.conn:
+            self.conn.executemany(f"INSERT OR IGNORE INTO tracks ({', '.join(CATALOG_COLUMNS)}) VALUES ({placeholders})", records)
+
+    def iter_tracks(self, after_rowid=0, batch_size=1000):
+        """Yield (rowid, track dict) in insertion order, starting after after_rowid."""
+        query = f"SELECT rowid, {', '.join(CATALOG_COLUMNS)} FROM tracks WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        while True:
+            rows = self.conn.execute(query, (after_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                track = dict(zip(CATALOG_COLUMNS, row[1:]))
+                track['artist_ids'] = json.loads(track['artist_ids'])
+                track['artist_names'] = json.loads(track['artist_names'])
+                yield row[0], track
+            after_rowid = rows[-1][0]
+
+    def record_query(self, query, stats):
+        """Save the stats search_all_pages returned for query, replacing those from any earlier run."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO query_stats (query, pages, tracks, new_tracks, stopped_early, searched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (query, stats["pages"], stats["tracks"], stats["new_tracks"], int(stats["stopped_early"]), time.time()),
+            )
+
+    def query_stats(self):
+        """Return {query: stats} for every query recorded with record_query."""
+        rows = self.conn.execute("SELECT query, pages, tracks, new_tracks, stopped_early FROM query_stats")
+        return {
+            query: {"pages": pages, "tracks": tracks, "new_tracks": new_tracks, "stopped_early": bool(stopped_early)}
+            for query, pages, tracks, new_tracks, stopped_early in rows
+        }
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
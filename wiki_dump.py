@@ -0,0 +1,155 @@
+"""
+Offline ingestion from a Wikipedia pages-articles XML dump.
+
+Instead of asking the API for one title at a time, the whole dump is streamed once,
+and every page whose title matches a song or album in the tracks.db catalog is
+kept. The matching pages are then joined back to the tracks and written to songs.db
+with the same relevance check wiki_fetch applies to API results.
+"""
+import os
+import re
+import bz2
+import time
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+from wiki_fetch import song_row, wikitext_to_text
+
+
+# Tracks are matched on a page's title without a trailing "(... song)" or "(album)" qualifier
+QUALIFIER = re.compile(r"^(.*?)\s*\(([^()]*)\)$")
+DISAMBIGUATION = re.compile(r"\{\{\s*(disambig|dab|hndis|geodis|song disambiguation)[^}]*\}\}", re.IGNORECASE)
+
+
+def title_key(title):
+    """Normalized form of a song, album or page title used to match them up."""
+    return " ".join(title.replace('_', ' ').split()).casefold()
+
+
+def split_title(title):
+    """Split a page title into (key, qualifier), e.g. "Yesterday (Beatles song)" -> ("yesterday", "beatles song")."""
+    match = QUALIFIER.match(title)
+    if match:
+        return title_key(match.group(1)), match.group(2).casefold()
+    return title_key(title), ""
+
+
+def build_title_index(catalog):
+    """Return the set of title keys of every track and album name in a TrackCatalog."""
+    index = set()
+    for rowid, track in catalog.iter_tracks():
+        index.add(title_key(track['name']))
+        if track['album_name']:
+            index.add(title_key(track['album_name']))
+    return index
+
+
+def open_dump(path):
+    return bz2.open(path, 'rb') if path.endswith('.bz2') else open(path, 'rb')
+
+
+def iter_dump_pages(path):
+    """
+    Stream (title, text) for every article in a dump, skipping other namespaces and
+    redirects (their targets are matched on their own title, qualifier stripped).
+
+    Elements are cleared as soon as each page has been read, so memory use doesn't
+    grow with the size of the dump.
+    """
+    with open_dump(path) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        event, root = next(context)
+        # Tags carry the export schema's namespace, which changes between dump versions
+        namespace = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+        for event, elem in context:
+            if event != 'end' or elem.tag != namespace + 'page':
+                continue
+            if elem.findtext(namespace + 'ns') == '0' and elem.find(namespace + 'redirect') is None:
+                yield elem.findtext(namespace + 'title'), elem.findtext(f"{namespace}revision/{namespace}text") or ''
+            root.clear()
+
+
+def scan_dump(path, title_index, staging, progress_every=100_000):
+    """
+    Stream a dump into the staging database, keeping only pages whose title is in title_index.
+
+    Returns:
+        (pages, matched, elapsed): pages read, pages kept and seconds taken.
+    """
+    staging.execute("CREATE TABLE IF NOT EXISTS dump_pages (key TEXT, qualifier TEXT, article TEXT)")
+    batch = []
+    pages = matched = 0
+    start = time.time()
+    for title, text in iter_dump_pages(path):
+        pages += 1
+        key, qualifier = split_title(title)
+        if key in title_index and not DISAMBIGUATION.search(text):
+            batch.append((key, qualifier, wikitext_to_text(text)))
+            matched += 1
+            if len(batch) >= 1000:
+                with staging:
+                    staging.executemany("INSERT INTO dump_pages VALUES (?, ?, ?)", batch)
+                batch = []
+        if pages % progress_every == 0:
+            print(f"{pages} pages, {matched} matched, {pages / (time.time() - start):.0f} pages/sec")
+    with staging:
+        staging.executemany("INSERT INTO dump_pages VALUES (?, ?, ?)", batch)
+        staging.execute("CREATE INDEX IF NOT EXISTS dump_pages_key ON dump_pages (key)")
+    return pages, matched, time.time() - start
+
+
+def _pick_article(candidates, preferred):
+    # Prefer a page qualified like "(song)" / "(album)", then the unqualified title
+    for qualifier, article in candidates:
+        if any(word in qualifier for word in preferred):
+            return article
+    for qualifier, article in candidates:
+        if not qualifier:
+            return article
+    return None
+
+
+def match_tracks(catalog, staging, batch_size=1000):
+    """
+    Yield (rowid, row) for every catalog track, where row is (id, name, album, article)
+    ready for songs, or None when the dump had no relevant article for it.
+    """
+    def candidates(key):
+        return staging.execute("SELECT qualifier, article FROM dump_pages WHERE key = ?", (key,)).fetchall()
+
+    for rowid, track in catalog.iter_tracks(batch_size=batch_size):
+        name, album = track['name'], track['album_name'] or ''
+        article = _pick_article(candidates(title_key(name)), ("song", "single"))
+        if article is None and album:
+            article = _pick_article(candidates(title_key(album)), ("album", "soundtrack"))
+        yield rowid, song_row(track, article)
+
+
+def ingest_dump(path, catalog, writer, staging_path=None):
+    """
+    Load articles for every catalog track from a dump into songs.db.
+
+    Args:
+        path (str): pages-articles XML dump, plain or .bz2.
+        catalog (TrackCatalog): Tracks to find articles for.
+        writer (SongWriter): Where matched rows are written.
+        staging_path (str, optional): Where to keep matched pages between the scan and
+            the join. Defaults to a temporary file.
+    """
+    print("Building title index...")
+    title_index = build_title_index(catalog)
+    print(f"{len(title_index)} song and album titles")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        staging = sqlite3.connect(staging_path or os.path.join(tmp, "dump_pages.db"))
+        pages, matched, elapsed = scan_dump(path, title_index, staging)
+        print(f"Scanned {pages} pages in {elapsed:.1f} seconds ({pages / elapsed:.0f} pages/sec), {matched} matched a title")
+
+        stored = 0
+        for rowid, row in match_tracks(catalog, staging):
+            writer.add(row, rowid, 0)
+            stored += row is not None
+        writer.flush()
+        staging.close()
+    print(f"Stored articles for {stored} tracks")
+    return pages, elapsed, stored
@@ -0,0 +1,362 @@
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import wikipedia
+from response_cache import DAY
+from songs_db import load_album_articles, save_album_articles
+
+
+# How long cached lookups are trusted. Misses are rechecked sooner, since a page may be written later
+ARTICLE_TTL = 30 * DAY
+MISSING_TTL = 7 * DAY
+
+API_URL = "https://en.wikipedia.org/w/api.php"
+# The most titles MediaWiki resolves in one query for normal clients
+MAX_TITLES = 50
+# Ask the API to refuse requests while replication lag is over this many seconds
+MAXLAG = 5
+# Attempts per request for connection errors, 429s, 5xx responses and maxlag errors
+RETRIES = 5
+# Starting a multi-value parameter with this makes it the separator instead of "|",
+# so a title containing "|" can't split the list
+MULTI_VALUE_SEPARATOR = "\x1f"
+
+
+class ArticleLookupError(RuntimeError):
+    """Lookups for some songs failed even after retries, so they can't be stored or skipped yet."""
+
+
+def get_wikipedia_article(song_title, cache=None):
+    """
+    Return the content of song_title's Wikipedia page, or None if there isn't one.
+
+    With a ResponseCache, found pages, missing pages and disambiguation pages are all
+    remembered. Other errors (timeouts, server errors) aren't, so they're retried next time.
+    """
+    if cache is not None:
+        cached = cache.get('wikipedia.page', song_title)
+        if cached is not None:
+            return cached[1]
+
+    try:
+        page = wikipedia.page(song_title)
+        content = page.content
+    except wikipedia.exceptions.PageError:
+        kind = 'missing'
+    except wikipedia.exceptions.DisambiguationError:
+        kind = 'disambiguation'
+    except Exception:
+        return None
+    else:
+        if cache is not None:
+            cache.put('wikipedia.page', song_title, content, ARTICLE_TTL)
+        return content
+
+    if cache is not None:
+        cache.put('wikipedia.page', song_title, None, MISSING_TTL, kind)
+    return None
+
+
+def fetch_song_article(song, fetch=get_wikipedia_article):
+    """
+    Find the article for a track from the tracks.db catalog, falling back to its album's article.
+
+    Returns song_row's result.
+    """
+    name = song['name']
+    album = song['album_name']
+
+    article = fetch(name)
+    if not article and album:
+        article = fetch(album)
+    return song_row(song, article)
+
+
+def song_row(song, article):
+    """
+    Return (id, name, album, article) ready to insert into songs, or None when there
+    is no article or it doesn't look like it's about the song.
+    """
+    name, album = song['name'], song['album_name']
+    if not article or not (name in article or (album and album in article)) or ("song" not in article):
+        return None
+    return (song['id'], name, album, article)
+
+
+def fetch_song_articles(songs, start_index=0, workers=8, fetch=get_wikipedia_article):
+    """
+    Fetch articles for songs[start_index:] on a pool of threads.
+
+    Yields (index, row) in song order, where row is fetch_song_article's result.
+    At most 2 * workers lookups are in flight, and because results come back in
+    order the caller can save index + 1 as its progress after handling each one.
+    """
+    songs_iter = iter(range(start_index, len(songs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                index = next(songs_iter, None)
+                if index is None:
+                    break
+                pending.append((index, pool.submit(fetch_song_article, songs[index], fetch)))
+            if not pending:
+                break
+            index, future = pending.popleft()
+            yield index, future.result()
+
+
+def wikitext_to_text(text):
+    """Roughly turn wikitext into the plain text wikipedia.page().content would give."""
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.DOTALL)
+    text = re.sub(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", "", text, flags=re.DOTALL)
+    # Templates nest, so strip the innermost ones until none are left
+    previous = None
+    while previous != text:
+        previous = text
+        text = re.sub(r"\{\{[^{}]*\}\}", "", text)
+    text = re.sub(r"\{\|.*?\|\}", "", text, flags=re.DOTALL)
+    text = re.sub(r"\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"\[\[(?:[^|\]]*\|)?([^\]]*)\]\]", r"\1", text)
+    text = re.sub(r"\[https?://[^\s\]]+\s*([^\]]*)\]", r"\1", text)
+    text = re.sub(r"'{2,}", "", text)
+    text = re.sub(r"^(=+)\s*(.*?)\s*\1\s*$", r"\2", text, flags=re.MULTILINE)
+    text = re.sub(r"<[^>]+>", "", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def api_get(params, session=None, api_url=API_URL, retries=RETRIES, backoff=1.0):
+    """
+    Send one MediaWiki API request and return its decoded JSON.
+
+    Connection errors, timeouts, 429s, 5xx responses and maxlag errors are retried up
+    to retries times. Each retry waits for the server's Retry-After if it sent one,
+    and otherwise backs off exponentially from backoff seconds.
+
+    Raises:
+        requests.RequestException or RuntimeError once the retries are used up, or
+        straight away for any other HTTP or API error.
+    """
+    session = session or requests
+    params = {**params, "maxlag": MAXLAG}
+    for attempt in range(retries + 1):
+        last_attempt = attempt == retries
+        try:
+            response = session.get(api_url, params=params, timeout=30)
+        except (requests.ConnectionError, requests.Timeout):
+            if last_attempt:
+                raise
+            retry_after = None
+        else:
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                result = response.json()
+                error = result.get("error")
+                if error is None:
+                    return result
+                # Don't let an API error look like a batch of missing pages
+                if error.get("code") != "maxlag" or last_attempt:
+                    raise RuntimeError(f"MediaWiki error: {error.get('info')}")
+            elif last_attempt:
+                response.raise_for_status()
+        time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt)
+
+
+def fetch_titles(titles, session=None, api_url=API_URL):
+    """
+    Look up to MAX_TITLES titles in one MediaWiki query.
+
+    Normalizations ("foo_bar" -> "Foo bar") and redirects are followed inside the
+    same request, and the results are mapped back to the titles as they were asked for.
+    Articles are the plain-text extracts wikipedia.page().content returns. MediaWiki
+    sends one whole-page extract per response, so each hit costs a continuation
+    request, but misses and disambiguation pages are settled by the first one.
+
+    Returns:
+        dict: Title to (kind, article), where kind is 'hit', 'missing' or
+            'disambiguation' and article is None unless kind is 'hit'.
+
+    Raises:
+        requests.RequestException or RuntimeError if the request still fails after
+        api_get's retries, so a failed batch is never mistaken for missing pages.
+    """
+    params = {
+        "action": "query", "format": "json", "redirects": 1,
+        "titles": MULTI_VALUE_SEPARATOR + MULTI_VALUE_SEPARATOR.join(titles),
+        "prop": "extracts|pageprops", "explaintext": 1, "exlimit": "max", "ppprop": "disambiguation",
+    }
+    pages, normalized, redirects = {}, {}, {}
+    while True:
+        response = api_get(params, session, api_url)
+        query = response.get("query", {})
+        normalized.update((item["from"], item["to"]) for item in query.get("normalized", []))
+        redirects.update((item["from"], item["to"]) for item in query.get("redirects", []))
+        for page in query.get("pages", {}).values():
+            entry = pages.setdefault(page["title"], page)
+            # Long batches come back over several responses, each adding extracts to some pages
+            if "extract" in page:
+                entry["extract"] = page["extract"]
+            if "pageprops" in page:
+                entry["pageprops"] = page["pageprops"]
+        if "continue" not in response:
+            break
+        params.update(response["continue"])
+
+    results = {}
+    for title in titles:
+        target = normalized.get(title, title)
+        target = redirects.get(target, target)
+        page = pages.get(target)
+        if page is None or "missing" in page or "invalid" in page:
+            results[title] = ('missing', None)
+        elif "disambiguation" in page.get("pageprops", {}):
+            results[title] = ('disambiguation', None)
+        elif page.get("extract"):
+            results[title] = ('hit', page["extract"])
+        else:
+            results[title] = ('missing', None)
+    return results
+
+
+def suggest_title(title, session=None, api_url=API_URL):
+    """
+    Return the title Wikipedia's search suggests for title, or None.
+
+    Like wikipedia.page's auto_suggest: the spelling suggestion if there is one,
+    otherwise the top search result.
+    """
+    params = {
+        "action": "query", "format": "json", "list": "search",
+        "srsearch": title, "srlimit": 1, "srinfo": "suggestion", "srprop": "",
+    }
+    query = api_get(params, session, api_url).get("query", {})
+    suggestion = query.get("searchinfo", {}).get("suggestion")
+    results = query.get("search", [])
+    return suggestion or (results[0]["title"] if results else None)
+
+
+class BatchArticleFetcher:
+    """
+    Fetch articles for many titles, MAX_TITLES per request on a pool of threads.
+
+    Each title is looked up once however many tracks ask for it, and with a
+    ResponseCache only titles it doesn't already know are requested. With
+    auto_suggest, titles with no page of their own are retried under the title
+    Wikipedia's search suggests, as wikipedia.page does. Lookups share
+    get_wikipedia_article's cache entries.
+    """
+
+    def __init__(self, workers=4, cache=None, api_url=API_URL, auto_suggest=True):
+        self.workers = workers
+        self.cache = cache
+        self.api_url = api_url
+        self.auto_suggest = auto_suggest
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Music-Bot/1.0 (article ingestion)"
+        self.titles_fetched = 0
+        self.failed_batches = 0
+
+    def fetch_batch(self, titles):
+        """fetch_titles for one batch; a batch that still fails is logged and left out."""
+        try:
+            return fetch_titles(titles, self.session, self.api_url)
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            self.failed_batches += 1
+            print(f"Skipping {len(titles)} titles after failed lookups: {e}")
+            return {}
+
+    def suggest(self, title):
+        try:
+            return suggest_title(title, self.session, self.api_url)
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            print(f"Search for {title!r} failed: {e}")
+            return None
+
+    def lookup(self, pool, titles):
+        results = {}
+        batches = [titles[i:i + MAX_TITLES] for i in range(0, len(titles), MAX_TITLES)]
+        for batch_results in pool.map(self.fetch_batch, batches):
+            results.update(batch_results)
+        return results
+
+    def fetch(self, titles):
+        """
+        Return {title: article or None} for titles in titles.
+
+        Titles whose lookup failed even after retries are left out, so callers can
+        tell them from titles that have no article, and they aren't cached.
+        """
+        titles = list(dict.fromkeys(title for title in titles if title))
+        articles, pending = {}, []
+        for title in titles:
+            cached = self.cache.get('wikipedia.page', title) if self.cache is not None else None
+            if cached is not None:
+                articles[title] = cached[1]
+            else:
+                pending.append(title)
+
+        self.titles_fetched += len(pending)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = self.lookup(pool, pending)
+            if self.auto_suggest:
+                missing = [title for title, (kind, article) in results.items() if kind == 'missing']
+                suggestions = {title: suggestion for title, suggestion in zip(missing, pool.map(self.suggest, missing)) if suggestion and suggestion != title}
+                suggested = self.lookup(pool, list(dict.fromkeys(suggestions.values())))
+                for title, suggestion in suggestions.items():
+                    if suggested.get(suggestion, ('missing', None))[0] != 'missing':
+                        results[title] = suggested[suggestion]
+
+        for title, (kind, article) in results.items():
+            articles[title] = article
+            if self.cache is not None:
+                self.cache.put('wikipedia.page', title, article, ARTICLE_TTL if article else MISSING_TTL, kind)
+        return articles
+
+
+def fetch_song_articles_batched(songs, start_index=0, fetcher=None, chunk_size=1000, conn=None):
+    """
+    Fetch articles for songs[start_index:] with batched title lookups.
+
+    Songs are taken chunk_size at a time and all their titles are looked up together.
+    The songs with no article of their own are then grouped by album id, and each
+    album's article is looked up once for the whole group. With conn (a songs.db
+    connection), album lookups are kept in its albums table, so an album is fetched
+    at most once across the whole corpus and across runs. Yields (index, row) in
+    song order like fetch_song_articles.
+
+    Raises:
+        ArticleLookupError at the first song whose title or album lookup failed after
+        retries. Its row is never yielded, so a caller saving index + 1 as progress
+        stops just before it and looks it up again on the next run.
+    """
+    fetcher = fetcher or BatchArticleFetcher()
+    album_articles = {}
+    for chunk_start in range(start_index, len(songs), chunk_size):
+        chunk = songs[chunk_start:chunk_start + chunk_size]
+        articles = fetcher.fetch(song['name'] for song in chunk)
+
+        # Album id to album name, for the albums this chunk still needs
+        needed = {}
+        for song in chunk:
+            if not articles.get(song['name']) and song['album_name']:
+                needed.setdefault(song['album_id'] or song['album_name'], song['album_name'])
+        if conn is not None:
+            # Albums with no article are looked up again once MISSING_TTL has passed
+            album_articles = load_album_articles(conn, needed, MISSING_TTL)
+        missing = {album_id: name for album_id, name in needed.items() if album_id not in album_articles}
+        fetched = fetcher.fetch(missing.values())
+        # An album whose lookup failed isn't recorded, so it's tried again next time
+        looked_up = [(album_id, name, fetched[name]) for album_id, name in missing.items() if name in fetched]
+        album_articles.update((album_id, article) for album_id, name, article in looked_up)
+        if conn is not None:
+            save_album_articles(conn, looked_up)
+
+        for offset, song in enumerate(chunk):
+            album_key = song['album_id'] or song['album_name']
+            if (song['name'] and song['name'] not in articles) or (album_key in needed and album_key not in album_articles):
+                raise ArticleLookupError(f"Lookups for song {chunk_start + offset} ({song['name']!r}) failed")
+            article = articles.get(song['name']) or album_articles.get(album_key)
+            yield chunk_start + offset, song_row(song, article)